@@ -1,16 +1,22 @@
 "use client";
 
-import { useState, useEffect } from "react";
+import { useState, useEffect, useRef } from "react";
 import { Chat, Message } from "@/components/Chat";
 import { Sidebar, Conversation } from "@/components/Sidebar";
 import { SuggestedQuestions } from "@/components/SuggestedQuestions";
 import { v4 as uuidv4 } from 'uuid'; // Para gerar IDs únicos
 
+// Mensagens recentes enviadas junto com o session_id. O servidor só as usa quando não encontra
+// a sessão (expirada, servidor reiniciado ou outro worker), para não perder o contexto.
+const HISTORY_FALLBACK_MESSAGES = 12;
+
 export default function Home() {
   const [messages, setMessages] = useState<Message[]>([]);
   const [isLoading, setIsLoading] = useState(false);
   const [conversations, setConversations] = useState<Conversation[]>([]);
   const [currentConversationId, setCurrentConversationId] = useState<string | null>(null);
+  // Sessão do servidor de cada conversa: com ela, o histórico não precisa ser reenviado
+  const sessionIds = useRef<Record<string, string>>({});
   
   // Efeito para carregar o histórico do localStorage na inicialização
   useEffect(() => {
@@ -90,9 +96,17 @@ export default function Home() {
       const response = await fetch("/cpe/api/ask", {
         method: "POST",
         headers: { "Content-Type": "application/json" },
-        body: JSON.stringify({ question: question, history: historyForAPI }),
+        body: JSON.stringify({
+          question: question,
+          session_id: sessionIds.current[convId] ?? null,
+          // Os turnos recentes vão sempre: se a sessão existir, o servidor usa o histórico dela
+          history: historyForAPI.slice(-HISTORY_FALLBACK_MESSAGES),
+        }),
       });
 
+      const sessionId = response.headers.get("X-Session-ID");
+      if (sessionId) sessionIds.current[convId] = sessionId;
+
       if (!response.ok) throw new Error("A resposta da rede não foi 'ok'.");
       if (!response.body) throw new Error("A resposta não contém um corpo.");
 
@@ -0,0 +1,119 @@
+import os
+import time
+import asyncio
+import weakref
+
+from metrics import ADMISSION_ACTIVE, ADMISSION_REJECTED, ADMISSION_WAIT_SECONDS, ADMISSION_WAITING
+
+# Controle de admissão do /ask: no máximo ASK_MAX_CONCURRENCY perguntas são respondidas
+# ao mesmo tempo (por worker); as seguintes esperam em uma fila limitada. Com a fila
+# cheia, a resposta é um 429 imediato; se a espera passar de ASK_QUEUE_TIMEOUT, um 503.
+# Assim um pico de acessos vira fila curta e recusas rápidas, não uma avalanche de
+# chamadas ao provedor de LLM.
+ASK_MAX_CONCURRENCY = int(os.getenv("ASK_MAX_CONCURRENCY", "32"))
+ASK_MAX_QUEUE = int(os.getenv("ASK_MAX_QUEUE", "64"))
+ASK_QUEUE_TIMEOUT = float(os.getenv("ASK_QUEUE_TIMEOUT", "10"))
+RETRY_AFTER_SECONDS = int(os.getenv("RETRY_AFTER_SECONDS", "5"))
+
+
+class AdmissionRejected(Exception):
+    """Pergunta recusada pelo controle de admissão, com o status HTTP a ser retornado."""
+
+    def __init__(self, status_code: int, detail: str, retry_after: int = RETRY_AFTER_SECONDS):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = retry_after
+
+
+class AdmissionSlot:
+    """Vaga de uma pergunta admitida. Pode ser liberada mais de uma vez sem efeito."""
+
+    def __init__(self, controller: "AdmissionController", waited: float):
+        self.waited = waited
+        self._controller = controller
+        self._released = False
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self._controller._release()
+
+
+class AdmissionController:
+    """Limite de perguntas simultâneas com fila de espera limitada."""
+
+    def __init__(self, max_concurrency: int = ASK_MAX_CONCURRENCY, max_queue: int = ASK_MAX_QUEUE,
+                 queue_timeout: float = ASK_QUEUE_TIMEOUT):
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_queue = max(0, max_queue)
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self.waiting = 0
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self.stats = {"admitted": 0, "queued": 0, "rejected_queue_full": 0, "rejected_timeout": 0}
+
+    async def acquire(self, wait: bool = False) -> AdmissionSlot:
+        """
+        Aguarda uma vaga. Levanta AdmissionRejected se a fila estiver cheia ou a espera expirar.
+        Com `wait=True` (perguntas de um lote já aceito), espera sem limite de fila nem de tempo.
+        """
+        start = time.perf_counter()
+        if self._semaphore.locked():
+            if not wait and self.waiting >= self.max_queue:
+                self.stats["rejected_queue_full"] += 1
+                ADMISSION_REJECTED.inc(reason="queue_full")
+                raise AdmissionRejected(429, "Muitas perguntas em andamento. Tente novamente em instantes.")
+            self.waiting += 1
+            self.stats["queued"] += 1
+            ADMISSION_WAITING.set(self.waiting)
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), None if wait else self.queue_timeout)
+            except asyncio.TimeoutError:
+                self.stats["rejected_timeout"] += 1
+                ADMISSION_REJECTED.inc(reason="timeout")
+                raise AdmissionRejected(503, "Servidor ocupado. Tente novamente em instantes.")
+            finally:
+                self.waiting -= 1
+                ADMISSION_WAITING.set(self.waiting)
+        else:
+            await self._semaphore.acquire()
+
+        waited = time.perf_counter() - start
+        self.active += 1
+        self.stats["admitted"] += 1
+        ADMISSION_ACTIVE.set(self.active)
+        ADMISSION_WAIT_SECONDS.observe(waited)
+        return AdmissionSlot(self, waited)
+
+    def _release(self):
+        self.active -= 1
+        ADMISSION_ACTIVE.set(self.active)
+        self._semaphore.release()
+
+    def hold(self, slot: AdmissionSlot, events):
+        """
+        Mantém a vaga enquanto a resposta é transmitida e a libera ao final, inclusive se o
+        cliente se desconectar. Um gerador que nunca começou não executa o `finally`: nesse
+        caso a vaga é liberada quando ele é coletado, ou antes pela tarefa de fundo da resposta
+        (`BackgroundTask(slot.release)`), já que liberar de novo não tem efeito.
+        """
+        async def stream():
+            try:
+                async for event in events:
+                    yield event
+            finally:
+                slot.release()
+
+        generator = stream()
+        weakref.finalize(generator, slot.release)
+        return generator
+
+    def get_stats(self) -> dict:
+        return {
+            **self.stats,
+            "active": self.active,
+            "waiting": self.waiting,
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+        }
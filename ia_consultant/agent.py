@@ -1,61 +1,158 @@
 import os
-import random
+import time
+import asyncio
+import threading
 from dotenv import load_dotenv
-from filelock import FileLock
 
-from langchain_community.vectorstores import FAISS
 from langchain_openai import OpenAIEmbeddings
 from langchain_google_genai import GoogleGenerativeAIEmbeddings
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain.chains import create_retrieval_chain
 from langchain.chains.combine_documents import create_stuff_documents_chain
-from langchain.chains import create_history_aware_retriever
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+from langchain_core.output_parsers import StrOutputParser
 from langchain_openai import ChatOpenAI
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_core.messages import HumanMessage, AIMessage
 
+from index_versions import build_index_version, current_version, version_path
+from compact_store import FAISS_INDEX_FILE, load_exact_index, load_vector_store
+from ann_index import serving_index_file
+from embedding_cache import CachedEmbeddings
+from provider_clients import PROVIDER_MAX_RETRIES, PROVIDER_TIMEOUT, http_clients, rate_limiter
+from property_index import PropertyIndex
+from retrieval import CatalogRetriever
+from bm25_index import BM25Index
+from product_names import ProductNameIndex
+from answer_cache import AnswerCache, replay
+from question_rewriter import QuestionRewriter
+from suggestions import SuggestionPool
+from context_packer import count_tokens, pack_context
+from metrics import (
+    ASK_ANSWER_TOKENS, ASK_CONTEXT_DOCUMENTS, ASK_CONTEXT_TOKENS, ASK_REQUESTS, ASK_SLOW_REQUESTS,
+    SLOW_REQUEST_SECONDS, end_request_timings, record_span, span, start_request_timings,
+)
+
 # Carregar variáveis de ambiente do .env
 load_dotenv()
 
 # --- Configuração ---
 VECTOR_STORE_PATH = "faiss_index"
-LOCK_FILE = "faiss_index.lock"
 # O caminho para a pasta de documentos do cliente
 # Estamos usando um caminho relativo que pressupõe uma estrutura de pastas
 # ../ -> sobe um nível (de 'ia_consultant' para a raiz 'MAF')
 # CPE/produtos -> desce para a pasta de dados
 DATA_PATH = "../CPE/produtos" 
+# Intervalo, em segundos, entre as verificações de uma nova versão publicada do índice
+INDEX_WATCH_INTERVAL = float(os.getenv("INDEX_WATCH_INTERVAL", "10"))
+# Perguntas em lote (ask_batch): respostas geradas em paralelo e tamanho máximo do lote
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "8"))
+BATCH_MAX_QUESTIONS = int(os.getenv("BATCH_MAX_QUESTIONS", "1000"))
+
+# Prompt final com diretivas inquebráveis para a IA (pode ser substituído por cliente)
+QA_SYSTEM_PROMPT = """### PERSONA E OBJETIVO:
+Você é MAF, um consultor técnico especialista em compostos plásticos da empresa CPE. Seu único objetivo é analisar as **Fichas Técnicas** fornecidas no `CONTEXTO` para responder às perguntas dos usuários de forma precisa e direta, como um engenheiro faria.
+
+### DIRETIVAS INQUEBRÁVEIS:
+
+1.  **O CONTEXTO É A ÚNICA VERDADE:** Suas respostas devem ser baseadas **exclusivamente** nas Fichas Técnicas do `CONTEXTO`. Cada ficha começa com `--- INÍCIO DA FICHA TÉCNICA` e termina com `--- FIM DA FICHA TÉCNICA ---`. Se a resposta não estiver no `CONTEXTO`, você **DEVE** responder: "Não encontrei essa informação na minha base de dados."
+
+2.  **O NOME DO PRODUTO É SAGRADO:**
+    - Sua principal função é conectar os pedidos dos usuários a **NOMES DE PRODUTOS** específicos. O nome está sempre no campo `PRODUTO:` dentro de cada Ficha Técnica.
+    - Se uma pergunta resultar em múltiplos produtos, liste todos eles, com seus nomes.
+    - Se você encontrar um dado técnico (ex: densidade), mas não conseguir associá-lo a um `PRODUTO:` dentro da mesma Ficha Técnica, você **DEVE** responder: "Encontrei dados que correspondem à sua busca, mas não consegui identificar o nome do produto associado a eles."
+    - **NUNCA, JAMAIS, EM HIPÓTESE ALGUMA,** invente nomes genéricos como "Produto 1", "Composto 2" ou "Produto com Densidade X". Isso é uma falha crítica e inaceitável.
+
+3.  **MEMÓRIA DE CONVERSA E CONCISÃO:**
+    - Use o `chat_history` para entender o contexto de perguntas de acompanhamento. Se o usuário pergunta "e qual a cor dele?", você deve olhar o histórico para saber de qual produto ele está falando e buscar essa informação na ficha técnica correspondente.
+    - Não cumprimente o usuário ("Olá!", "Agradeço pela mensagem") após a primeira interação da conversa. Seja direto e eficiente.
+
+4.  **FORMATAÇÃO:** Use tabelas HTML (`<table border="1">`) para apresentar dados.
+
+### CONTEXTO (FICHAS TÉCNICAS DOS DOCUMENTOS):
+{context}
+
+### RESPOSTA (Siga as Diretivas Inquebráveis à risca):
+"""
+
+def create_llm(provider: str):
+    """
+    Cria o cliente de LLM do provedor informado ('openai' ou 'google'), com o token bucket
+    e o pool de conexões compartilhados do provedor (provider_clients.py).
+    """
+    if provider == "google":
+        print("Usando o Google como provedor de LLM.")
+        return ChatGoogleGenerativeAI(
+            model="gemini-1.5-pro-latest", temperature=0.3, convert_system_message_to_human=True,
+            max_retries=PROVIDER_MAX_RETRIES, timeout=PROVIDER_TIMEOUT, rate_limiter=rate_limiter(provider),
+        )
+    print("Usando OpenAI como provedor de LLM.")
+    http_client, http_async_client = http_clients(provider)
+    return ChatOpenAI(
+        model_name="gpt-4o-mini", temperature=0.3,
+        max_retries=PROVIDER_MAX_RETRIES, request_timeout=PROVIDER_TIMEOUT, rate_limiter=rate_limiter(provider),
+        http_client=http_client, http_async_client=http_async_client,
+    )
+
+def create_embeddings(provider: str):
+    """Cria o cliente de embeddings do provedor informado, envolvido pelo cache em disco."""
+    if provider == "google":
+        print("Usando embeddings do Google.")
+        embeddings = GoogleGenerativeAIEmbeddings(model="models/embedding-001")
+    else:
+        print("Usando embeddings da OpenAI.")
+        http_client, http_async_client = http_clients(provider)
+        embeddings = OpenAIEmbeddings(
+            max_retries=PROVIDER_MAX_RETRIES, request_timeout=PROVIDER_TIMEOUT,
+            http_client=http_client, http_async_client=http_async_client,
+        )
+    # Fichas inalteradas e perguntas repetidas não voltam a chamar o provedor (nem consomem a cota).
+    return CachedEmbeddings(
+        embeddings, provider=provider, model=embeddings.model, rate_limiter=rate_limiter(provider, "embeddings")
+    )
 
 class Agent:
-    def __init__(self):
+    def __init__(self, vector_store_path: str = VECTOR_STORE_PATH, data_path: str = DATA_PATH,
+                 provider: str | None = None, llm=None, embeddings=None, qa_system_prompt: str | None = None,
+                 index_type: str | None = None):
+        """
+        Os parâmetros permitem um Agent por cliente (índice, dados, provedor e prompt próprios).
+        `llm` e `embeddings` podem ser clientes já criados e compartilhados entre vários agentes.
+        `index_type` escolhe o índice de busca das versões que ele construir (veja ann_index.py).
+        """
+        self.vector_store_path = vector_store_path
+        self.index_type = index_type
+        self.data_path = data_path
+        self.provider = (provider or os.getenv("LLM_PROVIDER", "openai")).lower()
+        self.qa_system_prompt = qa_system_prompt or QA_SYSTEM_PROMPT
         self.vector_store = None
-        self.llm = self._get_llm_provider()
-        self.embeddings = self._get_embedding_provider()
-        self.retrieval_chain = self._setup_retrieval_chain()
+        self.property_index = None
+        self.bm25_index = None
+        self.name_index = None
+        self.retriever = None
+        self.rewriter = None
+        self.question_answer_chain = None
+        self.suggestion_pool = None
+        self.index_version = None
+        self.answer_cache = AnswerCache()
+        self._reload_lock = threading.Lock()
+        self._build_thread = None
+        self._watch_thread = None
+        self._watch_stop = threading.Event()
+        self.llm = llm or self._get_llm_provider()
+        self.embeddings = embeddings or self._get_embedding_provider()
+        self._setup_retrieval_chain()
 
     def _get_llm_provider(self):
-        """Carrega o provedor de LLM com base na variável de ambiente."""
-        provider = os.getenv("LLM_PROVIDER", "openai").lower()
-        if provider == "google":
-            print("Usando o Google como provedor de LLM.")
-            return ChatGoogleGenerativeAI(model="gemini-1.5-pro-latest", temperature=0.3, convert_system_message_to_human=True)
-        print("Usando OpenAI como provedor de LLM.")
-        return ChatOpenAI(model_name="gpt-4o-mini", temperature=0.3)
+        """Carrega o provedor de LLM configurado para este agente."""
+        return create_llm(self.provider)
 
     def _get_embedding_provider(self):
-        """Carrega o provedor de embeddings com base na variável de ambiente."""
-        provider = os.getenv("LLM_PROVIDER", "openai").lower()
-        if provider == "google":
-            print("Usando embeddings do Google.")
-            return GoogleGenerativeAIEmbeddings(model="models/embedding-001")
-        print("Usando embeddings da OpenAI.")
-        return OpenAIEmbeddings()
+        """Carrega o provedor de embeddings configurado para este agente."""
+        return create_embeddings(self.provider)
 
     def _setup_retrieval_chain(self):
         """Configura a cadeia de recuperação de informações (RAG) com memória e busca ampla."""
         self._load_or_create_vector_store()
-        retriever = self.vector_store.as_retriever(search_kwargs={'k': 20})
 
         # 1. Prompt para reescrever a pergunta do usuário com base no histórico
         contextualize_q_system_prompt = """Dada uma conversa e uma pergunta de acompanhamento, reformule a pergunta de acompanhamento para ser uma pergunta independente, em seu idioma original.
@@ -76,131 +173,346 @@ Pergunta Independente e Completa:"""
                 ("human", "{input}"),
             ]
         )
-        history_aware_retriever = create_history_aware_retriever(
-            self.llm, retriever, contextualize_q_prompt
-        )
+        # Mesma lógica do create_history_aware_retriever, mas com as etapas separadas para
+        # que a resposta possa ser buscada no cache depois da recuperação das fichas.
+        # O rewriter só chama o LLM quando a pergunta depende do histórico.
+        self.contextualize_chain = contextualize_q_prompt | self.llm | StrOutputParser()
+        self.rewriter = QuestionRewriter(self.contextualize_chain, self.name_index)
 
         # 2. Prompt final com diretivas inquebráveis para a IA
-        qa_system_prompt = """### PERSONA E OBJETIVO:
-Você é MAF, um consultor técnico especialista em compostos plásticos da empresa CPE. Seu único objetivo é analisar as **Fichas Técnicas** fornecidas no `CONTEXTO` para responder às perguntas dos usuários de forma precisa e direta, como um engenheiro faria.
-
-### DIRETIVAS INQUEBRÁVEIS:
-
-1.  **O CONTEXTO É A ÚNICA VERDADE:** Suas respostas devem ser baseadas **exclusivamente** nas Fichas Técnicas do `CONTEXTO`. Cada ficha começa com `--- INÍCIO DA FICHA TÉCNICA` e termina com `--- FIM DA FICHA TÉCNICA ---`. Se a resposta não estiver no `CONTEXTO`, você **DEVE** responder: "Não encontrei essa informação na minha base de dados."
-
-2.  **O NOME DO PRODUTO É SAGRADO:**
-    - Sua principal função é conectar os pedidos dos usuários a **NOMES DE PRODUTOS** específicos. O nome está sempre no campo `PRODUTO:` dentro de cada Ficha Técnica.
-    - Se uma pergunta resultar em múltiplos produtos, liste todos eles, com seus nomes.
-    - Se você encontrar um dado técnico (ex: densidade), mas não conseguir associá-lo a um `PRODUTO:` dentro da mesma Ficha Técnica, você **DEVE** responder: "Encontrei dados que correspondem à sua busca, mas não consegui identificar o nome do produto associado a eles."
-    - **NUNCA, JAMAIS, EM HIPÓTESE ALGUMA,** invente nomes genéricos como "Produto 1", "Composto 2" ou "Produto com Densidade X". Isso é uma falha crítica e inaceitável.
-
-3.  **MEMÓRIA DE CONVERSA E CONCISÃO:**
-    - Use o `chat_history` para entender o contexto de perguntas de acompanhamento. Se o usuário pergunta "e qual a cor dele?", você deve olhar o histórico para saber de qual produto ele está falando e buscar essa informação na ficha técnica correspondente.
-    - Não cumprimente o usuário ("Olá!", "Agradeço pela mensagem") após a primeira interação da conversa. Seja direto e eficiente.
-
-4.  **FORMATAÇÃO:** Use tabelas HTML (`<table border="1">`) para apresentar dados.
-
-### CONTEXTO (FICHAS TÉCNICAS DOS DOCUMENTOS):
-{context}
-
-### RESPOSTA (Siga as Diretivas Inquebráveis à risca):
-"""
         qa_prompt = ChatPromptTemplate.from_messages(
             [
-                ("system", qa_system_prompt),
+                ("system", self.qa_system_prompt),
                 MessagesPlaceholder("chat_history"),
                 ("human", "{input}"),
             ]
         )
         
-        question_answer_chain = create_stuff_documents_chain(self.llm, qa_prompt)
-        
-        return create_retrieval_chain(history_aware_retriever, question_answer_chain)
+        self.question_answer_chain = create_stuff_documents_chain(self.llm, qa_prompt)
 
     def _load_or_create_vector_store(self):
         """
-        Carrega a base de conhecimento. Se não existir, a cria a partir dos documentos.
+        Carrega a versão publicada do índice e passa a observar novas versões.
+        Se nenhuma versão foi publicada ainda, a primeira é construída em segundo plano,
+        sem travar a inicialização do servidor.
+        """
+        if not self.reload_index():
+            print(f"Nenhuma versão publicada em '{self.vector_store_path}'; construindo em segundo plano.")
+            self.build_in_background()
+        self.start_index_watch()
+
+    def sync_vector_store(self, full: bool = False) -> dict:
+        """
+        Constrói e publica uma nova versão do índice (apenas as fichas novas, alteradas ou
+        removidas são processadas) e passa a usá-la. Com `full=True`, reconstrói tudo.
+        """
+        _, summary = build_index_version(
+            self.vector_store_path, self.data_path, self.embeddings, full=full, index_type=self.index_type
+        )
+        self.reload_index()
+        return summary
+
+    def build_in_background(self, full: bool = False):
+        """Dispara a construção do índice em uma thread, se nenhuma estiver em andamento."""
+        if self._build_thread and self._build_thread.is_alive():
+            return
+
+        def build():
+            try:
+                self.sync_vector_store(full=full)
+            except Exception as e:
+                print(f"Erro ao construir a base de conhecimento: {e}")
+
+        self._build_thread = threading.Thread(target=build, daemon=True)
+        self._build_thread.start()
+
+    def reload_index(self) -> bool:
+        """
+        Troca o índice em uso pela versão publicada, se ela mudou. As requisições em
+        andamento continuam com o índice anterior até terminarem.
+        Retorna True se há um índice carregado.
+        """
+        with self._reload_lock:
+            version = current_version(self.vector_store_path)
+            if version is None or version == self.index_version:
+                return self.retriever is not None
+
+            path = version_path(self.vector_store_path, version)
+            # O índice é mapeado em memória (somente leitura) e compartilhado entre os workers
+            vector_store = load_vector_store(path, self.embeddings)
+            if vector_store is None:
+                print(f"Versão '{version}' da base de conhecimento está incompleta; ignorando.")
+                return self.retriever is not None
+            property_index = PropertyIndex.load(path)
+            bm25_index = BM25Index.load(path)
+            # Versões publicadas antes do índice de nomes: ele é montado em memória, a partir das propriedades
+            name_index = ProductNameIndex.load(path)
+            if name_index is None and property_index is not None:
+                name_index = ProductNameIndex.build(property_index.doc_ids, property_index.product_names)
+            retriever = CatalogRetriever(
+                vector_store=vector_store, property_index=property_index, bm25_index=bm25_index, name_index=name_index,
+                exact_index=load_exact_index(path),
+            )
+
+            catalog_changed = self.index_version is not None
+            self.vector_store, self.property_index, self.bm25_index = vector_store, property_index, bm25_index
+            self.name_index = name_index
+            self.retriever = retriever
+            self.index_version = version
+            print(f"Base de conhecimento na versão '{version}' ({vector_store.index.ntotal} documentos).")
+
+        if catalog_changed:
+            # Respostas em cache podem citar fichas que mudaram
+            self.answer_cache.clear()
+        if self.rewriter is not None:
+            self.rewriter.set_name_index(self.name_index)
+        self._refresh_suggestions(catalog_changed)
+        return True
+
+    def start_index_watch(self, interval: float = INDEX_WATCH_INTERVAL):
+        """Verifica periodicamente se uma nova versão do índice foi publicada (interval <= 0 desativa)."""
+        if interval <= 0 or self._watch_thread is not None:
+            return
+
+        def loop():
+            while not self._watch_stop.wait(interval):
+                try:
+                    self.reload_index()
+                except Exception as e:
+                    print(f"Erro ao carregar a nova versão da base de conhecimento: {e}")
+
+        self._watch_thread = threading.Thread(target=loop, daemon=True)
+        self._watch_thread.start()
+
+    @property
+    def is_ready(self) -> bool:
+        """Indica se há uma versão do índice carregada para responder perguntas."""
+        return self.retriever is not None
+
+    def _refresh_suggestions(self, catalog_changed: bool):
+        """Cria o banco de perguntas sugeridas e o regenera em segundo plano quando o catálogo muda."""
+        if self.suggestion_pool is None:
+            self.suggestion_pool = SuggestionPool(self.llm, self.vector_store_path)
+            self.suggestion_pool.start_schedule(lambda: self.vector_store)
+        if catalog_changed or not len(self.suggestion_pool):
+            self.suggestion_pool.refresh_in_background(self.vector_store)
+
+    def close(self):
+        """Libera as tarefas em segundo plano do agente (ex: quando o cliente é descartado da memória)."""
+        self._watch_stop.set()
+        if self.suggestion_pool is not None:
+            self.suggestion_pool.close()
+
+    def memory_usage(self) -> int:
         """
-        lock = FileLock(LOCK_FILE, timeout=600)
-        with lock:
-            if os.path.exists(VECTOR_STORE_PATH):
-                print(f"Carregando base de conhecimento de '{VECTOR_STORE_PATH}'...")
-                self.vector_store = FAISS.load_local(VECTOR_STORE_PATH, self.embeddings, allow_dangerous_deserialization=True)
-            else:
-                print("Nenhuma base de conhecimento encontrada. Criando uma nova...")
-                from data_loader import load_documents
-                
-                documents = load_documents(path=DATA_PATH)
-                
-                # Cada documento (uma ficha inteira) é tratado como uma unidade indivisível.
-                # Isso garante que o nome do produto e seus dados nunca sejam separados.
-                self.vector_store = FAISS.from_documents(documents, self.embeddings)
-                
-                print(f"Salvando nova base de conhecimento em '{VECTOR_STORE_PATH}'...")
-                self.vector_store.save_local(VECTOR_STORE_PATH)
-
-    async def ask(self, question: str, chat_history: list):
+        Estimativa, em bytes, da memória ocupada pelos índices FAISS deste agente (mapeados em
+        memória, ocupam o cache do SO conforme são usados). Os documentos ficam no SQLite, em disco.
+        Com um índice aproximado, o índice exato usado no reordenamento também é contado.
+        """
+        if self.vector_store is None:
+            return 0
+        index_path = version_path(self.vector_store_path, self.index_version)
+        exact_index = self.retriever.exact_index if self.retriever is not None else None
+        try:
+            # O tamanho do arquivo carregado reflete a compressão do índice aproximado, se houver
+            size = os.path.getsize(serving_index_file(index_path, FAISS_INDEX_FILE))
+            if exact_index is not None:
+                size += os.path.getsize(os.path.join(index_path, FAISS_INDEX_FILE))
+            return size
+        except OSError:
+            index = self.vector_store.index
+            exact_size = exact_index.ntotal * exact_index.d * 4 if exact_index is not None else 0
+            return index.ntotal * index.d * 4 + exact_size
+
+    async def ask(self, question: str, chat_history: list, stats: dict | None = None,
+                  conversation_id: str | None = None):
         """
         Faz uma pergunta ao agente e retorna um gerador que transmite a resposta.
         O histórico é uma lista de mensagens HumanMessage e AIMessage.
+        Se `stats` for informado, é preenchido com informações da requisição (ex: caminho da reescrita).
+        `conversation_id` identifica a conversa no memo de reescritas.
         """
-        if not self.retrieval_chain:
+        stats = {} if stats is None else stats
+        if not self.question_answer_chain:
             yield "Erro: A cadeia de recuperação não foi inicializada."
             return
+        # O índice pode ser trocado durante a requisição; esta usa o que estava em vigor ao começar
+        retriever = self.retriever
+        if retriever is None:
+            yield "A base de conhecimento ainda está sendo construída. Tente novamente em instantes."
+            return
         
-        # O LangChain já nos entrega o "delta" em cada chunk.
-        # MODIFICADO: usa 'astream' para compatibilidade com a API assíncrona.
-        async for chunk in self.retrieval_chain.astream(
-            {"input": question, "chat_history": chat_history}
-        ):
-            if 'answer' in chunk:
-                yield chunk['answer']
+        # Duração de cada etapa: vai para /metrics e para stats["timings"] (evento 'done' do streaming)
+        timings = stats.setdefault("timings", {})
+        token = start_request_timings(timings)
+        start = time.perf_counter()
+        try:
+            # 1. Reescreve a pergunta com base no histórico, quando ela depende dele
+            with span("rewrite"):
+                standalone_question, stats["rewrite_path"] = await self.rewriter.rewrite(
+                    question, chat_history, conversation_id
+                )
+            print(f"Reescrita da pergunta: caminho '{stats['rewrite_path']}'.")
 
-    def get_suggested_questions(self):
-        """Gera perguntas sugeridas com base em documentos aleatórios."""
-        if not self.vector_store:
-            return []
+            # 2. Recupera as fichas técnicas relevantes (embedding e buscas têm spans próprios)
+            with span("retrieval"):
+                documents = await retriever.ainvoke(standalone_question)
+
+            # 3. Perguntas repetidas sobre as mesmas fichas reaproveitam a resposta já gerada
+            cache_key = self.answer_cache.make_key(standalone_question, documents)
+            cached_answer = self.answer_cache.get(cache_key)
+            stats["answer_cache_hit"] = cached_answer is not None
+            if cached_answer is not None:
+                for chunk in replay(cached_answer):
+                    yield chunk
+                return
+
+            # 4. Limita o CONTEXTO ao orçamento de tokens (fichas repetidas, reduzidas ou descartadas)
+            with span("pack_context"):
+                documents, stats["context"] = pack_context(standalone_question, documents)
+            ASK_CONTEXT_TOKENS.observe(stats["context"]["tokens_after"])
+            ASK_CONTEXT_DOCUMENTS.observe(len(documents))
+            print(
+                f"Contexto: {len(documents)} fichas, {stats['context']['tokens_after']} tokens "
+                f"({stats['context']['tokens_saved']} economizados)."
+            )
+
+            # 5. Gera a resposta em streaming. O LangChain já nos entrega o "delta" em cada chunk.
+            answer_parts = []
+            generation_start = time.perf_counter()
+            async for chunk in self.question_answer_chain.astream(
+                {"input": question, "chat_history": chat_history, "context": documents}
+            ):
+                if not answer_parts:
+                    record_span("first_token", time.perf_counter() - start)
+                answer_parts.append(chunk)
+                yield chunk
+            record_span("generation", time.perf_counter() - generation_start)
+
+            # Só chega aqui se o streaming terminou por completo (respostas interrompidas não entram no cache)
+            answer = "".join(answer_parts)
+            stats["answer_tokens"] = count_tokens(answer)
+            ASK_ANSWER_TOKENS.observe(stats["answer_tokens"])
+            self.answer_cache.put(cache_key, answer)
+        finally:
+            total = time.perf_counter() - start
+            record_span("total", total)
+            end_request_timings(token)
+            ASK_REQUESTS.inc(
+                rewrite_path=stats.get("rewrite_path"),
+                answer_cache="hit" if stats.get("answer_cache_hit") else "miss",
+            )
+            if total > SLOW_REQUEST_SECONDS:
+                ASK_SLOW_REQUESTS.inc()
+                print(f"Requisição lenta ({total:.2f}s) para a pergunta '{question[:80]}': etapas {timings}.")
+
+    async def ask_batch(self, questions: list[str], max_concurrency: int = BATCH_MAX_CONCURRENCY,
+                        admission=None):
+        """
+        Responde uma lista de perguntas independentes (sem histórico). As fichas de todas as
+        perguntas são recuperadas de uma vez (embeddings em lote e uma única busca matricial
+        no FAISS) e as respostas são geradas em paralelo, até `max_concurrency` por vez.
+        Com um `admission` (AdmissionController), cada geração ocupa uma vaga própria, como
+        uma pergunta do /ask; o lote já foi aceito, então as perguntas esperam pela vaga
+        em vez de serem recusadas.
+        Gera um dicionário por pergunta ({"index", "question", "answer" ou "error", "stats"}),
+        na ordem em que as respostas ficam prontas.
+        """
+        retriever = self.retriever
+        if not self.question_answer_chain or retriever is None:
+            for index, question in enumerate(questions):
+                yield {"index": index, "question": question, "error": "A base de conhecimento ainda está sendo construída."}
+            return
 
+        with span("batch_retrieval"):
+            all_documents = await asyncio.to_thread(retriever.batch_search, questions)
+        semaphore = asyncio.Semaphore(max(1, max_concurrency))
+
+        async def answer(index: int, question: str, documents: list) -> dict:
+            stats = {}
+            async with semaphore:
+                start = time.perf_counter()
+                slot = None
+                try:
+                    if admission is not None:
+                        slot = await admission.acquire(wait=True)
+                        stats["queue_seconds"] = round(slot.waited, 4)
+                    cache_key = self.answer_cache.make_key(question, documents)
+                    answer = self.answer_cache.get(cache_key)
+                    stats["answer_cache_hit"] = answer is not None
+                    if answer is None:
+                        documents, stats["context"] = pack_context(question, documents)
+                        ASK_CONTEXT_TOKENS.observe(stats["context"]["tokens_after"])
+                        ASK_CONTEXT_DOCUMENTS.observe(len(documents))
+                        answer = await self.question_answer_chain.ainvoke(
+                            {"input": question, "chat_history": [], "context": documents}
+                        )
+                        stats["answer_tokens"] = count_tokens(answer)
+                        ASK_ANSWER_TOKENS.observe(stats["answer_tokens"])
+                        self.answer_cache.put(cache_key, answer)
+                    result = {"index": index, "question": question, "answer": answer}
+                except Exception as e:
+                    print(f"Erro ao responder a pergunta {index} do lote: {e}")
+                    result = {"index": index, "question": question, "error": str(e)}
+                finally:
+                    if slot is not None:
+                        slot.release()
+                seconds = time.perf_counter() - start
+                record_span("batch_answer", seconds)
+                stats["seconds"] = round(seconds, 4)
+                result["stats"] = stats
+                return result
+
+        tasks = [
+            asyncio.create_task(answer(index, question, documents))
+            for index, (question, documents) in enumerate(zip(questions, all_documents))
+        ]
         try:
-            # Pega 3 documentos aleatórios da base de dados.
-            # O FAISS não tem um método "sample", então usamos uma pequena busca com k=10
-            # e pegamos uma amostra aleatória dos resultados.
-            retriever = self.vector_store.as_retriever(search_kwargs={'k': 10})
-            all_docs = retriever.get_relevant_documents("compostos plásticos")
-            
-            sample_size = min(3, len(all_docs))
-            if sample_size == 0: return []
-            sampled_docs = random.sample(all_docs, sample_size)
-
-            # Template do prompt para gerar perguntas
-            suggestion_template = """
-            Com base no trecho de documento abaixo, gere UMA única pergunta curta e direta que um cliente poderia fazer sobre o assunto.
-            Retorne apenas a pergunta, sem saudações ou texto adicional.
-
-            Documento:
-            {context}
-
-            Pergunta Sugerida:
-            """
-            suggestion_prompt = ChatPromptTemplate.from_template(suggestion_template)
-            suggestion_chain = create_stuff_documents_chain(self.llm, suggestion_prompt)
-            
-            suggestions = []
-            for doc in sampled_docs:
-                response = suggestion_chain.invoke({"context": [doc]}) # Passa um único doc por vez
-                if response:
-                    suggestions.append(response.strip())
-            
-            return suggestions
-
-        except Exception as e:
-            print(f"Erro ao gerar perguntas sugeridas: {e}")
+            for finished in asyncio.as_completed(tasks):
+                yield await finished
+        finally:
+            # Se o cliente desistir do lote, as gerações pendentes são canceladas
+            for task in tasks:
+                task.cancel()
+
+    def get_suggested_questions(self):
+        """Sorteia perguntas sugeridas do banco pré-gerado (sem chamar o LLM)."""
+        if not self.suggestion_pool:
             return []
+        return self.suggestion_pool.sample(3)
 
 if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Agente MAF")
+    parser.add_argument("--sync", action="store_true", help="Constrói e publica uma nova versão da base de conhecimento e sai.")
+    parser.add_argument("--full", action="store_true", help="Com --sync, reconstrói o índice do zero.")
+    parser.add_argument("--batch", metavar="ARQUIVO", help="Responde as perguntas do arquivo (uma por linha) e imprime NDJSON.")
+    args = parser.parse_args()
+
+    if args.sync:
+        # Equivalente a 'python build_index.py' para o cliente padrão
+        provider = os.getenv("LLM_PROVIDER", "openai").lower()
+        build_index_version(VECTOR_STORE_PATH, DATA_PATH, create_embeddings(provider), full=args.full)
+        raise SystemExit(0)
+
     # Exemplo de como usar a classe Agent
     maf_agent = Agent()
-    
+
+    if args.batch:
+        import json
+
+        with open(args.batch, 'r', encoding='utf-8') as f:
+            batch_questions = [line.strip() for line in f if line.strip()]
+
+        async def run_batch():
+            async for result in maf_agent.ask_batch(batch_questions):
+                print(json.dumps(result, ensure_ascii=False), flush=True)
+
+        asyncio.run(run_batch())
+        maf_agent.close()
+        raise SystemExit(0)
+
     # Simula um histórico para teste local
     chat_history_test = []
 
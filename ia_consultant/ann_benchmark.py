@@ -0,0 +1,177 @@
+import os
+import json
+import time
+import argparse
+
+import faiss
+import numpy as np
+
+from ann_index import (
+    HNSW_EF_SEARCH, HNSW_M, INDEX_TYPES, IVF_NPROBE, IVF_REFINE_FACTOR, PQ_BITS, PQ_M, build_ann_index,
+    configure_search, refine_search,
+)
+from benchmark import latency_summary
+from compact_store import FAISS_INDEX_FILE
+from index_versions import current_version, version_path
+
+# Compara os tipos de índice de busca (flat, HNSW, IVF-PQ) com os mesmos vetores: recall@k
+# em relação à busca exata, latência por pergunta, vazão em lote, tamanho e tempo de
+# construção. Os vetores vêm de uma base publicada ou são sintéticos (agrupados, como os
+# embeddings de um catálogo). As perguntas são vetores separados da base antes da construção.
+#
+#   python ann_benchmark.py --vectors 200000 --dim 768
+#   python ann_benchmark.py --index-path faiss_index --ef-search 16,64,128 --nprobe 4,16,64 --refine 1,4
+
+
+def synthetic_vectors(count: int, dimension: int, clusters: int, seed: int) -> np.ndarray:
+    """Vetores normalizados em torno de `clusters` centros, como embeddings de fichas parecidas."""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dimension)).astype(np.float32)
+    vectors = centers[rng.integers(0, clusters, count)] + 0.35 * rng.standard_normal((count, dimension)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def published_vectors(index_path: str) -> np.ndarray:
+    """Vetores do índice exato da versão publicada (ou de um índice antigo, fora de versões)."""
+    version = current_version(index_path)
+    path = version_path(index_path, version) if version else index_path
+    index = faiss.read_index(os.path.join(path, FAISS_INDEX_FILE))
+    return index.reconstruct_n(0, index.ntotal)
+
+
+def recall_at_k(found: np.ndarray, exact: np.ndarray, k: int) -> float:
+    hits = sum(len(set(row[:k]) & set(truth[:k]) - {-1}) for row, truth in zip(found, exact))
+    return hits / (len(exact) * k)
+
+
+def index_size(index: faiss.Index) -> int:
+    return len(faiss.serialize_index(index))
+
+
+def measure(search, queries: np.ndarray, exact: np.ndarray, k: int) -> dict:
+    """Recall@k, latência de perguntas isoladas e vazão de uma busca em lote (`search(vetores, k)`)."""
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        search(query[None, :], k)
+        latencies.append(time.perf_counter() - start)
+    start = time.perf_counter()
+    _, found = search(queries, k)
+    batch_seconds = time.perf_counter() - start
+    return {
+        "recall_at_k": round(recall_at_k(found, exact, k), 4),
+        "latency_ms": latency_summary(latencies),
+        "batch_queries_per_s": round(len(queries) / batch_seconds, 1) if batch_seconds else None,
+    }
+
+
+def _int_list(text: str) -> list[int]:
+    return [int(value) for value in text.split(",") if value.strip()]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Recall e latência dos tipos de índice de busca (flat, HNSW, IVF-PQ).")
+    parser.add_argument("--index-path", help="Usa os vetores da base publicada nesta pasta em vez de vetores sintéticos.")
+    parser.add_argument("--vectors", type=int, default=100000, help="Vetores sintéticos na base.")
+    parser.add_argument("--dim", type=int, default=256, help="Dimensão dos vetores sintéticos.")
+    parser.add_argument("--clusters", type=int, default=200, help="Grupos de vetores sintéticos.")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--types", default=",".join(INDEX_TYPES), help="Tipos a comparar, separados por vírgula.")
+    parser.add_argument("--hnsw-m", type=int, default=HNSW_M)
+    parser.add_argument("--ef-search", default=str(HNSW_EF_SEARCH), help="Valores de efSearch do HNSW (ex: 16,64,128).")
+    parser.add_argument("--nprobe", default=str(IVF_NPROBE), help="Valores de nprobe do IVF-PQ (ex: 4,16,64).")
+    parser.add_argument("--refine", default=f"1,{IVF_REFINE_FACTOR}",
+                        help="Fatores de reordenação exata do IVF-PQ (1: sem reordenação).")
+    parser.add_argument("--pq-m", type=int, default=PQ_M, help="Subquantizadores do PQ (0: automático).")
+    parser.add_argument("--pq-bits", type=int, default=PQ_BITS)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Arquivo JSON com os resultados (padrão: benchmark_results/ann-<data>.json).")
+    args = parser.parse_args(argv)
+
+    types = [t.strip().lower() for t in args.types.split(",") if t.strip()]
+    unknown = set(types) - set(INDEX_TYPES)
+    if unknown:
+        parser.error(f"tipos desconhecidos: {', '.join(sorted(unknown))}")
+
+    if args.index_path:
+        vectors = published_vectors(args.index_path)
+        print(f"{len(vectors)} vetores de dimensão {vectors.shape[1]} lidos de '{args.index_path}'.")
+    else:
+        vectors = synthetic_vectors(args.vectors + args.queries, args.dim, args.clusters, args.seed)
+        print(f"{args.vectors} vetores sintéticos de dimensão {args.dim}.")
+    rng = np.random.default_rng(args.seed)
+    order = rng.permutation(len(vectors))
+    query_count = min(args.queries, len(vectors) // 10 or 1)
+    queries = np.ascontiguousarray(vectors[order[:query_count]])
+    base = np.ascontiguousarray(vectors[order[query_count:]])
+    k = min(args.k, len(base))
+
+    # Resposta exata (flat) usada como referência do recall
+    exact_index = faiss.IndexFlatL2(base.shape[1])
+    exact_index.add(base)
+    _, exact = exact_index.search(queries, k)
+
+    results = []
+    for index_type in types:
+        start = time.perf_counter()
+        index = build_ann_index(base, index_type, hnsw_m=args.hnsw_m, pq_m=args.pq_m, pq_bits=args.pq_bits, seed=args.seed)
+        build_seconds = time.perf_counter() - start
+        if index is None:
+            continue
+        size = index_size(index)
+        settings = (
+            [{"efSearch": value} for value in _int_list(args.ef_search)] if index_type == "hnsw"
+            else [{"nprobe": nprobe, "refine": refine} for nprobe in _int_list(args.nprobe)
+                  for refine in _int_list(args.refine)] if index_type == "ivfpq"
+            else [{}]
+        )
+        for setting in settings:
+            if "efSearch" in setting:
+                configure_search(index, ef_search=setting["efSearch"])
+            elif "nprobe" in setting:
+                configure_search(index, nprobe=setting["nprobe"])
+            refine = setting.get("refine", 1)
+
+            def search(vectors, count):
+                return refine_search(index, exact_index, vectors, count, refine)
+
+            # Com reordenamento, o índice exato também fica em memória ao lado do aproximado
+            refine_size = size + (index_size(exact_index) if refine > 1 else 0)
+
+            result = {
+                "type": index_type,
+                **setting,
+                **measure(search, queries, exact, k),
+                "build_seconds": round(build_seconds, 3),
+                "size_bytes": size,
+                "bytes_per_vector": round(size / len(base), 1),
+                "size_with_refine_bytes": refine_size,
+                "bytes_per_vector_with_refine": round(refine_size / len(base), 1),
+            }
+            results.append(result)
+            label = " ".join([index_type] + [f"{name}={value}" for name, value in setting.items()])
+            refine_label = (f"com reordenamento {refine_size / 2**20:.1f}MB "
+                            f"({result['bytes_per_vector_with_refine']} B/vetor)  " if refine > 1 else "")
+            print(
+                f"  {label:<22} recall@{k} {result['recall_at_k']:.3f}  p50 {result['latency_ms']['p50']:.3f}ms  "
+                f"p95 {result['latency_ms']['p95']:.3f}ms  lote {result['batch_queries_per_s']}/s  "
+                f"{size / 2**20:.1f}MB ({result['bytes_per_vector']} B/vetor)  {refine_label}"
+                f"construção {build_seconds:.1f}s"
+            )
+
+    report = {
+        "meta": {"timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"), "vectors": len(base), "dimension": base.shape[1],
+                 "queries": len(queries), "k": k},
+        "params": {key: value for key, value in vars(args).items() if key != "output"},
+        "results": results,
+    }
+    output = args.output or os.path.join("benchmark_results", time.strftime("ann-%Y%m%d-%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"\nResultados salvos em '{output}'.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+import os
+import math
+
+import faiss
+import numpy as np
+
+# Tipo do índice usado para responder às buscas. O índice exato ('flat', em 'index.faiss')
+# continua sendo a base das atualizações incrementais; com 'hnsw' ou 'ivfpq', a construção
+# gera também um índice aproximado em 'serving.faiss', treinado com os mesmos vetores e na
+# mesma ordem, que os servidores carregam no lugar do exato.
+#   flat  - busca exata; custo e memória crescem com o catálogo e a dimensão
+#   hnsw  - grafo navegável; buscas rápidas, memória um pouco maior que a do flat
+#   ivfpq - listas invertidas com quantização por produto; vetores comprimidos (~16x com os padrões).
+#           As distâncias do PQ são aproximadas: sozinho, o recall fica limitado pela quantização
+#           mesmo com nprobe alto. Por isso os candidatos (IVF_REFINE_FACTOR * k) são reordenados
+#           pela distância exata, com os vetores do índice exato (veja refine_search).
+# Use ann_benchmark.py para medir recall e latência de cada tipo antes de trocar.
+INDEX_TYPES = ("flat", "hnsw", "ivfpq")
+INDEX_TYPE = os.getenv("INDEX_TYPE", "flat").lower()
+SERVING_INDEX_FILE = "serving.faiss"
+
+HNSW_M = int(os.getenv("HNSW_M", "32"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("HNSW_EF_CONSTRUCTION", "80"))
+HNSW_EF_SEARCH = int(os.getenv("HNSW_EF_SEARCH", "64"))
+# 0 escolhe automaticamente: ~4*sqrt(n) listas e um subquantizador a cada 4 dimensões
+IVF_NLIST = int(os.getenv("IVF_NLIST", "0"))
+IVF_NPROBE = int(os.getenv("IVF_NPROBE", "16"))
+PQ_M = int(os.getenv("PQ_M", "0"))
+PQ_BITS = int(os.getenv("PQ_BITS", "8"))
+# Vetores usados no treino do IVF-PQ (amostra aleatória quando o catálogo é maior)
+IVF_TRAIN_SIZE = int(os.getenv("IVF_TRAIN_SIZE", "100000"))
+# Candidatos do IVF-PQ reordenados pela distância exata, por resultado pedido (1 desativa)
+IVF_REFINE_FACTOR = int(os.getenv("IVF_REFINE_FACTOR", "4"))
+
+
+def check_index_type(index_type: str) -> str:
+    index_type = (index_type or INDEX_TYPE).lower()
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Tipo de índice '{index_type}' desconhecido. Use um de: {', '.join(INDEX_TYPES)}.")
+    return index_type
+
+
+def _pq_subquantizers(dimension: int) -> int:
+    """Maior divisor da dimensão que não passa de dimensão/4 (ex: 1536 -> 384, 16x menor que o flat)."""
+    for m in range(max(1, dimension // 4), 0, -1):
+        if dimension % m == 0:
+            return m
+    return 1
+
+
+def build_ann_index(vectors: np.ndarray, index_type: str, hnsw_m: int = HNSW_M,
+                    ef_construction: int = HNSW_EF_CONSTRUCTION, nlist: int = IVF_NLIST,
+                    pq_m: int = PQ_M, pq_bits: int = PQ_BITS, seed: int = 0) -> faiss.Index | None:
+    """
+    Constrói (e treina, se for o caso) um índice do tipo informado com os vetores, na mesma
+    ordem. Retorna None quando não há vetores suficientes para treinar o IVF-PQ.
+    """
+    index_type = check_index_type(index_type)
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    count, dimension = vectors.shape
+
+    if index_type == "flat":
+        index = faiss.IndexFlatL2(dimension)
+    elif index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dimension, hnsw_m)
+        index.hnsw.efConstruction = ef_construction
+    else:
+        # O k-means do PQ precisa de ao menos 2^bits vetores
+        if count < 2 ** pq_bits:
+            print(f"Apenas {count} vetores: poucos para treinar o IVF-PQ ({2 ** pq_bits} no mínimo).")
+            return None
+        nlist = nlist or int(4 * math.sqrt(count))
+        nlist = max(1, min(nlist, count // 39 or 1))
+        pq_m = pq_m or _pq_subquantizers(dimension)
+        index = faiss.IndexIVFPQ(faiss.IndexFlatL2(dimension), dimension, nlist, pq_m, pq_bits)
+        rng = np.random.default_rng(seed)
+        sample = vectors if count <= IVF_TRAIN_SIZE else vectors[rng.choice(count, IVF_TRAIN_SIZE, replace=False)]
+        index.train(sample)
+
+    index.add(vectors)
+    return index
+
+
+def configure_search(index: faiss.Index, ef_search: int = HNSW_EF_SEARCH, nprobe: int = IVF_NPROBE):
+    """Ajusta os parâmetros de busca do índice aproximado (efSearch do HNSW, nprobe do IVF)."""
+    params = faiss.ParameterSpace()
+    if isinstance(index, faiss.IndexHNSW):
+        params.set_index_parameter(index, "efSearch", ef_search)
+    elif faiss.try_extract_index_ivf(index) is not None:
+        params.set_index_parameter(index, "nprobe", nprobe)
+
+
+def refine_search(index: faiss.Index, exact_index: faiss.Index | None, queries: np.ndarray, k: int,
+                  refine_factor: int = IVF_REFINE_FACTOR) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Busca no índice de busca e, se ele for um IVF-PQ, reordena os `k * refine_factor` candidatos
+    pela distância exata, com os vetores do índice exato (mesmas posições). Os demais tipos já
+    comparam os vetores completos e são buscados direto. Retorna (distâncias, posições), como o search.
+    """
+    queries = np.ascontiguousarray(queries, dtype=np.float32)
+    if exact_index is None or refine_factor <= 1 or faiss.try_extract_index_ivf(index) is None:
+        return index.search(queries, k)
+
+    _, candidates = index.search(queries, k * refine_factor)
+    distances = np.full((len(queries), k), np.inf, dtype=np.float32)
+    positions = np.full((len(queries), k), -1, dtype=np.int64)
+    for i, row in enumerate(candidates):
+        row = row[row >= 0]
+        if not len(row):
+            continue
+        exact = ((exact_index.reconstruct_batch(row) - queries[i]) ** 2).sum(axis=1)
+        order = np.argsort(exact, kind="stable")[:k]
+        distances[i, :len(order)] = exact[order]
+        positions[i, :len(order)] = row[order]
+    return distances, positions
+
+
+def write_serving_index(flat_index: faiss.Index, index_path: str, index_type: str = INDEX_TYPE) -> str:
+    """
+    Grava o índice de busca a partir dos vetores do índice exato. Retorna o tipo gravado:
+    com 'flat' (ou vetores insuficientes para o tipo pedido), o índice exato é usado direto.
+    """
+    index_type = check_index_type(index_type)
+    serving_file = os.path.join(index_path, SERVING_INDEX_FILE)
+    index = None
+    if index_type != "flat" and flat_index.ntotal:
+        vectors = flat_index.reconstruct_n(0, flat_index.ntotal)
+        index = build_ann_index(vectors, index_type)
+    if index is None:
+        if os.path.exists(serving_file):
+            os.remove(serving_file)
+        return "flat"
+
+    faiss.write_index(index, serving_file + ".tmp")
+    os.replace(serving_file + ".tmp", serving_file)
+    print(f"Índice de busca '{index_type}' gravado ({index.ntotal} vetores).")
+    return index_type
+
+
+def serving_index_file(index_path: str, default_file: str) -> str:
+    """Arquivo do índice a ser carregado para as buscas: o aproximado, se houver, ou o exato."""
+    serving_file = os.path.join(index_path, SERVING_INDEX_FILE)
+    return serving_file if os.path.exists(serving_file) else os.path.join(index_path, default_file)
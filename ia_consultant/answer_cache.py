@@ -0,0 +1,70 @@
+import os
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+from property_index import normalize_text
+
+# Cache de respostas do /ask, em memória, com expiração (TTL) e descarte LRU.
+# A chave é a pergunta independente normalizada mais os IDs das fichas recuperadas,
+# então a mesma pergunta sobre um catálogo diferente nunca reaproveita a resposta.
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "3600"))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "1000"))
+REPLAY_CHUNK_SIZE = 64
+
+
+def document_id(doc) -> str:
+    """ID estável de um documento recuperado (ID do docstore ou, na falta dele, a origem)."""
+    return getattr(doc, "id", None) or doc.metadata.get("source", "")
+
+
+class AnswerCache:
+    """Cache LRU com TTL das respostas geradas pelo agente."""
+
+    def __init__(self, ttl: float = ANSWER_CACHE_TTL, max_entries: int = ANSWER_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(question: str, documents: list) -> str:
+        ids = "\n".join(document_id(doc) for doc in documents)
+        return hashlib.sha256(f"{normalize_text(question)}\n{ids}".encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> str | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                self._entries.pop(key, None)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: str, answer: str):
+        if self.max_entries <= 0 or not answer:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, answer)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """Descarta todas as respostas (ex: quando a base de conhecimento muda)."""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+def replay(answer: str, chunk_size: int = REPLAY_CHUNK_SIZE):
+    """Divide uma resposta em cache em pedaços, para ser transmitida como um streaming normal."""
+    for start in range(0, len(answer), chunk_size):
+        yield answer[start:start + chunk_size]
@@ -0,0 +1,460 @@
+import os
+import io
+import sys
+import json
+import time
+import random
+import shutil
+import asyncio
+import zipfile
+import argparse
+import platform
+import tempfile
+import contextlib
+import subprocess
+from xml.sax.saxutils import escape
+
+import numpy as np
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+from data_loader import list_source_files, load_file, load_documents, parse_product_docx
+from index_versions import build_index_version
+from answer_cache import AnswerCache
+from agent import Agent
+
+# Benchmark offline do pipeline completo (tradução das fichas, construção do índice,
+# recuperação e /ask com streaming), sem chaves de API: o LLM e os embeddings são
+# substituídos por versões falsas e determinísticas, e o catálogo é sintético.
+#
+#   python benchmark.py --products 2000 --output resultados.json
+#   python benchmark.py --products 2000 --baseline resultados.json   # compara com uma execução anterior
+
+FAMILIES = ["PP", "PE", "PEAD", "PA6", "PA66", "ABS", "PC", "POM", "PBT", "TPE"]
+COLORS = ["Natural", "Preto", "Branco", "Cinza", "Azul", "Vermelho", "Verde", "Amarelo"]
+# (categoria no JSON, propriedade, método, unidade, faixa de valores, casas decimais)
+PROPERTIES = [
+    ("Fisicas", "Densidade", "ASTM D792", "g/cm³", (0.88, 1.45), 2),
+    ("Fisicas", "Índice de Fluidez", "ASTM D1238", "g/10min", (1, 60), 0),
+    ("Fisicas", "Teor de Carga", "ISO 3451", "%", (0, 40), 0),
+    ("Mecanicas", "Resistência à Tração", "ASTM D638", "MPa", (15, 90), 0),
+    ("Mecanicas", "Alongamento na Ruptura", "ASTM D638", "%", (2, 600), 0),
+    ("Mecanicas", "Módulo de Flexão", "ASTM D790", "MPa", (500, 9000), 0),
+    ("Mecanicas", "Resistência ao Impacto Izod", "ASTM D256", "J/m", (20, 800), 0),
+    ("Termicas", "Temperatura de Deflexão Térmica", "ASTM D648", "°C", (50, 220), 0),
+    ("Termicas", "Temperatura Vicat", "ASTM D1525", "°C", (60, 230), 0),
+]
+
+FAKE_ANSWER = (
+    "<table border=\"1\"><tr><th>Produto</th><th>Densidade</th></tr>"
+    "<tr><td>CPE PP 101</td><td>1,04 g/cm³</td></tr></table>\n"
+    "O produto acima atende ao critério solicitado, conforme a Ficha Técnica."
+)
+
+
+class BenchmarkEmbeddings(DeterministicFakeEmbedding):
+    """Embeddings determinísticos com latência simulada do provedor, por chamada."""
+
+    latency: float = 0.0
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        if self.latency:
+            time.sleep(self.latency)
+        return super().embed_documents(texts)
+
+    def embed_query(self, text: str) -> list[float]:
+        if self.latency:
+            time.sleep(self.latency)
+        return super().embed_query(text)
+
+
+# --- Catálogo sintético ---
+
+def _format_value(value: float, decimals: int, unit: str) -> str:
+    return f"{value:.{decimals}f}".replace(".", ",") + f" {unit}"
+
+
+def _product(rng: random.Random, index: int) -> dict:
+    name = f"CPE {FAMILIES[index % len(FAMILIES)]} {1000 + index}"
+    properties = []
+    for category, prop, method, unit, (low, high), decimals in PROPERTIES:
+        properties.append((category, prop, method, unit, _format_value(rng.uniform(low, high), decimals, unit)))
+    return {"name": name, "color": rng.choice(COLORS), "properties": properties}
+
+
+def _write_json(path: str, product: dict):
+    data = {"Produto": product["name"], "Cor": product["color"], "Propriedades": {}}
+    for category, prop, _, _, value in product["properties"]:
+        data["Propriedades"].setdefault(category, []).append({"Propriedade": prop, "Valor": value})
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+
+
+_DOCX_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/word/document.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>'
+    '</Types>'
+)
+_DOCX_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="word/document.xml"/></Relationships>'
+)
+
+
+def _docx_paragraph(text: str) -> str:
+    return f'<w:p><w:r><w:t xml:space="preserve">{escape(text)}</w:t></w:r></w:p>'
+
+
+def _write_docx(path: str, product: dict):
+    """Grava uma Ficha Técnica DOCX mínima: cabeçalho 'Produto:'/'Cor:' e tabela de propriedades."""
+    rows = [["Propriedades", "Método", "Unidade", "Valores Típicos"]]
+    rows += [[prop, method, unit, value] for _, prop, method, unit, value in product["properties"]]
+    table = "<w:tbl>" + "".join(
+        "<w:tr>" + "".join(f"<w:tc>{_docx_paragraph(cell)}</w:tc>" for cell in row) + "</w:tr>"
+        for row in rows
+    ) + "</w:tbl>"
+    body = (
+        _docx_paragraph("FICHA TÉCNICA")
+        + _docx_paragraph(f"Produto: {product['name']}")
+        + _docx_paragraph(f"Cor: {product['color']}")
+        + table
+    )
+    document = (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">'
+        f'<w:body>{body}</w:body></w:document>'
+    )
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as docx:
+        docx.writestr('[Content_Types].xml', _DOCX_CONTENT_TYPES)
+        docx.writestr('_rels/.rels', _DOCX_RELS)
+        docx.writestr('word/document.xml', document)
+
+
+def generate_catalog(path: str, products: int, docx_ratio: float = 0.3, seed: int = 0) -> list[str]:
+    """
+    Gera um catálogo sintético no layout esperado pelo data_loader ('json/' e 'DTS/').
+    Retorna os nomes dos produtos gerados.
+    """
+    rng = random.Random(seed)
+    os.makedirs(os.path.join(path, "json"), exist_ok=True)
+    os.makedirs(os.path.join(path, "DTS"), exist_ok=True)
+    names = []
+    for index in range(products):
+        product = _product(rng, index)
+        file_name = f"produto_{index:06d}"
+        if rng.random() < docx_ratio:
+            _write_docx(os.path.join(path, "DTS", file_name + ".docx"), product)
+        else:
+            _write_json(os.path.join(path, "json", file_name + ".json"), product)
+        names.append(product["name"])
+    return names
+
+
+def generate_questions(names: list[str], count: int, seed: int = 0) -> list[str]:
+    """Perguntas variadas sobre o catálogo: por nome, por propriedade e com filtros numéricos."""
+    rng = random.Random(seed)
+    templates = [
+        lambda: f"Qual a densidade do {rng.choice(names)}?",
+        lambda: f"Qual a cor do {rng.choice(names)}?",
+        lambda: f"Qual a resistência à tração do {rng.choice(names)}?",
+        lambda: f"Compare o índice de fluidez do {rng.choice(names)} e do {rng.choice(names)}.",
+        lambda: f"Quais produtos têm densidade acima de {rng.uniform(0.9, 1.4):.2f} g/cm³?".replace(".", ","),
+        lambda: f"Quero um composto de {rng.choice(FAMILIES)} com boa resistência ao impacto.",
+        lambda: "Quais materiais suportam temperaturas acima de 150 °C?",
+    ]
+    return [rng.choice(templates)() for _ in range(count)]
+
+
+# --- Medições ---
+
+def _rss_mb() -> float:
+    """Memória residente atual do processo, em MB."""
+    try:
+        with open("/proc/self/statm", 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+    except (OSError, ValueError, AttributeError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _peak_rss_mb() -> float:
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss é dado em KB no Linux e em bytes no macOS
+    return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024
+
+
+def latency_summary(seconds: list[float]) -> dict:
+    """Percentis de latência, em milissegundos."""
+    if not seconds:
+        return {}
+    values = np.asarray(seconds) * 1000
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {
+        "p50": round(float(p50), 3), "p95": round(float(p95), 3), "p99": round(float(p99), 3),
+        "mean": round(float(values.mean()), 3), "max": round(float(values.max()), 3),
+    }
+
+
+class Stage:
+    """Mede tempo total e memória de uma etapa do benchmark."""
+
+    def __init__(self, name: str, results: dict, verbose: bool = False):
+        self.name = name
+        self.results = results
+        self.verbose = verbose
+        self.data = {}
+
+    def __enter__(self):
+        self._rss_before = _rss_mb()
+        self._quiet = contextlib.nullcontext() if self.verbose else contextlib.redirect_stdout(io.StringIO())
+        self._quiet.__enter__()
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        elapsed = time.perf_counter() - self._start
+        self._quiet.__exit__(*exc_info)
+        rss = _rss_mb()
+        count = self.data.get("count")
+        self.results[self.name] = {
+            **self.data,
+            "seconds": round(elapsed, 4),
+            **({"throughput_per_s": round(count / elapsed, 3) if elapsed else None} if count else {}),
+            "rss_mb": round(rss, 1),
+            "rss_delta_mb": round(rss - self._rss_before, 1),
+            "peak_rss_mb": round(_peak_rss_mb(), 1),
+        }
+        print(f"  {self.name}: {elapsed:.2f}s")
+        return False
+
+
+def bench_parse(results: dict, data_path: str, workers: int, verbose: bool):
+    files = list_source_files(data_path)
+    with Stage("parse", results, verbose) as stage:
+        latencies = []
+        for file_path in files:
+            start = time.perf_counter()
+            load_file(file_path)
+            latencies.append(time.perf_counter() - start)
+        stage.data.update(count=len(files), latency_ms=latency_summary(latencies))
+
+    with Stage("parse_parallel", results, verbose) as stage:
+        documents = load_documents(data_path, workers=workers)
+        stage.data.update(count=len(files), documents=len(documents), workers=workers)
+
+
+def bench_parse_docx(results: dict, data_path: str, verbose: bool):
+    """Vazão do leitor de DOCX, comparada à extração de texto do docx2txt usada antes dele."""
+    files = [file_path for file_path in list_source_files(data_path) if file_path.endswith(".docx")]
+    if not files:
+        return
+    megabytes = round(sum(os.path.getsize(file_path) for file_path in files) / 2**20, 2)
+    with Stage("parse_docx", results, verbose) as stage:
+        properties = 0
+        for file_path in files:
+            properties += sum(len(doc.metadata["properties"]) for doc in parse_product_docx(file_path))
+        stage.data.update(count=len(files), megabytes=megabytes, properties=properties)
+
+    try:
+        from langchain_community.document_loaders import Docx2txtLoader
+        Docx2txtLoader(files[0]).load()
+    except ImportError:
+        return
+    with Stage("parse_docx_docx2txt", results, verbose) as stage:
+        for file_path in files:
+            Docx2txtLoader(file_path).load()
+        stage.data.update(count=len(files), megabytes=megabytes)
+
+
+def bench_index_build(results: dict, index_path: str, data_path: str, embeddings, verbose: bool):
+    with Stage("index_build", results, verbose) as stage:
+        version, summary = build_index_version(index_path, data_path, embeddings, full=True)
+        stage.data.update(
+            count=summary["added"], version=version, errors=len(summary["errors"]),
+            embedding_batches=summary["timings"]["embedding_batches"],
+            files_per_second=summary["timings"]["files_per_second"],
+        )
+
+    # Reexecução sem alterações no catálogo: custo fixo do build incremental
+    with Stage("index_build_noop", results, verbose) as stage:
+        _, summary = build_index_version(index_path, data_path, embeddings)
+        stage.data.update(unchanged=summary["unchanged"])
+
+
+def bench_retrieval(results: dict, agent: Agent, questions: list[str], verbose: bool):
+    with Stage("retrieval", results, verbose) as stage:
+        latencies = []
+        for question in questions:
+            start = time.perf_counter()
+            agent.retriever.invoke(question)
+            latencies.append(time.perf_counter() - start)
+        stage.data.update(count=len(questions), latency_ms=latency_summary(latencies))
+
+
+async def _ask_all(agent: Agent, questions: list[str], concurrency: int):
+    semaphore = asyncio.Semaphore(concurrency)
+    first_chunk, total = [], []
+
+    async def ask(question: str):
+        async with semaphore:
+            start = time.perf_counter()
+            first = None
+            async for _ in agent.ask(question, []):
+                if first is None:
+                    first = time.perf_counter() - start
+            total.append(time.perf_counter() - start)
+            first_chunk.append(first if first is not None else total[-1])
+
+    await asyncio.gather(*(ask(question) for question in questions))
+    return first_chunk, total
+
+
+def bench_ask(results: dict, agent: Agent, questions: list[str], concurrency: int, verbose: bool):
+    with Stage("ask", results, verbose) as stage:
+        first_chunk, total = asyncio.run(_ask_all(agent, questions, concurrency))
+        stage.data.update(
+            count=len(questions),
+            concurrency=concurrency,
+            time_to_first_chunk_ms=latency_summary(first_chunk),
+            latency_ms=latency_summary(total),
+        )
+
+
+# --- Comparação entre execuções ---
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare_results(current: dict, baseline: dict, threshold: float) -> list[str]:
+    """
+    Compara latências (p50/p95) e vazão com uma execução anterior.
+    Retorna a lista de regressões acima de `threshold` (ex: 0.2 = 20% pior).
+    """
+    regressions = []
+    print(f"\nComparação com a execução de {baseline.get('meta', {}).get('timestamp', '?')}:")
+    for name, stage in current["stages"].items():
+        old = baseline.get("stages", {}).get(name)
+        if not old:
+            continue
+        checks = [(f"latency_ms.{p}", stage.get("latency_ms", {}).get(p), old.get("latency_ms", {}).get(p), False)
+                  for p in ("p50", "p95")]
+        checks.append(("throughput_per_s", stage.get("throughput_per_s"), old.get("throughput_per_s"), True))
+        for metric, new_value, old_value, higher_is_better in checks:
+            if not new_value or not old_value:
+                continue
+            change = (new_value - old_value) / old_value
+            worse = -change if higher_is_better else change
+            flag = " <-- REGRESSÃO" if worse > threshold else ""
+            print(f"  {name}.{metric}: {old_value} -> {new_value} ({change:+.1%}){flag}")
+            if flag:
+                regressions.append(f"{name}.{metric}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark offline do agente MAF (LLM e embeddings falsos).")
+    parser.add_argument("--products", type=int, default=500, help="Tamanho do catálogo sintético.")
+    parser.add_argument("--docx-ratio", type=float, default=0.3, help="Fração das fichas geradas em DOCX.")
+    parser.add_argument("--questions", type=int, default=200, help="Quantidade de perguntas por etapa.")
+    parser.add_argument("--concurrency", type=int, default=8, help="Perguntas simultâneas na etapa /ask.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Processos na tradução paralela.")
+    parser.add_argument("--embedding-size", type=int, default=256)
+    parser.add_argument("--embedding-latency", type=float, default=0.0, help="Latência simulada por chamada de embeddings (s).")
+    parser.add_argument("--token-latency", type=float, default=0.0, help="Latência simulada por pedaço do streaming do LLM (s).")
+    parser.add_argument("--answer-cache", action="store_true", help="Mantém o cache de respostas ativo na etapa /ask.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--work-dir", help="Pasta para o catálogo e o índice (padrão: temporária, removida ao final).")
+    parser.add_argument("--output", help="Arquivo JSON com os resultados (padrão: benchmark_results/<data>.json).")
+    parser.add_argument("--baseline", help="Resultados anteriores para comparação.")
+    parser.add_argument("--regression-threshold", type=float, default=0.2)
+    parser.add_argument("--verbose", action="store_true", help="Mostra as mensagens do agente durante as medições.")
+    args = parser.parse_args(argv)
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="maf-benchmark-")
+    data_path = os.path.join(work_dir, "catalogo")
+    index_path = os.path.join(work_dir, "indice")
+    results = {}
+    embeddings = BenchmarkEmbeddings(size=args.embedding_size, latency=args.embedding_latency)
+    llm = FakeListChatModel(responses=[FAKE_ANSWER], sleep=args.token_latency or None)
+
+    agent = None
+    try:
+        print(f"Gerando catálogo sintético com {args.products} produtos em '{data_path}'...")
+        shutil.rmtree(data_path, ignore_errors=True)
+        shutil.rmtree(index_path, ignore_errors=True)
+        names = generate_catalog(data_path, args.products, args.docx_ratio, args.seed)
+        questions = generate_questions(names, args.questions, args.seed)
+
+        print("Executando as etapas:")
+        bench_parse(results, data_path, args.workers, args.verbose)
+        bench_parse_docx(results, data_path, args.verbose)
+        bench_index_build(results, index_path, data_path, embeddings, args.verbose)
+
+        with Stage("agent_load", results, args.verbose):
+            agent = Agent(vector_store_path=index_path, data_path=data_path, llm=llm, embeddings=embeddings)
+            # O banco de perguntas sugeridas é gerado em segundo plano; não deve competir com as medições
+            agent.suggestion_pool.wait()
+        if not args.answer_cache:
+            agent.answer_cache = AnswerCache(max_entries=0)
+
+        bench_retrieval(results, agent, questions, args.verbose)
+        bench_ask(results, agent, questions, args.concurrency, args.verbose)
+    finally:
+        if agent is not None:
+            agent.close()
+        if not args.work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+        },
+        "params": {k: v for k, v in vars(args).items() if k not in ("output", "baseline", "work_dir", "verbose")},
+        "stages": results,
+    }
+
+    output = args.output or os.path.join("benchmark_results", time.strftime("%Y%m%d-%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"\nResultados salvos em '{output}'.")
+
+    for name, stage in results.items():
+        latency = stage.get("latency_ms")
+        line = f"  {name:<18} {stage['seconds']:>9.3f}s"
+        if stage.get("throughput_per_s"):
+            line += f"  {stage['throughput_per_s']:>10.1f}/s"
+        if latency:
+            line += f"  p50 {latency['p50']:.2f}ms  p95 {latency['p95']:.2f}ms  p99 {latency['p99']:.2f}ms"
+        print(line + f"  rss {stage['rss_mb']:.0f}MB")
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            regressions = compare_results(report, json.load(f), args.regression_threshold)
+        if regressions:
+            print(f"{len(regressions)} regressões acima de {args.regression_threshold:.0%}.")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
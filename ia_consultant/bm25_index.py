@@ -0,0 +1,123 @@
+import os
+import json
+import math
+
+import numpy as np
+
+from property_index import normalize_text
+
+# Índice lexical (BM25) das fichas, salvo junto com o índice FAISS. Complementa a busca
+# vetorial em termos exatos, como códigos de produto e nomes de grades.
+BM25_FILE = "bm25.json"
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+
+def tokenize(text: str) -> list[str]:
+    """
+    Quebra o texto em termos normalizados. Pares de termos vizinhos em que um deles
+    contém dígitos também viram um termo único ('pp 123' -> 'pp123'), para que códigos
+    de produto escritos com ou sem separadores se encontrem.
+    """
+    words = normalize_text(text).split()
+    tokens = list(words)
+    for first, second in zip(words, words[1:]):
+        if any(c.isdigit() for c in first + second):
+            tokens.append(first + second)
+    return tokens
+
+
+class BM25Index:
+    """Índice invertido com pontuação BM25."""
+
+    def __init__(self, doc_ids: list[str], doc_lengths: np.ndarray, postings: dict):
+        self.doc_ids = doc_ids
+        self.doc_lengths = doc_lengths
+        self.postings = postings  # termo -> (índices dos documentos, frequências)
+        self.average_length = float(doc_lengths.mean()) if len(doc_lengths) else 0.0
+
+    @classmethod
+    def build(cls, documents: list[tuple[str, str]]) -> "BM25Index":
+        """Constrói o índice a partir de pares (id do documento, texto)."""
+        doc_ids, lengths, raw_postings = [], [], {}
+        for position, (doc_id, text) in enumerate(documents):
+            tokens = tokenize(text)
+            doc_ids.append(doc_id)
+            lengths.append(len(tokens))
+            counts = {}
+            for token in tokens:
+                counts[token] = counts.get(token, 0) + 1
+            for token, count in counts.items():
+                raw_postings.setdefault(token, ([], []))
+                raw_postings[token][0].append(position)
+                raw_postings[token][1].append(count)
+        postings = {
+            token: (np.array(positions, dtype=np.int32), np.array(counts, dtype=np.float32))
+            for token, (positions, counts) in raw_postings.items()
+        }
+        return cls(doc_ids, np.array(lengths, dtype=np.float32), postings)
+
+    def save(self, index_path: str):
+        data = {
+            "doc_ids": self.doc_ids,
+            "doc_lengths": self.doc_lengths.astype(int).tolist(),
+            "postings": {token: [positions.tolist(), counts.astype(int).tolist()] for token, (positions, counts) in self.postings.items()},
+        }
+        tmp_path = os.path.join(index_path, BM25_FILE + ".tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, os.path.join(index_path, BM25_FILE))
+
+    @classmethod
+    def load(cls, index_path: str) -> "BM25Index | None":
+        path = os.path.join(index_path, BM25_FILE)
+        if not os.path.exists(path):
+            return None
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        postings = {
+            token: (np.array(positions, dtype=np.int32), np.array(counts, dtype=np.float32))
+            for token, (positions, counts) in data["postings"].items()
+        }
+        return cls(data["doc_ids"], np.array(data["doc_lengths"], dtype=np.float32), postings)
+
+    def search(self, query: str, k: int) -> list[tuple[str, float]]:
+        """Retorna até k pares (id do documento, pontuação), do mais para o menos relevante."""
+        if not self.doc_ids:
+            return []
+        scores = np.zeros(len(self.doc_ids), dtype=np.float32)
+        total = len(self.doc_ids)
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * self.doc_lengths / max(self.average_length, 1.0))
+        for token in set(tokenize(query)):
+            if token not in self.postings:
+                continue
+            positions, counts = self.postings[token]
+            idf = math.log(1 + (total - len(positions) + 0.5) / (len(positions) + 0.5))
+            scores[positions] += idf * counts * (BM25_K1 + 1) / (counts + norm[positions])
+
+        matched = np.flatnonzero(scores)
+        if len(matched) > k:
+            matched = matched[np.argpartition(-scores[matched], k)[:k]]
+        matched = matched[np.argsort(-scores[matched], kind='stable')]
+        return [(self.doc_ids[i], float(scores[i])) for i in matched]
+
+
+def reciprocal_rank_fusion(rankings: list[list[str]], k: int, rrf_k: int = 60) -> list[str]:
+    """Combina várias listas ordenadas de IDs por Reciprocal Rank Fusion e retorna os k melhores."""
+    scores = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (rrf_k + rank + 1)
+    return sorted(scores, key=lambda doc_id: -scores[doc_id])[:k]
+
+
+def build_bm25_from_vector_store(vector_store, index_path: str) -> BM25Index:
+    """Reconstrói o BM25 a partir dos documentos já presentes no docstore do FAISS (sem re-processar arquivos)."""
+    documents = []
+    for doc_id in vector_store.index_to_docstore_id.values():
+        doc = vector_store.docstore.search(doc_id)
+        if not isinstance(doc, str):
+            documents.append((doc_id, doc.page_content))
+    bm25_index = BM25Index.build(documents)
+    bm25_index.save(index_path)
+    return bm25_index
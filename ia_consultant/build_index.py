@@ -0,0 +1,57 @@
+import os
+import argparse
+
+from dotenv import load_dotenv
+
+from agent import VECTOR_STORE_PATH, DATA_PATH, create_embeddings
+from index_versions import build_index_version
+from ann_index import INDEX_TYPE, INDEX_TYPES
+
+# Construção offline do índice. Grava uma nova versão e a publica no CURRENT;
+# os servidores em execução detectam a nova versão e trocam de índice sem reiniciar.
+#
+#   python build_index.py                    # cliente padrão, incremental
+#   python build_index.py --full             # reconstrói do zero
+#   python build_index.py --tenant cliente   # usa os caminhos do tenants.json
+#   python build_index.py --index-type hnsw  # índice de busca aproximado (veja ann_index.py)
+
+load_dotenv()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Constrói e publica uma nova versão da base de conhecimento.")
+    parser.add_argument("--tenant", help="Cliente do tenants.json cujos caminhos e provedor serão usados.")
+    parser.add_argument("--index-path", help=f"Pasta do índice (padrão: '{VECTOR_STORE_PATH}').")
+    parser.add_argument("--data-path", help=f"Pasta das fichas técnicas (padrão: '{DATA_PATH}').")
+    parser.add_argument("--provider", help="Provedor de embeddings ('openai' ou 'google').")
+    parser.add_argument("--full", action="store_true", help="Reconstrói o índice do zero.")
+    parser.add_argument("--index-type", choices=INDEX_TYPES, help=f"Índice de busca (padrão: '{INDEX_TYPE}').")
+    args = parser.parse_args(argv)
+
+    config = {}
+    if args.tenant:
+        from tenants import load_tenant_configs
+        configs = load_tenant_configs()
+        if args.tenant not in configs:
+            parser.error(f"cliente '{args.tenant}' não encontrado no tenants.json")
+        config = configs[args.tenant]
+        config.setdefault("index_path", os.path.join("indexes", args.tenant))
+
+    index_path = args.index_path or config.get("index_path", VECTOR_STORE_PATH)
+    data_path = args.data_path or config.get("data_path", DATA_PATH)
+    provider = (args.provider or config.get("provider") or os.getenv("LLM_PROVIDER", "openai")).lower()
+
+    index_type = args.index_type or config.get("index_type") or INDEX_TYPE
+
+    version, summary = build_index_version(
+        index_path, data_path, create_embeddings(provider), full=args.full, index_type=index_type
+    )
+    print(
+        f"Versão publicada: {version} ({summary['added']} novos, {summary['updated']} alterados, "
+        f"{summary['removed']} removidos, {len(summary['errors'])} com erro)."
+    )
+    return 1 if summary["errors"] else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,181 @@
+import os
+import json
+import sqlite3
+import threading
+from collections.abc import Mapping
+
+import faiss
+from langchain_community.docstore.base import Docstore
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+
+from ann_index import configure_search, serving_index_file
+
+# Formato de armazenamento do índice: os vetores ficam em 'index.faiss', lidos por
+# memory-map (somente leitura) e compartilhados entre os workers pelo cache do SO;
+# os documentos ficam em um SQLite indexado, lido apenas para os IDs recuperados.
+# Substitui o 'index.pkl' do FAISS.save_local, que exigia carregar e "despicklar" tudo.
+FAISS_INDEX_FILE = "index.faiss"
+DOCSTORE_FILE = "docstore.sqlite"
+LEGACY_DOCSTORE_FILE = "index.pkl"
+
+
+def _mmap_flags() -> int:
+    # IO_FLAG_MMAP_IFC mapeia os vetores sem cópia; versões antigas do faiss só têm IO_FLAG_MMAP
+    return getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+
+
+class _SQLiteReader:
+    """Conexão SQLite somente leitura, compartilhada entre threads."""
+
+    def __init__(self, path: str):
+        self._conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+        self._lock = threading.Lock()
+
+    def query(self, sql: str, params=()) -> list:
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def close(self):
+        self._conn.close()
+
+
+class SQLiteDocstore(Docstore):
+    """Docstore somente leitura que busca cada documento no SQLite sob demanda."""
+
+    def __init__(self, reader: _SQLiteReader):
+        self._reader = reader
+
+    def search(self, search: str) -> Document | str:
+        rows = self._reader.query("SELECT page_content, metadata FROM documents WHERE id = ?", (search,))
+        if not rows:
+            return f"ID {search} not found."
+        page_content, metadata = rows[0]
+        return Document(id=search, page_content=page_content, metadata=json.loads(metadata))
+
+
+class SQLiteIndexMapping(Mapping):
+    """Mapeamento posição no índice FAISS -> ID do documento, lido do SQLite sob demanda."""
+
+    def __init__(self, reader: _SQLiteReader):
+        self._reader = reader
+
+    def __getitem__(self, position: int) -> str:
+        rows = self._reader.query("SELECT id FROM documents WHERE position = ?", (int(position),))
+        if not rows:
+            raise KeyError(position)
+        return rows[0][0]
+
+    def __iter__(self):
+        return iter(row[0] for row in self._reader.query("SELECT position FROM documents ORDER BY position"))
+
+    def __len__(self) -> int:
+        return self._reader.query("SELECT COUNT(*) FROM documents")[0][0]
+
+    def values(self):
+        return [row[0] for row in self._reader.query("SELECT id FROM documents ORDER BY position")]
+
+    def positions(self, ids: list[str]) -> dict:
+        """Posição no índice FAISS de cada ID informado (os inexistentes ficam de fora)."""
+        found = {}
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            found.update(self._reader.query(
+                f"SELECT id, position FROM documents WHERE id IN ({','.join('?' * len(chunk))})", chunk
+            ))
+        return found
+
+    def items(self):
+        return self._reader.query("SELECT position, id FROM documents ORDER BY position")
+
+
+def index_exists(index_path: str) -> bool:
+    """Verifica se há um índice salvo, no formato compacto ou no formato antigo (pickle)."""
+    return os.path.exists(os.path.join(index_path, FAISS_INDEX_FILE)) and (
+        os.path.exists(os.path.join(index_path, DOCSTORE_FILE))
+        or os.path.exists(os.path.join(index_path, LEGACY_DOCSTORE_FILE))
+    )
+
+
+def save_vector_store(vector_store: FAISS, index_path: str):
+    """Salva o índice FAISS e os documentos no formato compacto, substituindo os arquivos atomicamente."""
+    os.makedirs(index_path, exist_ok=True)
+    index_file = os.path.join(index_path, FAISS_INDEX_FILE)
+    docstore_file = os.path.join(index_path, DOCSTORE_FILE)
+
+    faiss.write_index(vector_store.index, index_file + ".tmp")
+
+    if os.path.exists(docstore_file + ".tmp"):
+        os.remove(docstore_file + ".tmp")
+    conn = sqlite3.connect(docstore_file + ".tmp")
+    with conn:
+        conn.execute(
+            "CREATE TABLE documents ("
+            " id TEXT PRIMARY KEY, position INTEGER NOT NULL UNIQUE, page_content TEXT NOT NULL, metadata TEXT NOT NULL)"
+        )
+        rows = []
+        for position, doc_id in vector_store.index_to_docstore_id.items():
+            doc = vector_store.docstore.search(doc_id)
+            if isinstance(doc, Document):
+                rows.append((doc_id, int(position), doc.page_content, json.dumps(doc.metadata, ensure_ascii=False)))
+        conn.executemany("INSERT INTO documents VALUES (?, ?, ?, ?)", rows)
+    conn.close()
+
+    os.replace(index_file + ".tmp", index_file)
+    os.replace(docstore_file + ".tmp", docstore_file)
+    legacy_file = os.path.join(index_path, LEGACY_DOCSTORE_FILE)
+    if os.path.exists(legacy_file):
+        os.remove(legacy_file)
+
+
+def load_exact_index(index_path: str) -> faiss.Index | None:
+    """
+    Índice exato (flat) mapeado em memória, quando as buscas usam um índice aproximado.
+    Retorna None se o índice de busca já é o exato.
+    """
+    if serving_index_file(index_path, FAISS_INDEX_FILE) == os.path.join(index_path, FAISS_INDEX_FILE):
+        return None
+    return faiss.read_index(os.path.join(index_path, FAISS_INDEX_FILE), _mmap_flags())
+
+
+def load_vector_store(index_path: str, embeddings, writable: bool = False) -> FAISS | None:
+    """
+    Carrega o índice salvo. Por padrão, o índice FAISS é mapeado em memória (somente leitura)
+    e os documentos são lidos do SQLite sob demanda. Com `writable=True`, tudo é carregado
+    em memória para que o índice possa ser alterado e salvo de novo (usado na sincronização).
+    Índices no formato antigo (pickle) são convertidos para o formato compacto.
+    """
+    if not index_exists(index_path):
+        return None
+    docstore_file = os.path.join(index_path, DOCSTORE_FILE)
+    if not os.path.exists(docstore_file):
+        print(f"Convertendo a base de conhecimento em '{index_path}' para o formato compacto...")
+        vector_store = FAISS.load_local(index_path, embeddings, allow_dangerous_deserialization=True)
+        save_vector_store(vector_store, index_path)
+        if writable:
+            return vector_store
+
+    index_file = os.path.join(index_path, FAISS_INDEX_FILE)
+    reader = _SQLiteReader(docstore_file)
+    if writable:
+        index = faiss.read_index(index_file)
+        documents, mapping = {}, {}
+        for doc_id, position, page_content, metadata in reader.query(
+            "SELECT id, position, page_content, metadata FROM documents ORDER BY position"
+        ):
+            documents[doc_id] = Document(id=doc_id, page_content=page_content, metadata=json.loads(metadata))
+            mapping[position] = doc_id
+        reader.close()
+        return FAISS(embeddings, index, InMemoryDocstore(documents), mapping)
+
+    # Para as buscas, o índice aproximado (HNSW ou IVF-PQ, veja ann_index.py) substitui o exato
+    index_file = serving_index_file(index_path, FAISS_INDEX_FILE)
+    try:
+        index = faiss.read_index(index_file, _mmap_flags())
+    except RuntimeError as e:
+        # Alguns tipos de índice não suportam memory-map; nesse caso, são lidos por completo
+        print(f"Não foi possível mapear o índice em memória ({e}); carregando por completo.")
+        index = faiss.read_index(index_file)
+    configure_search(index)
+    return FAISS(embeddings, index, SQLiteDocstore(reader), SQLiteIndexMapping(reader))
@@ -0,0 +1,72 @@
+import os
+
+from langchain_core.documents import Document
+
+from property_index import normalize_text
+
+# Limite de tokens das Fichas Técnicas enviadas no CONTEXTO do prompt final
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "6000"))
+MIN_KEYWORD_LENGTH = 4
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("cl100k_base")
+except Exception:  # tiktoken ausente ou sem acesso ao arquivo do encoding
+    _encoding = None
+
+
+def count_tokens(text: str) -> int:
+    """Conta tokens com o tiktoken; sem ele, usa a aproximação de ~4 caracteres por token."""
+    if _encoding is not None:
+        return len(_encoding.encode(text, disallowed_special=()))
+    return max(1, len(text) // 4)
+
+
+def trim_to_question(doc: Document, question: str) -> Document:
+    """
+    Reduz a ficha às propriedades citadas na pergunta, mantendo o enquadramento
+    'INÍCIO/FIM DA FICHA TÉCNICA' e a linha 'Produto:'.
+    """
+    keywords = {word for word in normalize_text(question).split() if len(word) >= MIN_KEYWORD_LENGTH}
+    kept = []
+    for line in doc.page_content.split("\n"):
+        key = line.split(":", 1)[0]
+        if (line.startswith("--- ") or key.strip().lower() == "produto"
+                or keywords.intersection(normalize_text(key).split())):
+            kept.append(line)
+    return Document(id=doc.id, page_content="\n".join(kept), metadata={**doc.metadata, "trimmed": True})
+
+
+def pack_context(question: str, documents: list[Document], budget: int = CONTEXT_TOKEN_BUDGET) -> tuple[list[Document], dict]:
+    """
+    Seleciona as fichas que cabem no orçamento de tokens, na ordem de relevância:
+    remove fichas repetidas do mesmo produto, mantém as primeiras inteiras e, quando o
+    orçamento aperta, reduz as seguintes às propriedades citadas na pergunta ou as descarta.
+    Retorna (fichas selecionadas, relatório com os tokens economizados).
+    """
+    report = {"tokens_before": 0, "tokens_after": 0, "deduplicated": 0, "trimmed": 0, "dropped": 0}
+    seen_products = set()
+    packed = []
+    for doc in documents:
+        tokens = count_tokens(doc.page_content)
+        report["tokens_before"] += tokens
+
+        product = doc.metadata.get("product_name")
+        if product and product in seen_products:
+            report["deduplicated"] += 1
+            continue
+        seen_products.add(product)
+
+        remaining = budget - report["tokens_after"]
+        if tokens > remaining:
+            doc = trim_to_question(doc, question)
+            tokens = count_tokens(doc.page_content)
+            if tokens > remaining:
+                report["dropped"] += 1
+                continue
+            report["trimmed"] += 1
+        packed.append(doc)
+        report["tokens_after"] += tokens
+
+    report["tokens_saved"] = report["tokens_before"] - report["tokens_after"]
+    return packed, report
@@ -1,8 +1,15 @@
 import os
-import re
 import json
-from langchain_community.document_loaders import Docx2txtLoader
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from langchain_core.documents import Document
+from docx_parser import parse_docx_properties
+
+# Versão da tradução das fichas em documentos, guardada no manifesto do índice. Quando o
+# resultado muda para o mesmo arquivo (ex: v2, leitor nativo de DOCX com as tabelas de
+# propriedades), o número aumenta e as bases existentes re-processam as fichas uma vez.
+PARSER_VERSION = 2
 
 def format_product_data(product_name: str, properties: dict) -> str:
     """Cria uma Ficha Técnica de Produto em texto, otimizada para a IA."""
@@ -23,7 +30,7 @@ def format_product_data(product_name: str, properties: dict) -> str:
     lines.append(f"--- FIM DA FICHA TÉCNICA DO PRODUTO: {product_name.upper()} ---")
     return "\n".join(lines)
 
-def parse_product_json(file_path: str) -> list[Document]:
+def parse_product_json(file_path: str, raise_errors: bool = False) -> list[Document]:
     """Lê um JSON, achata suas propriedades e o transforma em uma Ficha Técnica estruturada."""
     try:
         with open(file_path, 'r', encoding='utf-8') as f:
@@ -47,72 +54,122 @@ def parse_product_json(file_path: str) -> list[Document]:
                 properties[key] = value
 
         page_content = format_product_data(product_name, properties)
-        return [Document(page_content=page_content, metadata={"source": file_path, "product_name": product_name})]
+        # As propriedades seguem nos metadados para o índice de propriedades (property_index.py)
+        metadata = {"source": file_path, "product_name": product_name, "properties": properties}
+        return [Document(page_content=page_content, metadata=metadata)]
 
     except Exception as e:
+        if raise_errors:
+            raise
         print(f"Erro ao processar o arquivo JSON {os.path.basename(file_path)}: {e}")
         return []
 
-def parse_product_docx(file_path: str) -> list[Document]:
+def parse_product_docx(file_path: str, raise_errors: bool = False) -> list[Document]:
     """Lê uma Ficha Técnica DOCX e a transforma em um dicionário de propriedades estruturado."""
     try:
-        text = Docx2txtLoader(file_path).load()[0].page_content
-        lines = [line.strip() for line in text.split('\n') if line.strip()]
-
-        product_name = os.path.basename(file_path).split('.')[0] # Nome fallback
-        properties = {}
-
-        # Encontra o nome do produto de forma mais precisa
-        for line in lines:
-            if line.lower().startswith("produto:"):
-                product_name = line.split(":", 1)[1].strip().split("Cor:")[0].strip()
-                break
-        
-        # Extrai todos os pares chave:valor e dados da tabela
-        for line in lines:
-            # Pares simples como 'Cor: Preto'
-            match = re.match(r'^([^:]+):\s*(.+)$', line)
-            if match:
-                key, value = match.groups()
-                # Remove o nome do produto das propriedades para evitar redundância
-                if key.lower() != 'produto':
-                    properties[key] = value
-            # Lógica da tabela
-            else:
-                parts = re.split(r'\s{2,}', line)
-                if len(parts) >= 2:
-                    prop_name, prop_value = parts[0], parts[-1]
-                    # Filtra cabeçalhos comuns da tabela
-                    if prop_name.lower() not in ['propriedades', 'método', 'unidade', 'valores típicos']:
-                        properties[prop_name] = prop_value
+        # Leitura nativa do XML: as tabelas de propriedades chegam como linhas, não como texto solto
+        product_name, properties = parse_docx_properties(file_path)
+        product_name = product_name or os.path.basename(file_path).split('.')[0] # Nome fallback
 
         page_content = format_product_data(product_name, properties)
-        return [Document(page_content=page_content, metadata={"source": file_path, "product_name": product_name})]
+        # As propriedades seguem nos metadados para o índice de propriedades (property_index.py)
+        metadata = {"source": file_path, "product_name": product_name, "properties": properties}
+        return [Document(page_content=page_content, metadata=metadata)]
 
     except Exception as e:
+        if raise_errors:
+            raise
         print(f"Erro ao processar o arquivo DOCX {os.path.basename(file_path)}: {e}")
         return []
 
-def load_documents(path: str):
+def list_source_files(path: str) -> list[str]:
+    """Lista, em ordem determinística, todas as Fichas Técnicas (JSON e DOCX) do catálogo."""
+    files = []
+    for subdir, extension in (("json", ".json"), ("DTS", ".docx")):
+        dir_path = os.path.join(path, subdir)
+        if os.path.exists(dir_path):
+            for filename in sorted(os.listdir(dir_path)):
+                if filename.endswith(extension):
+                    files.append(os.path.join(dir_path, filename))
+    return files
+
+# Número de processos usados na tradução das fichas. 1 desativa o paralelismo.
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", str(os.cpu_count() or 1)))
+# Arquivos traduzidos à frente do consumo, por processo, na tradução sob demanda
+INGEST_PREFETCH = int(os.getenv("INGEST_PREFETCH", "4"))
+
+def load_file(file_path: str, raise_errors: bool = False) -> list[Document]:
+    """Traduz um único arquivo do catálogo, escolhendo o parser pela extensão."""
+    if file_path.endswith('.json'):
+        return parse_product_json(file_path, raise_errors=raise_errors)
+    if file_path.endswith('.docx'):
+        return parse_product_docx(file_path, raise_errors=raise_errors)
+    return []
+
+def _load_file_collecting_errors(file_path: str) -> tuple[list[Document], str | None]:
+    """Versão de `load_file` para os processos de trabalho: devolve o erro em vez de imprimi-lo."""
+    try:
+        return load_file(file_path, raise_errors=True), None
+    except Exception as e:
+        return [], f"{type(e).__name__}: {e}"
+
+def iter_load_files(file_paths: list[str], workers: int | None = None):
+    """
+    Traduz os arquivos sob demanda, na ordem de `file_paths`, gerando (caminho, documentos, erro).
+    No máximo INGEST_PREFETCH arquivos por processo ficam traduzidos à frente do consumidor,
+    então a memória não cresce com o tamanho do catálogo.
+    """
+    workers = INGEST_WORKERS if workers is None else workers
+    workers = max(1, min(workers, len(file_paths)))
+
+    if workers == 1:
+        for file_path in file_paths:
+            yield (file_path, *_load_file_collecting_errors(file_path))
+        return
+
+    # Os parsers são CPU-bound (descompactação e XML do DOCX), então usamos processos. Eles são
+    # iniciados com 'spawn': a sincronização também roda em uma thread do servidor, ao lado de
+    # clientes HTTP, conexões SQLite e threads do faiss, e um fork nesse estado pode travar.
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+        pending = deque()
+        paths = iter(file_paths)
+        try:
+            for file_path in paths:
+                pending.append((file_path, executor.submit(_load_file_collecting_errors, file_path)))
+                if len(pending) >= workers * INGEST_PREFETCH:
+                    break
+            while pending:
+                file_path, future = pending.popleft()
+                next_path = next(paths, None)
+                if next_path is not None:
+                    pending.append((next_path, executor.submit(_load_file_collecting_errors, next_path)))
+                yield (file_path, *future.result())
+        finally:
+            for _, future in pending:
+                future.cancel()
+
+def load_files(file_paths: list[str], workers: int | None = None, errors: list | None = None) -> list[list[Document]]:
+    """
+    Traduz uma lista de arquivos, opcionalmente em paralelo em vários processos.
+    O resultado segue a mesma ordem de `file_paths`. Os erros de cada arquivo são
+    adicionados a `errors` como tuplas (caminho, mensagem), se a lista for informada.
+    """
+    documents = []
+    for file_path, docs, error in iter_load_files(file_paths, workers):
+        if error:
+            print(f"Erro ao processar o arquivo {os.path.basename(file_path)}: {error}")
+            if errors is not None:
+                errors.append((file_path, error))
+        documents.append(docs)
+    return documents
+
+def load_documents(path: str, workers: int | None = None, errors: list | None = None):
     """Ponto de entrada que carrega e traduz todas as Fichas Técnicas."""
     print("Iniciando o tradutor de Fichas Técnicas...")
     all_docs = []
-    
-    # Processa JSONs
-    json_path = os.path.join(path, "json")
-    if os.path.exists(json_path):
-        print(f"Traduzindo arquivos de: {json_path}")
-        for filename in sorted(os.listdir(json_path)):
-            if filename.endswith('.json'):
-                all_docs.extend(parse_product_json(os.path.join(json_path, filename)))
-
-    # Processa DOCX
-    docx_path = os.path.join(path, "DTS")
-    if os.path.exists(docx_path):
-        print(f"Traduzindo arquivos de: {docx_path}")
-        for filename in sorted(os.listdir(docx_path)):
-            if filename.endswith('.docx'):
-                all_docs.extend(parse_product_docx(os.path.join(docx_path, filename)))
+
+    for docs in load_files(list_source_files(path), workers=workers, errors=errors):
+        all_docs.extend(docs)
 
     print(f"Tradução finalizada. {len(all_docs)} Fichas Técnicas prontas para a IA.")
     return all_docs
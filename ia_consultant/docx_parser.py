@@ -0,0 +1,177 @@
+import re
+import zipfile
+from xml.parsers import expat
+
+from property_index import normalize_text
+
+# Leitor nativo das Fichas Técnicas DOCX. O 'word/document.xml' é lido em streaming direto
+# do zip (expat), sem montar a árvore inteira: parágrafos viram pares 'Chave: Valor' e
+# tabelas viram linhas de células, interpretadas pelas colunas do cabeçalho.
+W_NS = "http://schemas.openxmlformats.org/wordprocessingml/2006/main "
+W_P, W_T, W_TAB, W_BR, W_CR = W_NS + "p", W_NS + "t", W_NS + "tab", W_NS + "br", W_NS + "cr"
+W_TBL, W_TR, W_TC = W_NS + "tbl", W_NS + "tr", W_NS + "tc"
+DOCUMENT_XML = "word/document.xml"
+READ_CHUNK_SIZE = 64 * 1024
+
+# Palavras (normalizadas) que identificam as colunas do cabeçalho da tabela de propriedades
+NAME_HEADERS = ("propriedade", "propriedades", "caracteristica", "caracteristicas", "ensaio", "parametro")
+VALUE_HEADERS = ("valor", "valores", "valores tipicos", "valor tipico", "resultado", "tipico")
+UNIT_HEADERS = ("unidade", "unidades", "un")
+METHOD_HEADERS = ("metodo", "metodos", "norma")
+HEADER_WORDS = set(NAME_HEADERS + VALUE_HEADERS + UNIT_HEADERS + METHOD_HEADERS)
+
+# Segmentos de um parágrafo separados por tabulação ou por vários espaços (ex: 'Produto: X    Cor: Y')
+_SEGMENT_SPLIT = re.compile(r'\t|\s{2,}')
+
+
+class _BodyReader:
+    """
+    Handlers do expat para o 'word/document.xml': junta o texto de cada parágrafo e as
+    células das tabelas, guardando os blocos prontos em `blocks` para serem consumidos.
+    """
+
+    def __init__(self):
+        self.blocks = []
+        self.depth = 0          # tabelas abertas
+        self.in_text = False
+        self.parts = []         # texto do parágrafo atual
+        self.cell_parts = []    # parágrafos da célula atual
+        self.cells = []
+        self.rows = []
+
+    def start(self, name, attrs):
+        if name == W_T:
+            self.in_text = True
+        elif name == W_TAB:
+            self.parts.append("\t")
+        elif name == W_BR or name == W_CR:
+            self.parts.append("\n")
+        elif name == W_TBL:
+            self.depth += 1
+
+    def end(self, name):
+        if name == W_T:
+            self.in_text = False
+        elif name == W_P:
+            text = "".join(self.parts)
+            self.parts = []
+            if self.depth:
+                self.cell_parts.append(text)
+            else:
+                self.blocks.append(("paragraph", text))
+        elif self.depth == 1 and name == W_TC:
+            self.cells.append(" ".join(part.strip() for part in self.cell_parts if part.strip()))
+            self.cell_parts = []
+        elif self.depth == 1 and name == W_TR:
+            self.rows.append(self.cells)
+            self.cells = []
+        elif name == W_TBL:
+            self.depth -= 1
+            if not self.depth:
+                self.blocks.append(("table", self.rows))
+                self.rows = []
+
+    def text(self, data):
+        if self.in_text:
+            self.parts.append(data)
+
+
+def iter_docx_blocks(file_path: str):
+    """
+    Percorre o corpo do documento na ordem, gerando ('paragraph', texto) e ('table', linhas),
+    em que cada linha é a lista dos textos das células. Tabelas dentro de células entram
+    como texto da célula. O XML é lido do zip em blocos, sem montar a árvore do documento.
+    """
+    reader = _BodyReader()
+    parser = expat.ParserCreate(namespace_separator=" ")
+    parser.buffer_text = True
+    parser.StartElementHandler = reader.start
+    parser.EndElementHandler = reader.end
+    parser.CharacterDataHandler = reader.text
+    with zipfile.ZipFile(file_path) as docx, docx.open(DOCUMENT_XML) as document:
+        for chunk in iter(lambda: document.read(READ_CHUNK_SIZE), b""):
+            parser.Parse(chunk, False)
+            yield from reader.blocks
+            reader.blocks = []
+        parser.Parse(b"", True)
+        yield from reader.blocks
+
+
+def _split_pair(text: str) -> tuple[str, str] | None:
+    key, sep, value = text.partition(":")
+    key, value = key.strip(), value.strip()
+    if not sep or not key or not value:
+        return None
+    return key, value
+
+
+def _header_columns(row: list[str]) -> dict | None:
+    """Colunas de nome, valor e unidade se a linha é um cabeçalho (ex: 'Propriedades | Método | Unidade | Valores Típicos')."""
+    normalized = [normalize_text(cell) for cell in row]
+    if sum(cell in HEADER_WORDS for cell in normalized) < 2:
+        return None
+    columns = {"name": 0, "value": len(row) - 1, "unit": None}
+    for i, cell in enumerate(normalized):
+        if cell in NAME_HEADERS:
+            columns["name"] = i
+        elif cell in VALUE_HEADERS:
+            columns["value"] = i
+        elif cell in UNIT_HEADERS:
+            columns["unit"] = i
+    return columns
+
+
+def _table_properties(rows: list[list[str]], properties: dict):
+    columns, header_row = None, None
+    for row in rows:
+        filled = [cell for cell in row if cell]
+        if not filled or row == header_row:
+            # Linhas vazias e o cabeçalho repetido no início de cada página
+            continue
+        header = _header_columns(row) if columns is None else None
+        if header:
+            columns, header_row = header, row
+            continue
+        if columns is None:
+            # Tabela sem cabeçalho: de layout ('Cor: Preto' em cada célula) ou 'nome | ... | valor'
+            pairs = [_split_pair(cell) for cell in filled]
+            if all(pairs):
+                properties.update(pairs)
+            elif len(filled) >= 2:
+                properties[filled[0].rstrip(":").strip()] = filled[-1]
+            continue
+        if len(filled) < 2:
+            # Linha de título de seção (ex: 'Propriedades Mecânicas')
+            continue
+
+        name = row[columns["name"]].rstrip(":").strip() if columns["name"] < len(row) else ""
+        value = row[columns["value"]] if columns["value"] < len(row) else ""
+        if not value:
+            value = next((cell for cell in reversed(row[columns["name"] + 1:]) if cell), "")
+        unit = row[columns["unit"]] if columns["unit"] is not None and columns["unit"] < len(row) else ""
+        if unit and unit not in value:
+            value = f"{value} {unit}"
+        if name and value:
+            properties[name] = value
+
+
+def parse_docx_properties(file_path: str) -> tuple[str | None, dict]:
+    """
+    Extrai o nome do produto (linha 'Produto: ...') e as propriedades de uma Ficha Técnica DOCX:
+    pares 'Chave: Valor' dos parágrafos e linhas das tabelas de propriedades.
+    """
+    product_name = None
+    properties = {}
+    for kind, content in iter_docx_blocks(file_path):
+        if kind == "table":
+            _table_properties(content, properties)
+            continue
+        for segment in _SEGMENT_SPLIT.split(content):
+            pair = _split_pair(segment)
+            if pair:
+                properties[pair[0]] = pair[1]
+    for key in list(properties):
+        if key.lower() == "produto":
+            # 'Produto: X Cor: Y' na mesma linha, separados por um único espaço
+            product_name = properties.pop(key).split("Cor:")[0].strip()
+    return product_name, properties
@@ -0,0 +1,154 @@
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+from array import array
+
+from langchain_core.embeddings import Embeddings
+
+# Cache persistente de embeddings, compartilhado entre reconstruções do índice e
+# perguntas do /ask. Cada vetor é guardado em um SQLite, indexado por provedor,
+# modelo e hash do texto, com descarte LRU quando o limite de entradas é atingido.
+# O padrão fica ao lado deste módulo, não na pasta de onde o processo foi iniciado
+EMBEDDING_CACHE_PATH = os.getenv(
+    "EMBEDDING_CACHE_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "embedding_cache.sqlite")
+)
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "200000"))
+
+
+class CachedEmbeddings(Embeddings):
+    """Envolve qualquer provedor de embeddings do LangChain com um cache em disco."""
+
+    def __init__(self, underlying: Embeddings, provider: str, model: str,
+                 path: str = EMBEDDING_CACHE_PATH, max_entries: int = EMBEDDING_CACHE_MAX_ENTRIES,
+                 rate_limiter=None):
+        self.underlying = underlying
+        # Token bucket do provedor: só as chamadas que não saem do cache consomem a cota
+        self.rate_limiter = rate_limiter
+        self.namespace = f"{provider}:{model}"
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                " key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_access REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_last_access ON embeddings(last_access)")
+        # Contagem de linhas mantida em memória: o COUNT(*) percorreria a tabela a cada gravação
+        self._rows = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def _key(self, text: str) -> str:
+        return hashlib.sha256(f"{self.namespace}\n{text}".encode('utf-8')).hexdigest()
+
+    def _lookup(self, keys: list[str]) -> dict:
+        """Busca os vetores já em cache e atualiza o horário de último acesso deles."""
+        found = {}
+        with self._lock:
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", chunk
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = array('f', blob).tolist()
+            if found:
+                now = time.time()
+                with self._conn:
+                    self._conn.executemany(
+                        "UPDATE embeddings SET last_access = ? WHERE key = ?",
+                        [(now, key) for key in found],
+                    )
+        return found
+
+    def _count(self, hits: int, misses: int):
+        with self._lock:
+            self.hits += hits
+            self.misses += misses
+
+    def _store(self, items: dict):
+        """Grava novos vetores e descarta os menos usados recentemente acima do limite."""
+        now = time.time()
+        with self._lock, self._conn:
+            # Uma chave já gravada (ex: por outra thread) tem o mesmo vetor e não conta de novo
+            inserted = self._conn.executemany(
+                "INSERT OR IGNORE INTO embeddings (key, vector, last_access) VALUES (?, ?, ?)",
+                [(key, array('f', vector).tobytes(), now) for key, vector in items.items()],
+            ).rowcount
+            self._rows += max(0, inserted)
+            if self._rows > self.max_entries:
+                deleted = self._conn.execute(
+                    "DELETE FROM embeddings WHERE key IN ("
+                    " SELECT key FROM embeddings ORDER BY last_access ASC LIMIT ?)",
+                    (self._rows - self.max_entries,),
+                ).rowcount
+                self._rows -= deleted
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        keys = [self._key(text) for text in texts]
+        cached = self._lookup(list(set(keys)))
+
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in cached and key not in missing:
+                missing[key] = text
+        self._count(len(texts) - len(missing), len(missing))
+
+        if missing:
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire()
+            vectors = self.underlying.embed_documents(list(missing.values()))
+            new_items = dict(zip(missing.keys(), vectors))
+            self._store(new_items)
+            cached.update(new_items)
+
+        return [cached[key] for key in keys]
+
+    def embed_query(self, text: str) -> list[float]:
+        # As consultas usam um espaço de chaves próprio: alguns provedores (ex: Google)
+        # geram vetores diferentes para documentos e perguntas.
+        key = self._key("query:" + text)
+        cached = self._lookup([key])
+        if key in cached:
+            self._count(1, 0)
+            return cached[key]
+        self._count(0, 1)
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire()
+        vector = self.underlying.embed_query(text)
+        self._store({key: vector})
+        return vector
+
+    def embed_queries(self, texts: list[str]) -> list[list[float]]:
+        """Embeddings de várias perguntas com uma única chamada ao provedor para as que não estão em cache."""
+        keys = [self._key("query:" + text) for text in texts]
+        cached = self._lookup(list(set(keys)))
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in cached and key not in missing:
+                missing[key] = text
+        self._count(len(texts) - len(missing), len(missing))
+
+        if missing:
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire()
+            if self.namespace.startswith("google:"):
+                # O Google gera vetores diferentes para perguntas e documentos
+                vectors = self.underlying.embed_documents(list(missing.values()), task_type="RETRIEVAL_QUERY")
+            else:
+                vectors = self.underlying.embed_documents(list(missing.values()))
+            new_items = dict(zip(missing.keys(), vectors))
+            self._store(new_items)
+            cached.update(new_items)
+
+        return [cached[key] for key in keys]
+
+    def stats(self) -> dict:
+        """Retorna os contadores de acertos e falhas do cache."""
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses}
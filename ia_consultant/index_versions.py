@@ -0,0 +1,159 @@
+import os
+import json
+import time
+import shutil
+
+from filelock import FileLock
+
+from vector_index import sync_vector_store
+from compact_store import index_exists
+from ann_index import INDEX_TYPE
+
+# Índices versionados: cada construção grava um diretório imutável em
+# '<índice>/versions/<versão>' e só então publica a versão no arquivo CURRENT
+# (escrita atômica). Os servidores leem o CURRENT e trocam de índice sem reiniciar.
+CURRENT_FILE = "CURRENT"
+VERSIONS_DIR = "versions"
+INDEX_KEEP_VERSIONS = int(os.getenv("INDEX_KEEP_VERSIONS", "3"))
+INDEX_BUILD_LOCK_TIMEOUT = float(os.getenv("INDEX_BUILD_LOCK_TIMEOUT", "3600"))
+# Arquivo de uma construção em andamento ('<versão>.building') com a versão de origem.
+# Uma construção interrompida é retomada pela próxima, se a versão publicada não mudou.
+BUILD_STATE_FILE = "BUILD_STATE"
+
+
+def version_path(index_path: str, version: str) -> str:
+    """Diretório de uma versão publicada do índice."""
+    return os.path.join(index_path, VERSIONS_DIR, version)
+
+
+def current_version(index_path: str) -> str | None:
+    """Versão publicada no arquivo CURRENT, ou None se nenhuma versão foi publicada."""
+    try:
+        with open(os.path.join(index_path, CURRENT_FILE), 'r', encoding='utf-8') as f:
+            version = f.read().strip()
+    except OSError:
+        return None
+    if not version or not os.path.isdir(version_path(index_path, version)):
+        return None
+    return version
+
+
+def publish_version(index_path: str, version: str):
+    """Aponta o CURRENT para a versão informada (arquivo temporário + rename)."""
+    current_file = os.path.join(index_path, CURRENT_FILE)
+    tmp_path = current_file + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(version + "\n")
+    os.replace(tmp_path, current_file)
+
+
+def _new_version_name(index_path: str) -> str:
+    base = time.strftime("%Y%m%d-%H%M%S")
+    version, suffix = base, 1
+    while os.path.exists(version_path(index_path, version)):
+        version = f"{base}-{suffix}"
+        suffix += 1
+    return version
+
+
+def _copy_index_files(source: str, target: str):
+    """Copia os arquivos do índice de origem (sem subdiretórios, travas e o CURRENT)."""
+    for name in os.listdir(source):
+        path = os.path.join(source, name)
+        if os.path.isfile(path) and name != CURRENT_FILE and not name.endswith((".lock", ".tmp")):
+            shutil.copy2(path, os.path.join(target, name))
+
+
+def prune_versions(index_path: str, keep: int = INDEX_KEEP_VERSIONS):
+    """Remove as versões mais antigas, mantendo a atual e as `keep` mais recentes."""
+    versions_dir = os.path.join(index_path, VERSIONS_DIR)
+    if not os.path.isdir(versions_dir):
+        return
+    current = current_version(index_path)
+    versions = sorted(
+        (v for v in os.listdir(versions_dir) if not v.endswith(".building")),
+        reverse=True,
+    )
+    for version in versions[max(keep, 1):]:
+        if version != current:
+            # Servidores que ainda usam a versão mantêm os arquivos abertos até trocarem de índice
+            shutil.rmtree(version_path(index_path, version), ignore_errors=True)
+
+
+def _resumable_build(index_path: str, base: str | None, full: bool) -> str | None:
+    """
+    Diretório de uma construção interrompida que pode ser retomada (mesma versão de origem e,
+    se for pedida uma reconstrução completa, também completa). As demais são descartadas.
+    """
+    versions_dir = os.path.join(index_path, VERSIONS_DIR)
+    resumable = None
+    for name in sorted(os.listdir(versions_dir)):
+        staging = os.path.join(versions_dir, name)
+        if not name.endswith(".building"):
+            continue
+        try:
+            with open(os.path.join(staging, BUILD_STATE_FILE), 'r', encoding='utf-8') as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            state = None
+        if resumable is None and state and state.get("base") == base and (state.get("full") or not full):
+            resumable = staging
+        else:
+            shutil.rmtree(staging, ignore_errors=True)
+    return resumable
+
+
+def build_index_version(index_path: str, data_path: str, embeddings, full: bool = False,
+                        index_type: str | None = None) -> tuple[str | None, dict]:
+    """
+    Constrói uma nova versão do índice a partir da versão atual (apenas as fichas novas,
+    alteradas ou removidas são processadas) e a publica. Com `full=True`, reconstrói tudo.
+    `index_type` escolhe o índice de busca (padrão: INDEX_TYPE, veja ann_index.py).
+    Se o catálogo não mudou, nenhuma versão nova é criada. Uma construção interrompida
+    (erro ou processo encerrado) é retomada a partir do último progresso salvo.
+    Retorna (versão publicada, resumo da sincronização).
+    """
+    os.makedirs(os.path.join(index_path, VERSIONS_DIR), exist_ok=True)
+    with FileLock(f"{index_path}.lock", timeout=INDEX_BUILD_LOCK_TIMEOUT):
+        current = current_version(index_path)
+        staging = _resumable_build(index_path, current, full)
+        resumed = staging is not None
+        if resumed:
+            version = os.path.basename(staging)[:-len(".building")]
+            print(f"Retomando a construção interrompida da versão '{version}'...")
+        else:
+            version = _new_version_name(index_path)
+            staging = version_path(index_path, version) + ".building"
+            os.makedirs(staging)
+            # Índices antigos, gravados direto na pasta do índice, servem de base para a primeira versão
+            base = version_path(index_path, current) if current else index_path
+            if not full:
+                _copy_index_files(base, staging)
+            with open(os.path.join(staging, BUILD_STATE_FILE), 'w', encoding='utf-8') as f:
+                json.dump({"base": current, "full": full}, f)
+
+        # Em caso de erro, o diretório da construção é mantido para ser retomado
+        print(f"Construindo a versão '{version}' da base de conhecimento a partir de '{data_path}'...")
+        # Ao retomar, o progresso salvo já reflete a reconstrução completa, se for o caso
+        summary = sync_vector_store(
+            staging, data_path, embeddings, full=full and not resumed, index_type=index_type or INDEX_TYPE
+        )
+        summary["resumed"] = resumed
+
+        changed = summary["added"] or summary["updated"] or summary["removed"] or summary.get("index_type_changed")
+        if current and not changed and not full and not resumed:
+            shutil.rmtree(staging, ignore_errors=True)
+            print(f"Catálogo sem alterações; a versão '{current}' continua publicada.")
+            return current, summary
+        if not index_exists(staging):
+            # Catálogo vazio ou nenhuma ficha lida: uma versão sem índice não é publicada
+            shutil.rmtree(staging, ignore_errors=True)
+            print(f"Nenhuma ficha indexada em '{data_path}'; nenhuma versão nova publicada.")
+            return current, summary
+
+        os.remove(os.path.join(staging, BUILD_STATE_FILE))
+        os.rename(staging, version_path(index_path, version))
+        publish_version(index_path, version)
+        print(f"Versão '{version}' da base de conhecimento publicada.")
+        prune_versions(index_path)
+        return version, summary
@@ -1,22 +1,40 @@
 from contextlib import asynccontextmanager
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel, Field
 from typing import List, Literal
-from agent import Agent
-from fastapi.responses import StreamingResponse
+from tenants import AgentRegistry, TenantAuthError, UnknownTenantError, DEFAULT_TENANT, load_tenant_configs
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.background import BackgroundTask
 import asyncio
-from langchain_core.messages import HumanMessage, AIMessage
+import time
+from streaming import MEDIA_TYPES, format_event, stream_events
+from agent import BATCH_MAX_CONCURRENCY, BATCH_MAX_QUESTIONS
+from metrics import render_metrics
+from admission import AdmissionController, AdmissionRejected
+from sessions import SessionStore
 
-# Variável para armazenar a instância do agente
-maf_agent_instance = None
+# Registro dos agentes por cliente. O cliente é definido pelo servidor: pela chave enviada no
+# cabeçalho X-API-Key (ou por 'Authorization: Bearer'), ou pelo domínio da requisição, conforme
+# as 'api_keys' e 'hosts' do tenants.json. Requisições sem credencial válida recebem 401; só a
+# instalação de cliente único ('default' sem chaves configuradas) dispensa a credencial.
+agent_registry = None
+API_KEY_HEADER = "X-API-Key"
+# Limite de perguntas simultâneas com fila de espera limitada (veja admission.py)
+admission = AdmissionController()
+# Conversas guardadas no servidor: o frontend envia o session_id em vez do histórico completo
+sessions = SessionStore()
+SESSION_HEADER = "X-Session-ID"
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Código a ser executado na inicialização
-    global maf_agent_instance
+    global agent_registry
     print("Inicializando o Agente MAF (isso pode levar alguns minutos na primeira vez)...")
-    maf_agent_instance = Agent()
+    agent_registry = AgentRegistry(load_tenant_configs())
+    # O cliente padrão é carregado já na inicialização; os demais, no primeiro acesso.
+    # Sem índice publicado, a construção segue em segundo plano (veja /ready).
+    agent_registry.get(DEFAULT_TENANT)
     print("Agente MAF pronto para receber requisições.")
     yield
     # Código a ser executado no desligamento (se necessário)
@@ -43,6 +61,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"], # Permite todos os métodos (GET, POST, etc.)
     allow_headers=["*"], # Permite todos os cabeçalhos
+    expose_headers=[SESSION_HEADER], # Permite ao frontend ler o ID da sessão
 )
 # --- Fim da Configuração do CORS ---
 
@@ -53,36 +72,135 @@ class Message(BaseModel):
 
 class QuestionRequest(BaseModel):
     question: str
+    # O histórico fica no servidor, na sessão informada em session_id. Sem session_id, ou se a
+    # sessão não for encontrada (expirada, servidor reiniciado ou outro worker), uma sessão nova
+    # é criada e iniciada com `history`; por isso o frontend envia sempre os turnos recentes, que
+    # são ignorados quando a sessão existe. O ID da sessão volta no cabeçalho X-Session-ID e no
+    # evento 'done'.
+    session_id: str | None = None
     history: List[Message] = Field(default_factory=list)
+    # "text" mantém o streaming em texto puro usado pelo frontend; "sse" e "ndjson"
+    # enviam eventos com enquadramento, incluindo os eventos de conclusão e de erro.
+    stream_format: Literal["text", "sse", "ndjson"] = "text"
 
-# Função geradora assíncrona para o streaming
-async def stream_generator(question: str, history: List[Message]):
-    # Converte o histórico do formato do frontend para o formato do LangChain
-    chat_history = []
+class BatchQuestionRequest(BaseModel):
+    questions: List[str] = Field(min_length=1, max_length=BATCH_MAX_QUESTIONS)
+    # Respostas geradas em paralelo (padrão: BATCH_MAX_CONCURRENCY)
+    max_concurrency: int | None = Field(default=None, ge=1, le=64)
+
+def to_turns(history: List[Message]) -> list[tuple[str, str]]:
+    """Converte o histórico do formato do frontend em turnos (pergunta, resposta)."""
+    turns, question = [], None
     for msg in history:
         if msg.sender == 'user':
-            chat_history.append(HumanMessage(content=msg.text))
+            if question is not None:
+                turns.append((question, ""))
+            question = msg.text
         else: # 'bot'
-            chat_history.append(AIMessage(content=msg.text))
-            
-    # Chama o agente com a pergunta e o histórico convertido
-    async for chunk in maf_agent_instance.ask(question, chat_history):
-        yield chunk
-        await asyncio.sleep(0.01) # Pequeno delay para não sobrecarregar
+            turns.append((question or "", msg.text))
+            question = None
+    if question is not None:
+        turns.append((question, ""))
+    return turns
+
+def get_tenant(http_request: Request) -> str:
+    """Cliente da requisição, pela chave de API ou pelo domínio; 401 sem credencial válida."""
+    if not agent_registry:
+        raise HTTPException(status_code=503, detail="Agente não está pronto.")
+    api_key = http_request.headers.get(API_KEY_HEADER)
+    authorization = http_request.headers.get("Authorization", "")
+    if not api_key and authorization.lower().startswith("bearer "):
+        api_key = authorization[7:].strip()
+    try:
+        return agent_registry.resolve_tenant(api_key, http_request.headers.get("host"))
+    except TenantAuthError as e:
+        raise HTTPException(status_code=401, detail=str(e), headers={"WWW-Authenticate": "Bearer"})
+
+def get_agent(http_request: Request, tenant: str | None = None):
+    """Retorna o agente do cliente da requisição, carregando-o se necessário."""
+    tenant = tenant or get_tenant(http_request)
+    try:
+        return agent_registry.get(tenant)
+    except UnknownTenantError:
+        raise HTTPException(status_code=404, detail=f"Cliente '{tenant}' não encontrado.")
+
+async def admit():
+    """Reserva uma vaga para a pergunta ou responde 429 (fila cheia) / 503 (espera expirada)."""
+    try:
+        return await admission.acquire()
+    except AdmissionRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail, headers={"Retry-After": str(e.retry_after)})
 
 @app.post("/ask", summary="Faz uma pergunta ao agente com streaming")
-async def ask_question(request: QuestionRequest):
+async def ask_question(request: QuestionRequest, http_request: Request):
     """
     Recebe uma pergunta e o histórico do chat, e retorna a resposta do agente 
-    de IA em tempo real (streaming).
+    de IA em tempo real (streaming). A geração é cancelada se o cliente se desconectar.
     """
-    if not maf_agent_instance:
-        raise HTTPException(status_code=503, detail="Agente não está pronto.")
-    
-    return StreamingResponse(
-        stream_generator(request.question, request.history), 
-        media_type="text/plain"
-    )
+    tenant = get_tenant(http_request)
+    slot = await admit()
+    # Qualquer erro antes de a resposta ser entregue ao servidor libera a vaga
+    try:
+        # A carga a frio de um cliente roda em uma thread para não travar o event loop
+        agent = await asyncio.to_thread(get_agent, http_request, tenant)
+
+        stats = {"timings": {"queue": round(slot.waited, 4)}}
+        # O prompt recebe só os turnos recentes da sessão e a lista dos produtos citados antes
+        find_products = agent.rewriter.mentioned_products
+        session = sessions.get_or_create(request.session_id, tenant)
+        if request.history and sessions.is_empty(session):
+            sessions.seed(session, to_turns(request.history), find_products)
+        stats["session_id"] = session.id
+        chunks = sessions.record(
+            session, request.question,
+            agent.ask(request.question, sessions.history(session, find_products), stats, session.id),
+            find_products,
+        )
+        # A vaga é mantida até o fim do streaming; a tarefa de fundo a libera também
+        # quando o corpo nem chega a ser iniciado
+        return StreamingResponse(
+            admission.hold(slot, stream_events(http_request, chunks, request.stream_format, stats)),
+            media_type=MEDIA_TYPES[request.stream_format],
+            headers={SESSION_HEADER: session.id},
+            background=BackgroundTask(slot.release),
+        )
+    except BaseException:
+        slot.release()
+        raise
+
+@app.post("/ask/batch", summary="Responde uma lista de perguntas, com os resultados em NDJSON")
+async def ask_batch(request: BatchQuestionRequest, http_request: Request):
+    """
+    Responde várias perguntas independentes de uma vez. Cada resposta é enviada como uma linha
+    NDJSON ('result') assim que fica pronta, seguida de uma linha final 'done' com o resumo.
+    Cada pergunta em geração ocupa uma vaga do controle de admissão, como uma pergunta do
+    /ask, e um lote nunca gera mais respostas simultâneas do que o limite do servidor.
+    """
+    tenant = get_tenant(http_request)
+    # Recusa o lote de imediato se nem uma pergunta caberia agora
+    (await admit()).release()
+    agent = await asyncio.to_thread(get_agent, http_request, tenant)
+    max_concurrency = min(request.max_concurrency or BATCH_MAX_CONCURRENCY, admission.max_concurrency)
+
+    async def results():
+        start = time.perf_counter()
+        errors = 0
+        async for result in agent.ask_batch(request.questions, max_concurrency, admission):
+            errors += "error" in result
+            yield format_event("ndjson", "result", result)
+        summary = {"questions": len(request.questions), "errors": errors, "seconds": round(time.perf_counter() - start, 3)}
+        yield format_event("ndjson", "done", {"stats": summary})
+
+    return StreamingResponse(results(), media_type=MEDIA_TYPES["ndjson"])
+
+@app.delete("/sessions/{session_id}", summary="Encerra uma conversa")
+def delete_session(session_id: str, http_request: Request):
+    """
+    Descarta o histórico de uma conversa guardada no servidor.
+    """
+    if not sessions.delete(session_id, get_tenant(http_request)):
+        raise HTTPException(status_code=404, detail="Sessão não encontrada.")
+    return {"deleted": session_id}
 
 @app.get("/", summary="Endpoint de verificação")
 def read_root():
@@ -92,15 +210,39 @@ def read_root():
     return {"message": "Bem-vindo à API do MAF (My Agent Friend)!"}
 
 @app.get("/suggest-questions", summary="Sugere perguntas com base nos documentos")
-def suggest_questions():
+def suggest_questions(http_request: Request):
     """
     Retorna uma lista de perguntas sugeridas geradas pela IA.
     """
-    if not maf_agent_instance:
-        raise HTTPException(status_code=503, detail="Agente não está pronto.")
-    suggestions = maf_agent_instance.get_suggested_questions()
+    suggestions = get_agent(http_request).get_suggested_questions()
     return {"suggestions": suggestions}
 
+@app.get("/ready", summary="Prontidão do agente e versão do índice carregado")
+def ready(http_request: Request):
+    """
+    Retorna 200 quando o agente do cliente tem um índice carregado, com a versão em uso,
+    e 503 enquanto a primeira versão ainda está sendo construída.
+    """
+    agent = get_agent(http_request)
+    content = {"ready": agent.is_ready, "index_version": agent.index_version}
+    return JSONResponse(content=content, status_code=200 if agent.is_ready else 503)
+
+@app.get("/metrics", summary="Métricas no formato do Prometheus", response_class=PlainTextResponse)
+def metrics():
+    """
+    Histogramas de duração por etapa do /ask e da ingestão, tamanhos de contexto e de resposta.
+    """
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/tenants/stats", summary="Estatísticas do registro de clientes")
+def tenant_stats():
+    """
+    Retorna acertos/falhas do registro, cargas a frio, descartes e memória estimada por cliente.
+    """
+    if not agent_registry:
+        raise HTTPException(status_code=503, detail="Agente não está pronto.")
+    return agent_registry.get_stats()
+
 if __name__ == "__main__":
     import uvicorn
     # Para rodar localmente: uvicorn main:app --reload --port 8000
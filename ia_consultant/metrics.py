@@ -0,0 +1,208 @@
+import os
+import time
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Métricas do agente no formato texto do Prometheus, expostas em /metrics.
+# Os valores ficam em memória e são por processo: com vários workers, cada um
+# expõe os seus (o Prometheus agrega por instância).
+SLOW_REQUEST_SECONDS = float(os.getenv("SLOW_REQUEST_SECONDS", "5"))
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+TOKEN_BUCKETS = (50, 100, 250, 500, 1000, 2000, 4000, 8000, 16000)
+SIZE_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000)
+
+
+def _escape_label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape_label(value)}"' for key, value in labels.items()) + "}"
+
+
+def _format_number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._values.items())
+            for key, value in items:
+                lines.extend(self._render_value(dict(zip(self.labelnames, key)), value))
+        return lines
+
+
+class Counter(_Metric):
+    """Contador monotônico, opcionalmente com rótulos."""
+
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _render_value(self, labels: dict, value) -> list[str]:
+        return [f"{self.name}{_format_labels(labels)} {_format_number(value)}"]
+
+
+class Gauge(_Metric):
+    """Valor instantâneo que pode subir e descer (ex: requisições em andamento)."""
+
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def _render_value(self, labels: dict, value) -> list[str]:
+        return [f"{self.name}{_format_labels(labels)} {_format_number(value)}"]
+
+
+class Histogram(_Metric):
+    """Histograma com faixas (buckets) cumulativas, soma e contagem, como no Prometheus."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total, count = self._values.get(key) or ([0] * len(self.buckets), 0.0, 0)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self._values[key] = (counts, total + value, count + 1)
+
+    def _render_value(self, labels: dict, value) -> list[str]:
+        counts, total, count = value
+        lines = [
+            f"{self.name}_bucket{_format_labels({**labels, 'le': _format_number(bound)})} {n}"
+            for bound, n in zip(self.buckets, counts)
+        ]
+        lines.append(f"{self.name}_bucket{_format_labels({**labels, 'le': '+Inf'})} {count}")
+        lines.append(f"{self.name}_sum{_format_labels(labels)} {_format_number(total)}")
+        lines.append(f"{self.name}_count{_format_labels(labels)} {count}")
+        return lines
+
+
+REGISTRY: list[_Metric] = []
+
+
+def render_metrics() -> str:
+    """Todas as métricas registradas, no formato de exposição texto do Prometheus."""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# --- Métricas do /ask ---
+ASK_STAGE_SECONDS = Histogram(
+    "maf_ask_stage_seconds",
+    "Duração de cada etapa do /ask (reescrita, embedding, buscas, geração, total).",
+    ("stage",),
+)
+ASK_REQUESTS = Counter(
+    "maf_ask_requests_total",
+    "Perguntas respondidas, por caminho da reescrita e uso do cache de respostas.",
+    ("rewrite_path", "answer_cache"),
+)
+ASK_CONTEXT_TOKENS = Histogram("maf_ask_context_tokens", "Tokens do CONTEXTO enviado ao LLM.", buckets=TOKEN_BUCKETS)
+ASK_CONTEXT_DOCUMENTS = Histogram("maf_ask_context_documents", "Fichas no CONTEXTO enviado ao LLM.", buckets=SIZE_BUCKETS)
+ASK_ANSWER_TOKENS = Histogram("maf_ask_answer_tokens", "Tokens da resposta gerada.", buckets=TOKEN_BUCKETS)
+ASK_SLOW_REQUESTS = Counter("maf_ask_slow_requests_total", "Perguntas que levaram mais que SLOW_REQUEST_SECONDS.")
+RETRIEVAL_ROUTES = Counter(
+    "maf_retrieval_route_total",
+    "Buscas no catálogo, por caminho (nome do produto, filtro de propriedades ou busca híbrida).",
+    ("route",),
+)
+
+# --- Controle de admissão do /ask ---
+ADMISSION_ACTIVE = Gauge("maf_admission_active", "Perguntas sendo respondidas agora.")
+ADMISSION_WAITING = Gauge("maf_admission_waiting", "Perguntas aguardando na fila de admissão.")
+ADMISSION_WAIT_SECONDS = Histogram("maf_admission_wait_seconds", "Tempo de espera na fila de admissão.")
+ADMISSION_REJECTED = Counter(
+    "maf_admission_rejected_total", "Perguntas recusadas pelo controle de admissão, por motivo.", ("reason",)
+)
+
+# --- Métricas da ingestão ---
+INGEST_STAGE_SECONDS = Histogram(
+    "maf_ingest_stage_seconds",
+    "Duração de cada etapa da sincronização do índice (tradução, embeddings, gravação).",
+    ("stage",),
+)
+INGEST_FILES = Counter("maf_ingest_files_total", "Arquivos do catálogo traduzidos, por resultado.", ("result",))
+INGEST_EMBEDDING_BATCH_SECONDS = Histogram(
+    "maf_ingest_embedding_batch_seconds", "Duração de cada lote de embeddings da ingestão."
+)
+INGEST_EMBEDDING_BATCH_DOCUMENTS = Histogram(
+    "maf_ingest_embedding_batch_documents", "Documentos por lote de embeddings da ingestão.", buckets=SIZE_BUCKETS
+)
+
+
+# --- Spans por requisição ---
+# As durações de cada etapa são somadas no dicionário da requisição em andamento
+# (inclusive dentro do retriever, que roda em outra thread com o mesmo contexto).
+_request_timings: ContextVar[dict | None] = ContextVar("request_timings", default=None)
+
+
+def start_request_timings(timings: dict):
+    """Passa a registrar os spans da requisição atual em `timings`. Retorna o token para `end_request_timings`."""
+    return _request_timings.set(timings)
+
+
+def end_request_timings(token):
+    try:
+        _request_timings.reset(token)
+    except ValueError:
+        # O gerador foi finalizado em outro contexto (ex: cancelamento); não há o que restaurar
+        pass
+
+
+def record_span(stage: str, seconds: float, histogram: Histogram = ASK_STAGE_SECONDS):
+    """Registra a duração de uma etapa no histograma e nos tempos da requisição atual."""
+    histogram.observe(seconds, stage=stage)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings[stage] = round(timings.get(stage, 0.0) + seconds, 4)
+
+
+@contextmanager
+def span(stage: str, histogram: Histogram = ASK_STAGE_SECONDS):
+    """Mede a duração do bloco como uma etapa (ver `record_span`)."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_span(stage, time.perf_counter() - start, histogram)
@@ -0,0 +1,132 @@
+import os
+import re
+import json
+from difflib import SequenceMatcher
+
+from property_index import normalize_text
+
+# Índice dos nomes de produtos, salvo junto com o índice FAISS. Cada produto é registrado
+# pelo nome e por apelidos comuns (sem o prefixo da empresa, com ou sem espaços e hífens:
+# 'CPE PP-101', 'PP 101', 'pp101'). As perguntas são varridas uma única vez contra todos os
+# padrões; códigos escritos com pequenos erros são aceitos por similaridade.
+PRODUCT_NAMES_FILE = "product_names.json"
+MAX_NAME_WORDS = 8
+FUZZY_MIN_RATIO = 0.85
+# Um prefixo presente em mais da metade dos nomes (ex: 'CPE') é tratado como opcional
+COMMON_PREFIX_SHARE = 0.5
+
+
+def _compact(words: list[str]) -> str:
+    return "".join(words)
+
+
+def _has_digit(text: str) -> bool:
+    return any(c.isdigit() for c in text)
+
+
+class ProductNameIndex:
+    """Casamento exato e aproximado de nomes de produtos em perguntas."""
+
+    def __init__(self, products: dict, aliases: dict):
+        self.products = products    # nome -> IDs das fichas do produto
+        self.aliases = aliases      # apelido compacto (sem espaços) -> nomes
+        self._by_digits = {}
+        for alias, names in aliases.items():
+            for digits in re.findall(r'\d+', alias):
+                self._by_digits.setdefault(digits, {}).setdefault(alias, names)
+
+    @classmethod
+    def build(cls, doc_ids: list[str], product_names: list[str]) -> "ProductNameIndex":
+        """Constrói o índice a partir das fichas (ID e nome do produto de cada uma)."""
+        products = {}
+        for doc_id, name in zip(doc_ids, product_names):
+            if name and normalize_text(name):
+                products.setdefault(name, []).append(doc_id)
+
+        first_words = {}
+        for name in products:
+            words = normalize_text(name).split()
+            if len(words) > 1:
+                first_words[words[0]] = first_words.get(words[0], 0) + 1
+        prefixes = {word for word, count in first_words.items() if count > COMMON_PREFIX_SHARE * len(products)}
+
+        aliases = {}
+        for name in products:
+            words = normalize_text(name).split()
+            forms = [words]
+            if len(words) > 1 and words[0] in prefixes:
+                forms.append(words[1:])
+            for form in forms:
+                names = aliases.setdefault(_compact(form), [])
+                if name not in names:
+                    names.append(name)
+        return cls(products, aliases)
+
+    def save(self, index_path: str):
+        tmp_path = os.path.join(index_path, PRODUCT_NAMES_FILE + ".tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"products": self.products, "aliases": self.aliases}, f, ensure_ascii=False)
+        os.replace(tmp_path, os.path.join(index_path, PRODUCT_NAMES_FILE))
+
+    @classmethod
+    def load(cls, index_path: str) -> "ProductNameIndex | None":
+        path = os.path.join(index_path, PRODUCT_NAMES_FILE)
+        if not os.path.exists(path):
+            return None
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        return cls(data["products"], data["aliases"])
+
+    def __len__(self):
+        return len(self.products)
+
+    def _fuzzy(self, candidate: str) -> list[str]:
+        """Apelido mais parecido entre os que têm exatamente os mesmos números (ex: 'cpe p 101' -> 'CPE PP 101')."""
+        best, best_ratio = None, FUZZY_MIN_RATIO
+        for digits in set(re.findall(r'\d+', candidate)):
+            for alias, names in self._by_digits.get(digits, {}).items():
+                ratio = SequenceMatcher(None, candidate, alias).ratio()
+                if ratio > best_ratio:
+                    best, best_ratio = names, ratio
+        return best or []
+
+    def find(self, text: str, fuzzy: bool = True) -> list[str]:
+        """
+        Nomes dos produtos citados no texto, na ordem em que aparecem. Em cada posição vale o
+        trecho mais longo que casa com um apelido; só trechos com números são buscados por similaridade.
+        """
+        words = normalize_text(text).split()
+        found = []
+        start = 0
+        while start < len(words):
+            match, length = None, 0
+            for size in range(min(MAX_NAME_WORDS, len(words) - start), 0, -1):
+                names = self.aliases.get(_compact(words[start:start + size]))
+                if names:
+                    match, length = names, size
+                    break
+            if match is None and fuzzy:
+                for size in range(min(3, len(words) - start), 0, -1):
+                    candidate = _compact(words[start:start + size])
+                    if _has_digit(candidate) and len(candidate) >= 4:
+                        names = self._fuzzy(candidate)
+                        if names:
+                            match, length = names, size
+                            break
+            if match:
+                found.extend(name for name in match if name not in found)
+                start += length
+            else:
+                start += 1
+        return found
+
+    def document_ids(self, names: list[str]) -> list[str]:
+        """IDs das fichas dos produtos, na ordem dos nomes."""
+        return [doc_id for name in names for doc_id in self.products.get(name, [])]
+
+
+def build_product_name_index(property_index, index_path: str) -> ProductNameIndex:
+    """Constrói e salva o índice de nomes a partir do índice de propriedades."""
+    name_index = ProductNameIndex.build(property_index.doc_ids, property_index.product_names)
+    name_index.save(index_path)
+    return name_index
@@ -0,0 +1,254 @@
+import os
+import re
+import json
+import unicodedata
+
+import numpy as np
+
+# Tabela colunar com as propriedades de cada Ficha Técnica, salva ao lado do índice FAISS.
+# Os valores numéricos são normalizados para uma unidade canônica, o que permite
+# responder filtros como "densidade entre 1,1 e 1,3" sem depender da leitura do LLM.
+PROPERTY_ROWS_FILE = "properties.json"
+PROPERTY_TABLE_FILE = "properties.npz"
+
+NUMBER_PATTERN = r'[-+]?\d+(?:[.,]\d+)*'
+
+# Unidade encontrada -> (unidade canônica, fator de conversão)
+UNIT_CONVERSIONS = {
+    "kg/m3": ("g/cm3", 0.001),
+    "g/l": ("g/cm3", 0.001),
+    "g/ml": ("g/cm3", 1.0),
+    "kgf/cm2": ("mpa", 0.0980665),
+    "psi": ("mpa", 0.00689476),
+    "gpa": ("mpa", 1000.0),
+    "kpa": ("mpa", 0.001),
+    "n/mm2": ("mpa", 1.0),
+    "kj/m2": ("kj/m2", 1.0),
+    "j/m": ("j/m", 1.0),
+}
+
+# Radical da palavra de comparação (sem acentos) -> tipo de filtro
+COMPARISON_WORDS = {
+    "maior": "min", "acima": "min", "superior": "min", "minim": "min",
+    "menor": "max", "abaixo": "max", "inferior": "max", "maxim": "max",
+    "igual": "equals",
+}
+
+
+def normalize_text(text: str) -> str:
+    """Remove acentos, converte para minúsculas e colapsa tudo que não é letra ou número."""
+    text = unicodedata.normalize('NFKD', str(text))
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return re.sub(r'[^a-z0-9]+', ' ', text.lower()).strip()
+
+
+def parse_number(text: str) -> float | None:
+    """
+    Converte um número no formato brasileiro ou internacional ('1.150,5', '1,15', '1.15').
+    Um ponto seguido de exatamente três dígitos separa milhares ('1.250', '2.000.000').
+    """
+    if '.' in text and ',' in text:
+        text = text.replace('.', '').replace(',', '.')
+    elif ',' in text:
+        text = text.replace(',', '.')
+    elif re.fullmatch(r'[-+]?[1-9]\d{0,2}(?:\.\d{3})+', text):
+        text = text.replace('.', '')
+    try:
+        return float(text)
+    except ValueError:
+        return None
+
+
+def normalize_unit(unit: str) -> str:
+    unit = unit.strip().lower().replace('³', '3').replace('²', '2').replace(' ', '')
+    return unit.replace('°', '').replace('º', '')
+
+
+def parse_value(value) -> tuple[float | None, str]:
+    """
+    Extrai o valor numérico e a unidade de um valor de propriedade (ex: '1,15 g/cm³').
+    O valor é convertido para a unidade canônica quando ela é conhecida.
+    """
+    if isinstance(value, bool):
+        return None, ""
+    if isinstance(value, (int, float)):
+        return float(value), ""
+    match = re.search(NUMBER_PATTERN, str(value))
+    if not match:
+        return None, ""
+    number = parse_number(match.group(0))
+    if number is None:
+        return None, ""
+    unit = normalize_unit(str(value)[match.end():].split('(')[0])
+    # Descarta o segundo número de faixas como '1,1 - 1,3 g/cm³' ao extrair a unidade
+    unit = re.sub(r'^[-–a]?' + NUMBER_PATTERN, '', unit)
+    if unit in UNIT_CONVERSIONS:
+        unit, factor = UNIT_CONVERSIONS[unit]
+        number *= factor
+    return number, unit
+
+
+class PropertyIndex:
+    """Índice colunar (NumPy) das propriedades das fichas, para filtros exatos por faixa ou igualdade."""
+
+    def __init__(self, doc_ids, product_names, labels, numeric, units, texts):
+        self.doc_ids = doc_ids                  # list[str], uma linha por ficha
+        self.product_names = product_names      # list[str]
+        self.labels = labels                    # coluna -> nome original da propriedade
+        self.numeric = numeric                  # coluna -> np.ndarray[float64] (NaN = ausente)
+        self.units = units                      # coluna -> unidade canônica
+        self.texts = texts                      # coluna -> np.ndarray[str] normalizado
+
+    @classmethod
+    def build(cls, rows: list[dict]) -> "PropertyIndex":
+        """Constrói a tabela a partir de linhas {'doc_id', 'product_name', 'properties'}."""
+        doc_ids = [row["doc_id"] for row in rows]
+        product_names = [row["product_name"] for row in rows]
+        labels, raw_columns = {}, {}
+        for i, row in enumerate(rows):
+            for name, value in row["properties"].items():
+                column = normalize_text(name)
+                # O nome do produto já está em product_names e não é uma propriedade filtrável
+                if not column or column == "produto" or value is None:
+                    continue
+                labels.setdefault(column, name)
+                raw_columns.setdefault(column, {})[i] = value
+
+        numeric, units, texts = {}, {}, {}
+        for column, values in raw_columns.items():
+            numbers = np.full(len(rows), np.nan)
+            text_values = np.full(len(rows), "", dtype=object)
+            unit_counts = {}
+            for i, value in values.items():
+                number, unit = parse_value(value)
+                if number is not None:
+                    numbers[i] = number
+                    unit_counts[unit] = unit_counts.get(unit, 0) + 1
+                text_values[i] = normalize_text(value)
+            if unit_counts:
+                numeric[column] = numbers
+                units[column] = max(unit_counts, key=unit_counts.get)
+            texts[column] = text_values.astype(str)
+        return cls(doc_ids, product_names, labels, numeric, units, texts)
+
+    def save(self, index_path: str):
+        arrays = {f"num:{column}": values for column, values in self.numeric.items()}
+        arrays.update({f"txt:{column}": values for column, values in self.texts.items()})
+        np.savez_compressed(os.path.join(index_path, PROPERTY_TABLE_FILE), **arrays)
+        meta = {"doc_ids": self.doc_ids, "product_names": self.product_names, "labels": self.labels, "units": self.units}
+        with open(os.path.join(index_path, PROPERTY_TABLE_FILE + ".json"), 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, index_path: str) -> "PropertyIndex | None":
+        table_path = os.path.join(index_path, PROPERTY_TABLE_FILE)
+        if not os.path.exists(table_path):
+            return None
+        with open(table_path + ".json", 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        numeric, texts = {}, {}
+        with np.load(table_path, allow_pickle=False) as data:
+            for name in data.files:
+                kind, column = name.split(":", 1)
+                (numeric if kind == "num" else texts)[column] = data[name]
+        return cls(meta["doc_ids"], meta["product_names"], meta["labels"], numeric, meta["units"], texts)
+
+    def __len__(self):
+        return len(self.doc_ids)
+
+    def resolve_column(self, name: str) -> str | None:
+        """Encontra a coluna correspondente a um nome de propriedade (exato ou por prefixo)."""
+        key = normalize_text(name)
+        if key in self.texts:
+            return key
+        candidates = [column for column in self.texts if column.startswith(key + " ") or key.startswith(column + " ")]
+        return min(candidates, key=len) if candidates else None
+
+    def mask(self, column: str, minimum: float | None = None, maximum: float | None = None, equals=None) -> np.ndarray:
+        """Retorna a máscara booleana das fichas que satisfazem o filtro na coluna."""
+        if equals is not None and not isinstance(equals, (int, float)):
+            return self.texts[column] == normalize_text(equals)
+        values = self.numeric.get(column)
+        if values is None:
+            return np.zeros(len(self), dtype=bool)
+        result = ~np.isnan(values)
+        if equals is not None:
+            result &= np.isclose(values, equals)
+        if minimum is not None:
+            result &= values >= minimum
+        if maximum is not None:
+            result &= values <= maximum
+        return result
+
+    def query(self, filters: list[dict]) -> list[str]:
+        """Aplica todos os filtros (E lógico) e retorna os IDs dos documentos correspondentes."""
+        result = np.ones(len(self), dtype=bool)
+        for f in filters:
+            result &= self.mask(f["column"], f.get("min"), f.get("max"), f.get("equals"))
+        return [self.doc_ids[i] for i in np.flatnonzero(result)]
+
+    def parse_filters(self, question: str) -> list[dict]:
+        """
+        Identifica filtros numéricos em uma pergunta, como 'densidade entre 1,1 e 1,3',
+        'fluidez acima de 10' ou 'dureza igual a 60'. Apenas colunas numéricas são consideradas.
+        """
+        # Os números são convertidos antes (ex: '1.150,5' -> '1150.5'); normalize_text
+        # transforma o ponto decimal em espaço, desfeito em _to_float
+        text = normalize_text(re.sub(r'\d+(?:[.,]\d+)*', _canonical_number, question))
+        number = r'(\d+(?: \d+)?)'
+        filters = []
+        for column in sorted(self.numeric, key=len, reverse=True):
+            position = f" {text} ".find(f" {column} ")
+            if position < 0:
+                continue
+            tail = text[position + len(column):][:60]
+            # Evita que uma coluna mais curta (ex: 'densidade') case com o mesmo trecho de novo
+            text = text[:position] + " " + text[position + len(column):]
+
+            match = re.match(rf'\s*(?:\w+\s+){{0,2}}?entre {number} e {number}', tail)
+            if match:
+                low, high = sorted([_to_float(match.group(1)), _to_float(match.group(2))])
+                filters.append({"column": column, "min": low, "max": high})
+                continue
+            match = re.match(rf'\s*(?:\w+\s+){{0,2}}?({"|".join(COMPARISON_WORDS)})\w*(?: (?:que|de|a|do|da))* {number}', tail)
+            if match:
+                operator, value = COMPARISON_WORDS[match.group(1)], _to_float(match.group(2))
+                filters.append({"column": column, operator: value})
+        return filters
+
+
+def _canonical_number(match) -> str:
+    number = parse_number(match.group(0))
+    return match.group(0) if number is None else format(number, 'f').rstrip('0').rstrip('.')
+
+
+def _to_float(text: str) -> float:
+    # normalize_text transforma '1.15' em '1 15'; o espaço volta a ser o separador decimal
+    return float(text.replace(' ', '.'))
+
+
+def update_property_rows(index_path: str, rows_by_file: dict, removed: list[str],
+                         rebuild: bool = True) -> PropertyIndex | None:
+    """
+    Atualiza as linhas de propriedades por arquivo (novos, alterados e removidos)
+    e reconstrói a tabela colunar. Não há re-processamento das fichas inalteradas.
+    Com `rebuild=False` (salvamentos intermediários), só as linhas são gravadas.
+    """
+    rows_path = os.path.join(index_path, PROPERTY_ROWS_FILE)
+    all_rows = {}
+    if os.path.exists(rows_path):
+        with open(rows_path, 'r', encoding='utf-8') as f:
+            all_rows = json.load(f)
+    for key in removed:
+        all_rows.pop(key, None)
+    all_rows.update(rows_by_file)
+
+    os.makedirs(index_path, exist_ok=True)
+    with open(rows_path, 'w', encoding='utf-8') as f:
+        json.dump(all_rows, f, ensure_ascii=False)
+    if not rebuild:
+        return None
+
+    property_index = PropertyIndex.build([row for key in sorted(all_rows) for row in all_rows[key]])
+    property_index.save(index_path)
+    return property_index
@@ -0,0 +1,57 @@
+import os
+import threading
+
+import httpx
+from langchain_core.rate_limiters import InMemoryRateLimiter
+
+# Recursos compartilhados por provedor (OpenAI ou Google): um pool de conexões HTTP
+# reutilizado pelo LLM e pelos embeddings e um token bucket ajustado à cota do provedor,
+# para que um pico de acessos seja espaçado aqui em vez de virar uma série de 429.
+# 0 requisições por segundo desativa o token bucket.
+LLM_REQUESTS_PER_SECOND = float(os.getenv("LLM_REQUESTS_PER_SECOND", "0"))
+LLM_MAX_BURST = int(os.getenv("LLM_MAX_BURST", "10"))
+EMBEDDING_REQUESTS_PER_SECOND = float(os.getenv("EMBEDDING_REQUESTS_PER_SECOND", "0"))
+EMBEDDING_MAX_BURST = int(os.getenv("EMBEDDING_MAX_BURST", "10"))
+# Tentativas e timeout das chamadas ao provedor. Os SDKs repetem com backoff exponencial
+# com jitter e respeitam o Retry-After dos 429.
+PROVIDER_MAX_RETRIES = int(os.getenv("PROVIDER_MAX_RETRIES", "4"))
+PROVIDER_TIMEOUT = float(os.getenv("PROVIDER_TIMEOUT", "60"))
+PROVIDER_MAX_CONNECTIONS = int(os.getenv("PROVIDER_MAX_CONNECTIONS", "64"))
+
+_lock = threading.Lock()
+_rate_limiters = {}
+_http_clients = {}
+
+
+def rate_limiter(provider: str, kind: str = "llm") -> InMemoryRateLimiter | None:
+    """Token bucket compartilhado do provedor para o LLM (`kind='llm'`) ou para os embeddings."""
+    rate, burst = (
+        (LLM_REQUESTS_PER_SECOND, LLM_MAX_BURST) if kind == "llm"
+        else (EMBEDDING_REQUESTS_PER_SECOND, EMBEDDING_MAX_BURST)
+    )
+    if rate <= 0:
+        return None
+    with _lock:
+        key = (provider, kind)
+        if key not in _rate_limiters:
+            _rate_limiters[key] = InMemoryRateLimiter(
+                requests_per_second=rate,
+                check_every_n_seconds=min(0.1, 1 / rate),
+                max_bucket_size=burst,
+            )
+        return _rate_limiters[key]
+
+
+def http_clients(provider: str) -> tuple[httpx.Client, httpx.AsyncClient]:
+    """Clientes HTTP (síncrono e assíncrono) com pool de conexões, um par por provedor."""
+    with _lock:
+        if provider not in _http_clients:
+            limits = httpx.Limits(
+                max_connections=PROVIDER_MAX_CONNECTIONS, max_keepalive_connections=PROVIDER_MAX_CONNECTIONS
+            )
+            timeout = httpx.Timeout(PROVIDER_TIMEOUT, connect=10.0)
+            _http_clients[provider] = (
+                httpx.Client(limits=limits, timeout=timeout),
+                httpx.AsyncClient(limits=limits, timeout=timeout),
+            )
+        return _http_clients[provider]
@@ -0,0 +1,108 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+from property_index import normalize_text
+from product_names import ProductNameIndex
+
+# Palavras que indicam que a pergunta depende do histórico para ser entendida
+ANAPHORA_WORDS = {
+    "ele", "ela", "eles", "elas", "dele", "dela", "deles", "delas", "nele", "nela", "neles", "nelas",
+    "isso", "isto", "disso", "disto", "nisso", "esse", "essa", "esses", "essas", "desse", "dessa",
+    "desses", "dessas", "este", "esta", "estes", "estas", "deste", "desta", "aquele", "aquela",
+    "daquele", "daquela", "mesmo", "mesma", "anterior", "primeiro", "segundo", "ultimo", "acima",
+    "lo", "la", "los", "las",
+}
+# Começos típicos de perguntas elípticas ("e a cor?", "também em preto?")
+ELLIPSIS_STARTS = {"e", "mas", "entao", "tambem", "agora", "so", "ou"}
+MIN_SELF_CONTAINED_WORDS = 4
+REWRITE_MEMO_MAX_ENTRIES = 2000
+# Mensagens mais recentes do histórico que entram na chave do memo (o último turno: pergunta e resposta)
+REWRITE_MEMO_MESSAGES = 2
+
+
+class QuestionRewriter:
+    """
+    Gera a pergunta independente usada na busca. O LLM só é chamado quando a pergunta
+    realmente depende do histórico; perguntas autocontidas seguem direto para a busca,
+    e reescritas recentes de cada conversa ficam memorizadas.
+    """
+
+    def __init__(self, contextualize_chain, name_index: ProductNameIndex | None = None,
+                 memo_max_entries: int = REWRITE_MEMO_MAX_ENTRIES):
+        self.contextualize_chain = contextualize_chain
+        self.memo_max_entries = memo_max_entries
+        self.path_counts = {}
+        self.name_index = name_index
+        self._memo = OrderedDict()
+        self._lock = threading.Lock()
+
+    def set_name_index(self, name_index: ProductNameIndex | None):
+        """
+        Atualiza o índice de nomes de produtos (chamado a cada troca de versão do índice). É o
+        mesmo usado pela busca, para que apelidos e nomes aproximados valham nos dois lugares.
+        """
+        self.name_index = name_index
+
+    def mentioned_products(self, text: str) -> list[str]:
+        """Nomes dos produtos do catálogo citados no texto, na ordem em que aparecem."""
+        name_index = self.name_index
+        return name_index.find(text) if name_index else []
+
+    def names_product(self, question: str) -> bool:
+        """Verifica se a pergunta cita algum produto do catálogo pelo nome."""
+        return bool(self.mentioned_products(question))
+
+    def is_self_contained(self, question: str) -> bool:
+        """Heurística: a pergunta cita um produto, ou não tem pronomes nem elipse."""
+        if self.names_product(question):
+            return True
+        words = normalize_text(question).split()
+        if len(words) < MIN_SELF_CONTAINED_WORDS or words[0] in ELLIPSIS_STARTS:
+            return False
+        return not ANAPHORA_WORDS.intersection(words)
+
+    @staticmethod
+    def _memo_key(question: str, chat_history: list, conversation_id: str | None) -> str:
+        """
+        Chave do memo: a conversa, o último turno e a pergunta. O histórico inteiro mudaria a
+        cada turno, e a mesma pergunta elíptica repetida na conversa nunca seria reaproveitada.
+        """
+        digest = hashlib.sha256(f"{conversation_id or ''}\n".encode('utf-8'))
+        for message in chat_history[-REWRITE_MEMO_MESSAGES:]:
+            digest.update(f"{message.type}:{message.content}\n".encode('utf-8'))
+        digest.update(normalize_text(question).encode('utf-8'))
+        return digest.hexdigest()
+
+    def _count(self, path: str):
+        self.path_counts[path] = self.path_counts.get(path, 0) + 1
+
+    async def rewrite(self, question: str, chat_history: list, conversation_id: str | None = None) -> tuple[str, str]:
+        """
+        Retorna (pergunta independente, caminho usado). O caminho é 'sem_historico',
+        'rapido' (heurística), 'memo' (reescrita já feita nesta conversa) ou 'llm'.
+        `conversation_id` (ex: o ID da sessão) separa o memo de conversas diferentes.
+        """
+        if not chat_history:
+            path, standalone_question = "sem_historico", question
+        elif self.is_self_contained(question):
+            path, standalone_question = "rapido", question
+        else:
+            key = self._memo_key(question, chat_history, conversation_id)
+            with self._lock:
+                standalone_question = self._memo.get(key)
+                if standalone_question is not None:
+                    self._memo.move_to_end(key)
+            if standalone_question is not None:
+                path = "memo"
+            else:
+                path = "llm"
+                standalone_question = await self.contextualize_chain.ainvoke(
+                    {"input": question, "chat_history": chat_history}
+                )
+                with self._lock:
+                    self._memo[key] = standalone_question
+                    while len(self._memo) > self.memo_max_entries:
+                        self._memo.popitem(last=False)
+        self._count(path)
+        return standalone_question, path
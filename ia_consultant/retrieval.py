@@ -0,0 +1,236 @@
+import os
+import re
+
+import faiss
+import numpy as np
+from pydantic import ConfigDict
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from langchain_community.vectorstores import FAISS
+
+from property_index import PropertyIndex, normalize_text
+from product_names import ProductNameIndex
+from bm25_index import BM25Index, reciprocal_rank_fusion
+from metrics import RETRIEVAL_ROUTES, span
+from ann_index import refine_search
+
+# Quantidade final de fichas enviadas ao LLM e candidatos de cada busca antes da fusão
+RETRIEVAL_K = int(os.getenv("RETRIEVAL_K", "10"))
+DENSE_K = int(os.getenv("DENSE_K", "20"))
+LEXICAL_K = int(os.getenv("LEXICAL_K", "20"))
+RRF_K = int(os.getenv("RRF_K", "60"))
+# Perguntas por chamada de embeddings na busca em lote
+QUERY_EMBEDDING_BATCH_SIZE = int(os.getenv("QUERY_EMBEDDING_BATCH_SIZE", "256"))
+# Perguntas que citam um produto mas pedem outros (ex: 'algo parecido com o PP 101') ainda
+# passam pela busca; as fichas do produto citado só entram na frente dos resultados.
+BROADEN_PATTERN = re.compile(
+    r'\b(similar\w*|parecid\w*|semelhante\w*|alternativ\w*|substitu\w*|equivalente\w*'
+    r'|outr[oa]s?|recomend\w*|indic[ae]\w*|sugir\w*|sugest\w*|melhor\w*)\b'
+)
+
+
+class CatalogRetriever(BaseRetriever):
+    """
+    Retriever do catálogo. Quando a pergunta cita produtos pelo nome (ex: 'densidade do
+    CPE PP-101'), as fichas deles são obtidas direto, sem embedding nem busca vetorial.
+    Quando contém filtros numéricos sobre propriedades
+    conhecidas (ex: 'densidade entre 1,1 e 1,3'), as fichas que satisfazem o filtro são
+    obtidas direto do índice de propriedades. Caso contrário, a busca vetorial do FAISS e a
+    busca lexical (BM25) são combinadas por Reciprocal Rank Fusion.
+    """
+
+    vector_store: FAISS
+    property_index: PropertyIndex | None = None
+    bm25_index: BM25Index | None = None
+    name_index: ProductNameIndex | None = None
+    # Índice exato (flat) usado para ordenar as fichas filtradas e reordenar os candidatos do
+    # IVF-PQ quando as buscas usam um índice aproximado; None quando o do vector_store já é o exato
+    exact_index: faiss.Index | None = None
+    k: int = RETRIEVAL_K
+    dense_k: int = DENSE_K
+    lexical_k: int = LEXICAL_K
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    def get_documents_by_ids(self, ids: list[str]) -> list[Document]:
+        """Busca documentos no docstore do FAISS pelos seus IDs, ignorando os inexistentes."""
+        documents = []
+        for doc_id in ids:
+            doc = self.vector_store.docstore.search(doc_id)
+            if isinstance(doc, Document):
+                documents.append(doc)
+        return documents
+
+    def filter_documents(self, query: str) -> list[Document] | None:
+        """
+        Aplica os filtros de propriedades encontrados na pergunta.
+        Retorna None se a pergunta não contém filtros, ou a lista (possivelmente vazia) de fichas.
+        """
+        if not self.property_index:
+            return None
+        with span("property_filter"):
+            filters = self.property_index.parse_filters(query)
+            matching_ids = self.property_index.query(filters) if filters else None
+        if not filters:
+            return None
+
+        print(f"Filtros de propriedades {filters}: {len(matching_ids)} fichas encontradas.")
+        if len(matching_ids) <= self.k:
+            return self.get_documents_by_ids(matching_ids)
+
+        # Mais fichas do que cabem no contexto: elas são ordenadas pela distância exata à pergunta
+        return self.rank_exact(query, matching_ids)
+
+    def _positions(self, ids: list[str]) -> dict:
+        """Posição de cada documento no índice FAISS."""
+        mapping = self.vector_store.index_to_docstore_id
+        lookup = getattr(mapping, "positions", None)
+        if lookup is not None:
+            return lookup(ids)
+        wanted = set(ids)
+        return {doc_id: position for position, doc_id in mapping.items() if doc_id in wanted}
+
+    def rank_exact(self, query: str, ids: list[str]) -> list[Document]:
+        """
+        As `k` fichas mais próximas da pergunta entre as informadas, com distâncias exatas.
+        A busca é restrita às posições dessas fichas no índice exato: um índice aproximado
+        (ex: IVF-PQ, que só percorre `nprobe` listas) deixaria de fora fichas que passaram no filtro.
+        """
+        positions = self._positions(ids)
+        if not positions:
+            return []
+        with span("embedding"):
+            embedding = self.vector_store.embeddings.embed_query(query)
+        with span("vector_search"):
+            index = self.exact_index if self.exact_index is not None else self.vector_store.index
+            selector = faiss.IDSelectorBatch(np.fromiter(positions.values(), dtype=np.int64))
+            _, found = index.search(
+                np.asarray([embedding], dtype=np.float32), min(self.k, len(positions)),
+                params=faiss.SearchParameters(sel=selector),
+            )
+        by_position = {position: doc_id for doc_id, position in positions.items()}
+        return self.get_documents_by_ids([by_position[int(p)] for p in found[0] if p >= 0])
+
+    def named_documents(self, query: str) -> tuple[list[Document], bool]:
+        """
+        Fichas dos produtos citados pelo nome na pergunta e se elas bastam como resposta
+        (False quando a pergunta pede outros produtos, ex: alternativas ou similares).
+        """
+        if not self.name_index:
+            return [], False
+        with span("name_lookup"):
+            names = self.name_index.find(query)
+            documents = self.get_documents_by_ids(self.name_index.document_ids(names)) if names else []
+        if not documents:
+            return [], False
+        print(f"Produtos citados na pergunta: {', '.join(names)}.")
+        return documents, not BROADEN_PATTERN.search(normalize_text(query))
+
+    @staticmethod
+    def _named_first(named: list[Document], documents: list[Document], k: int) -> list[Document]:
+        """Fichas dos produtos citados primeiro, completadas pelos demais resultados sem repetição."""
+        seen = {doc.id for doc in named}
+        return (named + [doc for doc in documents if doc.id not in seen])[:max(k, len(named))]
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> list[Document]:
+        named, sufficient = self.named_documents(query)
+        if sufficient:
+            RETRIEVAL_ROUTES.inc(route="product_name")
+            return named
+        documents = self.filter_documents(query)
+        if documents:
+            RETRIEVAL_ROUTES.inc(route="property_filter")
+        else:
+            RETRIEVAL_ROUTES.inc(route="hybrid")
+            documents = self.hybrid_search(query)
+        return self._named_first(named, documents, self.k) if named else documents
+
+    def hybrid_search(self, query: str) -> list[Document]:
+        """Busca densa (FAISS) + lexical (BM25), fundidas por Reciprocal Rank Fusion."""
+        # O embedding da pergunta é medido separadamente da busca no FAISS
+        with span("embedding"):
+            embedding = self.vector_store.embeddings.embed_query(query)
+        with span("vector_search"):
+            dense_docs = self.dense_search_batch([embedding], max(self.dense_k, self.k))[0]
+        return self._fuse_lexical(query, dense_docs)
+
+    def _fuse_lexical(self, query: str, dense_docs: list[Document]) -> list[Document]:
+        """Funde os resultados da busca densa com os da busca lexical (BM25) da mesma pergunta."""
+        if not self.bm25_index:
+            return dense_docs[:self.k]
+
+        by_id = {doc.id: doc for doc in dense_docs}
+        with span("lexical_search"):
+            lexical_ids = [doc_id for doc_id, _ in self.bm25_index.search(query, self.lexical_k)]
+        fused_ids = reciprocal_rank_fusion([list(by_id), lexical_ids], self.k, rrf_k=RRF_K)
+        for doc_id in fused_ids:
+            if doc_id not in by_id:
+                doc = self.vector_store.docstore.search(doc_id)
+                if isinstance(doc, Document):
+                    by_id[doc_id] = doc
+        return [by_id[doc_id] for doc_id in fused_ids if doc_id in by_id]
+
+    def embed_queries(self, queries: list[str]) -> list[list[float]]:
+        """Embeddings de várias perguntas, em poucas chamadas em lote ao provedor."""
+        embeddings = self.vector_store.embeddings
+        embed_batch = getattr(embeddings, "embed_queries", None)
+        vectors = []
+        for start in range(0, len(queries), QUERY_EMBEDDING_BATCH_SIZE):
+            chunk = queries[start:start + QUERY_EMBEDDING_BATCH_SIZE]
+            if embed_batch is not None:
+                vectors.extend(embed_batch(chunk))
+            else:
+                vectors.extend(embeddings.embed_query(query) for query in chunk)
+        return vectors
+
+    def dense_search_batch(self, vectors: list[list[float]], k: int) -> list[list[Document]]:
+        """
+        Busca no FAISS os `k` vizinhos de todos os vetores com uma única consulta matricial
+        (com o IVF-PQ, os candidatos são reordenados pela distância exata, veja refine_search).
+        """
+        matrix = np.asarray(vectors, dtype=np.float32)
+        _, positions = refine_search(self.vector_store.index, self.exact_index, matrix, k)
+        mapping = self.vector_store.index_to_docstore_id
+        ids_per_query = [[mapping[int(p)] for p in row if p >= 0] for row in positions]
+
+        documents = {}
+        for doc_id in {doc_id for ids in ids_per_query for doc_id in ids}:
+            doc = self.vector_store.docstore.search(doc_id)
+            if isinstance(doc, Document):
+                documents[doc_id] = doc
+        return [[documents[doc_id] for doc_id in ids if doc_id in documents] for ids in ids_per_query]
+
+    def batch_search(self, queries: list[str]) -> list[list[Document]]:
+        """
+        Recupera as fichas de várias perguntas de uma vez: perguntas que citam produtos pelo nome
+        e perguntas com filtros de propriedades usam os respectivos índices; as demais têm os embeddings calculados em lote e são
+        buscadas no FAISS em uma única consulta matricial, antes da fusão com o BM25.
+        """
+        results = [None] * len(queries)
+        named = [[] for _ in queries]
+        pending = []
+        for i, query in enumerate(queries):
+            named[i], sufficient = self.named_documents(query)
+            if sufficient:
+                RETRIEVAL_ROUTES.inc(route="product_name")
+                results[i] = named[i]
+                continue
+            documents = self.filter_documents(query)
+            if documents:
+                RETRIEVAL_ROUTES.inc(route="property_filter")
+                results[i] = self._named_first(named[i], documents, self.k) if named[i] else documents
+            else:
+                RETRIEVAL_ROUTES.inc(route="hybrid")
+                pending.append(i)
+
+        if pending:
+            with span("embedding"):
+                vectors = self.embed_queries([queries[i] for i in pending])
+            with span("vector_search"):
+                dense = self.dense_search_batch(vectors, max(self.dense_k, self.k))
+            # _fuse_lexical já mede a busca léxica de cada pergunta
+            for i, dense_docs in zip(pending, dense):
+                documents = self._fuse_lexical(queries[i], dense_docs)
+                results[i] = self._named_first(named[i], documents, self.k) if named[i] else documents
+        return results
@@ -1,6 +1,10 @@
 import os
 import json
-import requests
+import time
+import asyncio
+import hashlib
+import xml.etree.ElementTree as ET
+import aiohttp
 from bs4 import BeautifulSoup
 from urllib.parse import urljoin, urlparse
 
@@ -14,105 +18,319 @@ class Document:
 # Este código foi movido de data_loader.py para desacoplar a raspagem da web
 # da inicialização do servidor, tornando a aplicação mais rápida e estável.
 
-def get_internal_links(url, domain):
-    """Encontra todos os links internos de uma página."""
-    try:
-        # Timeout aumentado para dar mais tempo para o site responder
-        response = requests.get(url, timeout=15)
-        response.raise_for_status() # Lança um erro para status HTTP 4xx/5xx
-        soup = BeautifulSoup(response.content, 'html.parser')
-        internal_links = set()
-        for a_tag in soup.find_all('a', href=True):
-            href = a_tag['href']
-            
-            # NOVO: Ignora links que contêm parâmetros de idioma para inglês ou espanhol.
-            if '?lang=en' in href or '?lang=es' in href:
-                continue
-
-            # Ignora links que não são de páginas web
-            if href.startswith(('mailto:', 'tel:', '#')):
-                continue
-            full_url = urljoin(url, href)
-            # Normaliza a URL para remover âncoras (#) e parâmetros
-            full_url = full_url.split('#')[0]
-            if urlparse(full_url).netloc == domain:
-                internal_links.add(full_url)
-        return internal_links
-    except requests.RequestException as e:
-        print(f"Erro ao acessar {url}: {e}")
-        return set()
-
-def scrape_page_content(url):
-    """Extrai o conteúdo de texto limpo de uma única página."""
-    try:
-        response = requests.get(url, timeout=15)
-        response.raise_for_status()
-        soup = BeautifulSoup(response.content, 'html.parser')
-        
-        # Remove partes do site que não contêm conteúdo principal (menus, rodapés, etc.)
-        for element in soup(['script', 'style', 'nav', 'footer', 'header', 'aside', 'form']):
-            element.decompose()
-
-        # Extrai o texto e limpa espaços em branco e linhas vazias
-        text = soup.get_text()
-        lines = (line.strip() for line in text.splitlines())
-        chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
-        text = '\n'.join(chunk for chunk in chunks if chunk)
-        
-        if text:
-            # Retorna um objeto Document, o formato que o LangChain espera
-            return Document(page_content=text, metadata={"source": url})
-        return None
-    except requests.RequestException as e:
-        print(f"Erro ao raspar a página {url}: {e}")
-        return None
-
-def load_documents_from_website(root_url: str, max_pages: int = 100):
-    """Navega por um site, extrai conteúdo de todas as páginas internas e retorna como Documentos."""
-    domain = urlparse(root_url).netloc
-    pages_to_visit = {root_url}
-    visited_pages = set()
-    all_documents = []
+# --- Configuração do crawler ---
+# Número máximo de requisições simultâneas e por domínio, e intervalo mínimo (em segundos)
+# entre duas requisições ao mesmo domínio, para não sobrecarregar o site do cliente.
+CRAWL_CONCURRENCY = int(os.getenv("CRAWL_CONCURRENCY", "10"))
+CRAWL_PER_HOST_LIMIT = int(os.getenv("CRAWL_PER_HOST_LIMIT", "4"))
+CRAWL_MIN_INTERVAL = float(os.getenv("CRAWL_MIN_INTERVAL", "0.05"))
+REQUEST_TIMEOUT = 15
+# Sitemaps filhos lidos a partir de um índice de sitemaps
+SITEMAP_MAX_CHILDREN = int(os.getenv("SITEMAP_MAX_CHILDREN", "20"))
 
-    print(f"--- Iniciando a leitura do site: {root_url} ---")
-    while pages_to_visit and len(visited_pages) < max_pages:
-        url = pages_to_visit.pop()
+def is_skipped_url(url):
+    """Ignora as versões em inglês ou espanhol das páginas."""
+    return '?lang=en' in url or '?lang=es' in url
+
+def parse_page(html, url, domain):
+    """
+    Extrai, de uma única análise do HTML, o conteúdo de texto limpo e os links internos da página.
+    Retorna (Document ou None, conjunto de links internos).
+    """
+    soup = BeautifulSoup(html, 'html.parser')
+
+    # Os links são coletados antes da limpeza, pois menus e rodapés também apontam para páginas internas.
+    internal_links = set()
+    for a_tag in soup.find_all('a', href=True):
+        href = a_tag['href']
 
-        # NOVO: Pula a página se for uma versão em inglês ou espanhol.
-        if '?lang=en' in url or '?lang=es' in url:
+        # Ignora links que contêm parâmetros de idioma para inglês ou espanhol.
+        if is_skipped_url(href):
             continue
 
-        if url in visited_pages:
+        # Ignora links que não são de páginas web
+        if href.startswith(('mailto:', 'tel:', '#')):
             continue
+        full_url = urljoin(url, href)
+        # Normaliza a URL para remover âncoras (#)
+        full_url = full_url.split('#')[0]
+        if urlparse(full_url).netloc == domain:
+            internal_links.add(full_url)
 
-        print(f"Lendo página: {url} ({len(visited_pages) + 1}/{max_pages})")
-        visited_pages.add(url)
-        
-        document = scrape_page_content(url)
-        if document:
-            all_documents.append(document)
-
-        # Adiciona novos links para visitar, se houver espaço
-        if len(visited_pages) < max_pages:
-            new_links = get_internal_links(url, domain)
-            pages_to_visit.update(new_links - visited_pages)
-    
+    # Remove partes do site que não contêm conteúdo principal (menus, rodapés, etc.)
+    for element in soup(['script', 'style', 'nav', 'footer', 'header', 'aside', 'form']):
+        element.decompose()
+
+    # Extrai o texto e limpa espaços em branco e linhas vazias
+    text = soup.get_text()
+    lines = (line.strip() for line in text.splitlines())
+    chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
+    text = '\n'.join(chunk for chunk in chunks if chunk)
+
+    # Retorna um objeto Document, o formato que o LangChain espera
+    document = Document(page_content=text, metadata={"source": url}) if text else None
+    return document, internal_links
+
+def content_hash(text: str) -> str:
+    """Hash do texto extraído da página (menus e scripts já removidos), usado para detectar mudanças."""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+class CrawlState:
+    """
+    Estado das coletas anteriores, por URL: ETag, Last-Modified, hash do conteúdo e links
+    internos. Com ele, as páginas são pedidas com requisições condicionais (If-None-Match /
+    If-Modified-Since); uma resposta 304 evita o download e os links salvos continuam a
+    navegação. Cada coleta registra em `unchanged` e `removed` as páginas sem conteúdo novo.
+    """
+
+    def __init__(self, path: str | None = None, pages: dict | None = None):
+        self.path = path
+        self.pages = pages or {}
+        self.unchanged = []     # (url, hash) das páginas não modificadas nesta coleta
+        self.removed = []       # URLs que responderam 404/410 nesta coleta
+
+    @classmethod
+    def load(cls, path: str) -> "CrawlState":
+        """Lê o estado salvo; um arquivo ausente ou inválido equivale a uma primeira coleta."""
+        if os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    return cls(path, json.load(f).get("pages", {}))
+            except (OSError, ValueError) as e:
+                print(f"Estado da coleta inválido em '{path}', ignorando: {e}")
+        return cls(path)
+
+    def save(self):
+        """Grava o estado de forma atômica (arquivo temporário + rename)."""
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"pages": self.pages}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    def request_headers(self, url: str) -> dict:
+        """Cabeçalhos condicionais para a URL, a partir da última resposta dela."""
+        entry = self.pages.get(url)
+        if not entry or entry.get("hash") is None:
+            return {}
+        headers = {}
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def not_modified(self, url: str) -> list[str]:
+        """Registra um 304 e retorna os links internos salvos da página."""
+        entry = self.pages[url]
+        entry["checked_at"] = time.time()
+        self.unchanged.append((url, entry.get("hash")))
+        return entry.get("links", [])
+
+    def update(self, url: str, response_headers, digest: str | None, links) -> bool:
+        """Registra uma página baixada. Retorna True se o conteúdo mudou desde a última coleta."""
+        entry = self.pages.get(url, {})
+        changed = entry.get("hash") != digest
+        self.pages[url] = {
+            "etag": response_headers.get("ETag"),
+            "last_modified": response_headers.get("Last-Modified"),
+            "hash": digest,
+            "links": sorted(links),
+            "checked_at": time.time(),
+        }
+        if not changed:
+            self.unchanged.append((url, digest))
+        return changed
+
+    def remove(self, url: str):
+        if self.pages.pop(url, None) is not None:
+            self.removed.append(url)
+
+class HostThrottle:
+    """Garante um intervalo mínimo entre requisições consecutivas ao mesmo domínio."""
+
+    def __init__(self, min_interval):
+        self.min_interval = min_interval
+        self._locks = {}
+        self._next_slot = {}
+
+    async def wait(self, url):
+        if self.min_interval <= 0:
+            return
+        host = urlparse(url).netloc
+        lock = self._locks.setdefault(host, asyncio.Lock())
+        async with lock:
+            loop = asyncio.get_running_loop()
+            delay = self._next_slot.get(host, 0) - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self._next_slot[host] = loop.time() + self.min_interval
+
+def create_crawl_session(concurrency=CRAWL_CONCURRENCY, per_host=CRAWL_PER_HOST_LIMIT):
+    """Cria uma sessão HTTP com um pool de conexões keep-alive compartilhado pelo crawler."""
+    connector = aiohttp.TCPConnector(limit=concurrency, limit_per_host=per_host)
+    return aiohttp.ClientSession(
+        connector=connector,
+        timeout=aiohttp.ClientTimeout(total=REQUEST_TIMEOUT),
+    )
+
+def parse_sitemap(xml_content: bytes) -> tuple[list[str], bool]:
+    """Retorna as URLs (<loc>) de um sitemap e se ele é um índice de sitemaps."""
+    root = ET.fromstring(xml_content)
+    urls = [node.text.strip() for node in root.iter() if node.tag.endswith("loc") and node.text]
+    return urls, root.tag.endswith("sitemapindex")
+
+async def fetch_sitemap_urls(session, root_url: str, domain: str) -> list[str]:
+    """URLs internas listadas no /sitemap.xml do site (e nos sitemaps de um índice), se existir."""
+    async def read(url):
+        try:
+            async with session.get(url) as response:
+                if response.status != 200:
+                    return [], False
+                return parse_sitemap(await response.read())
+        except (aiohttp.ClientError, asyncio.TimeoutError, ET.ParseError) as e:
+            print(f"Sitemap {url} ignorado: {e}")
+            return [], False
+
+    urls, is_index = await read(urljoin(root_url, "/sitemap.xml"))
+    if is_index:
+        children = await asyncio.gather(*(read(url) for url in urls[:SITEMAP_MAX_CHILDREN]))
+        urls = [url for child_urls, _ in children for url in child_urls]
+    pages = []
+    for url in urls:
+        url = url.split('#')[0]
+        if urlparse(url).netloc == domain and not is_skipped_url(url):
+            pages.append(url)
+    return pages
+
+async def crawl_website(root_url: str, max_pages: int = 100, concurrency: int = CRAWL_CONCURRENCY,
+                        per_host: int = CRAWL_PER_HOST_LIMIT, min_interval: float = CRAWL_MIN_INTERVAL,
+                        session=None, state: CrawlState | None = None, use_sitemap: bool = True):
+    """
+    Navega por um site de forma concorrente, buscando cada página uma única vez.
+    Uma sessão `aiohttp` pode ser injetada (ex: em testes contra um servidor local);
+    caso contrário, uma é criada com o pool de conexões limitado por domínio.
+    A navegação começa pelas URLs do sitemap.xml, quando ele existe. Com um `state`, as
+    páginas são pedidas com requisições condicionais e as não modificadas não são baixadas.
+    Os documentos (páginas baixadas) são retornados na ordem em que foram descobertas, com
+    'content_hash' e 'changed' nos metadados.
+    """
+    domain = urlparse(root_url).netloc
+    discovered = {root_url: 0}
+    pages = {}
+    queue = asyncio.Queue()
+    queue.put_nowait(root_url)
+    throttle = HostThrottle(min_interval)
+
+    own_session = session is None
+    if own_session:
+        session = create_crawl_session(concurrency, per_host)
+
+    def discover(links):
+        for link in links:
+            if len(discovered) >= max_pages:
+                break
+            if link not in discovered and not is_skipped_url(link):
+                discovered[link] = len(discovered)
+                queue.put_nowait(link)
+
+    if use_sitemap:
+        discover(await fetch_sitemap_urls(session, root_url, domain))
+
+    async def fetch(url):
+        """Retorna (status, conteúdo, cabeçalhos); status None em caso de erro de rede."""
+        await throttle.wait(url)
+        headers = state.request_headers(url) if state else {}
+        try:
+            async with session.get(url, headers=headers) as response:
+                if response.status == 304 or response.status in (404, 410):
+                    return response.status, None, response.headers
+                response.raise_for_status()
+                return response.status, await response.read(), response.headers
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            print(f"Erro ao acessar {url}: {e}")
+            return None, None, {}
+
+    async def worker():
+        while True:
+            url = await queue.get()
+            try:
+                print(f"Lendo página: {url} ({len(pages) + 1}/{max_pages})")
+                status, html, headers = await fetch(url)
+                if status == 304 and state and url in state.pages:
+                    # Página não modificada: sem download, a navegação segue pelos links salvos
+                    discover(state.not_modified(url))
+                    continue
+                if status in (404, 410):
+                    if state:
+                        state.remove(url)
+                    continue
+                if html is None:
+                    continue
+                # A análise do HTML é CPU-bound; roda fora do event loop para não travar as demais requisições.
+                document, links = await asyncio.to_thread(parse_page, html, url, domain)
+                digest = content_hash(document.page_content) if document else None
+                changed = state.update(url, headers, digest, links) if state else True
+                if document:
+                    document.metadata.update(content_hash=digest, changed=changed)
+                pages[url] = document
+
+                # Adiciona novos links para visitar, se houver espaço
+                discover(sorted(links))
+            except Exception as e:
+                # Uma página com problema (HTML inválido, codificação, estado) não derruba o worker;
+                # sem workers vivos, o queue.join() ficaria esperando para sempre.
+                print(f"Erro ao processar {url}: {e!r}")
+            finally:
+                queue.task_done()
+
+    workers = [asyncio.create_task(worker()) for _ in range(max(1, concurrency))]
+    try:
+        await queue.join()
+    finally:
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        if own_session:
+            await session.close()
+
+    return [pages[url] for url in sorted(pages, key=discovered.get) if pages[url] is not None]
+
+def load_documents_from_website(root_url: str, max_pages: int = 100, state: CrawlState | None = None):
+    """Navega por um site, extrai conteúdo de todas as páginas internas e retorna como Documentos."""
+    print(f"--- Iniciando a leitura do site: {root_url} ---")
+    all_documents = asyncio.run(crawl_website(root_url, max_pages=max_pages, state=state))
     print(f"--- Leitura do site finalizada. {len(all_documents)} páginas lidas. ---")
+    if state:
+        changed = sum(doc.metadata["changed"] for doc in all_documents)
+        print(f"--- {changed} páginas novas ou alteradas, {len(state.unchanged)} sem alterações, "
+              f"{len(state.removed)} removidas. ---")
     return all_documents
 
-def save_documents_to_json(documents, path):
-    """Salva uma lista de objetos Document em um arquivo JSON."""
-    # Garante que o diretório de destino exista
-    os.makedirs(os.path.dirname(path), exist_ok=True)
-    
-    # Converte a lista de objetos Document para uma lista de dicionários
-    docs_as_dicts = [
-        {"page_content": doc.page_content, "metadata": doc.metadata}
-        for doc in documents
-    ]
-
-    with open(path, 'w', encoding='utf-8') as f:
-        json.dump(docs_as_dicts, f, indent=2, ensure_ascii=False)
+def append_crawl_results(documents, path, state: CrawlState | None = None):
+    """
+    Acrescenta o resultado de uma coleta ao arquivo JSONL, uma página por linha. O campo
+    'changed' indica as páginas novas ou alteradas, as únicas que precisam ser re-embedadas;
+    páginas sem alterações vêm sem 'page_content' quando não foram baixadas (304), e as
+    removidas do site vêm com 'removed'. Para cada URL, vale a linha mais recente.
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    crawled_at = time.strftime("%Y-%m-%dT%H:%M:%S")
+    fetched = {doc.metadata["source"] for doc in documents}
+    with open(path, 'a', encoding='utf-8') as f:
+        for doc in documents:
+            record = {"source": doc.metadata["source"], "changed": doc.metadata.get("changed", True),
+                      "content_hash": doc.metadata.get("content_hash"), "crawled_at": crawled_at,
+                      "page_content": doc.page_content}
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        if state:
+            for url, digest in state.unchanged:
+                if url not in fetched:
+                    record = {"source": url, "changed": False, "content_hash": digest, "crawled_at": crawled_at}
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            for url in state.removed:
+                record = {"source": url, "changed": True, "removed": True, "crawled_at": crawled_at}
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
     print(f"Conteúdo da web salvo com sucesso em: {path}")
 
 
@@ -120,20 +338,25 @@ if __name__ == "__main__":
     # --- Configuração ---
     # Altere a URL aqui para o site que deseja usar como fonte de contexto
     SITE_URL = "http://cpe.ind.br" 
-    # O caminho de saída para o conteúdo raspado. Não precisa mudar.
-    OUTPUT_PATH = "../CPE/produtos/scraped/website_content.json"
+    # O caminho de saída para o conteúdo raspado (JSONL, acrescido a cada coleta). Não precisa mudar.
+    OUTPUT_PATH = "../CPE/produtos/scraped/website_content.jsonl"
+    # Estado das coletas anteriores (ETag, Last-Modified e hash por página)
+    STATE_PATH = "../CPE/produtos/scraped/crawl_state.json"
     # Limite de páginas a serem lidas para não demorar demais.
     MAX_PAGES_TO_SCRAPE = 100
     
     print("--- Iniciando Script de Coleta de Conteúdo Web ---")
     
-    # Carrega os documentos do site
-    scraped_docs = load_documents_from_website(SITE_URL, max_pages=MAX_PAGES_TO_SCRAPE)
+    # Carrega os documentos do site, baixando apenas as páginas modificadas desde a última coleta
+    crawl_state = CrawlState.load(STATE_PATH)
+    scraped_docs = load_documents_from_website(SITE_URL, max_pages=MAX_PAGES_TO_SCRAPE, state=crawl_state)
     
-    # Salva os documentos em um arquivo JSON se algum conteúdo foi coletado
-    if scraped_docs:
-        save_documents_to_json(scraped_docs, OUTPUT_PATH)
+    # Acrescenta o resultado ao JSONL e só então grava o estado, para que uma falha na
+    # gravação não marque como coletadas páginas que não chegaram ao arquivo
+    if scraped_docs or crawl_state.unchanged or crawl_state.removed:
+        append_crawl_results(scraped_docs, OUTPUT_PATH, crawl_state)
+        crawl_state.save()
     else:
         print("Nenhum documento foi coletado do site.")
         
-    print("--- Script de Coleta Finalizado ---") 
\ No newline at end of file
+    print("--- Script de Coleta Finalizado ---")
@@ -0,0 +1,149 @@
+import os
+import time
+import uuid
+import threading
+from collections import OrderedDict
+
+from langchain_core.messages import AIMessage, HumanMessage
+
+# Conversas guardadas no servidor. O histórico enviado aos prompts tem no máximo
+# SESSION_WINDOW_TURNS turnos recentes, e os turnos mais antigos são resumidos na lista dos
+# produtos citados. Assim o tamanho do prompt não cresce com a conversa. As sessões ficam em
+# memória, por worker, e expiram após SESSION_TTL segundos sem uso; o frontend envia junto do
+# session_id os turnos recentes, usados para recriar a sessão quando ela não é encontrada
+# (outro worker, reinício ou expiração).
+SESSION_TTL = float(os.getenv("SESSION_TTL", "1800"))
+SESSION_MAX_SESSIONS = int(os.getenv("SESSION_MAX_SESSIONS", "10000"))
+SESSION_WINDOW_TURNS = int(os.getenv("SESSION_WINDOW_TURNS", "3"))
+SESSION_MAX_PRODUCTS = int(os.getenv("SESSION_MAX_PRODUCTS", "10"))
+# Respostas longas (ex: tabelas) são cortadas no histórico; a resposta completa já foi entregue
+SESSION_MAX_ANSWER_CHARS = int(os.getenv("SESSION_MAX_ANSWER_CHARS", "1500"))
+
+
+def _trim(text: str, max_chars: int) -> str:
+    return text if len(text) <= max_chars else text[:max_chars].rstrip() + " [...]"
+
+
+def compact_history(turns: list[tuple[str, str]], find_products, window_turns: int = SESSION_WINDOW_TURNS,
+                    earlier_products: list[str] | None = None) -> list:
+    """
+    Converte turnos (pergunta, resposta) em mensagens do LangChain, mantendo apenas os
+    `window_turns` mais recentes. Os produtos citados nos turnos anteriores (e em
+    `earlier_products`) entram como um resumo no início do histórico.
+    """
+    window_turns = max(1, window_turns)
+    older, recent = turns[:-window_turns], turns[-window_turns:]
+    products = list(earlier_products or [])
+    for question, answer in older:
+        products.extend(find_products(f"{question}\n{answer}"))
+    # Sem repetições, mantendo os citados mais recentemente
+    products = list(dict.fromkeys(reversed(products)))[:SESSION_MAX_PRODUCTS][::-1]
+
+    messages = []
+    if products:
+        messages.append(HumanMessage(content="Quais produtos já foram discutidos nesta conversa?"))
+        messages.append(AIMessage(content="Produtos citados anteriormente na conversa: " + ", ".join(products) + "."))
+    for question, answer in recent:
+        if question:
+            messages.append(HumanMessage(content=question))
+        if answer:
+            messages.append(AIMessage(content=_trim(answer, SESSION_MAX_ANSWER_CHARS)))
+    return messages
+
+
+class Session:
+    """Uma conversa: turnos recentes e produtos citados nos turnos que saíram da janela."""
+
+    def __init__(self, session_id: str, tenant: str):
+        self.id = session_id
+        self.tenant = tenant
+        self.turns = []            # (pergunta, resposta), só os da janela
+        self.earlier_products = []
+        self.expires_at = 0.0
+        self.lock = threading.Lock()
+
+
+class SessionStore:
+    """Sessões de conversa em memória, com expiração (TTL) e descarte LRU."""
+
+    def __init__(self, ttl: float = SESSION_TTL, max_sessions: int = SESSION_MAX_SESSIONS,
+                 window_turns: int = SESSION_WINDOW_TURNS):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.window_turns = max(1, window_turns)
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"created": 0, "expired": 0, "evicted": 0}
+
+    def _evict(self, now: float):
+        # As sessões estão em ordem de uso: as expiradas ficam no início
+        while self._sessions:
+            session = next(iter(self._sessions.values()))
+            if session.expires_at >= now and len(self._sessions) <= self.max_sessions:
+                break
+            self._sessions.popitem(last=False)
+            self.stats["expired" if session.expires_at < now else "evicted"] += 1
+
+    def get_or_create(self, session_id: str | None, tenant: str) -> Session:
+        """Retorna a sessão informada, ou uma nova se ela não existir, tiver expirado ou for de outro cliente."""
+        now = time.monotonic()
+        with self._lock:
+            self._evict(now)
+            session = self._sessions.get(session_id) if session_id else None
+            if session is None or session.tenant != tenant:
+                session = Session(uuid.uuid4().hex, tenant)
+                self.stats["created"] += 1
+            self._sessions[session.id] = session
+            self._sessions.move_to_end(session.id)
+            session.expires_at = now + self.ttl
+            self._evict(now)
+            return session
+
+    def delete(self, session_id: str, tenant: str) -> bool:
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None or session.tenant != tenant:
+                return False
+            del self._sessions[session_id]
+            return True
+
+    @staticmethod
+    def is_empty(session: Session) -> bool:
+        with session.lock:
+            return not session.turns and not session.earlier_products
+
+    def seed(self, session: Session, turns: list[tuple[str, str]], find_products):
+        """Inicia a sessão com um histórico enviado pelo cliente (ex: conversa restaurada no frontend)."""
+        for question, answer in turns:
+            self.append_turn(session, question, answer, find_products)
+
+    def history(self, session: Session, find_products) -> list:
+        """Histórico compacto da sessão para os prompts."""
+        with session.lock:
+            return compact_history(list(session.turns), find_products, self.window_turns, session.earlier_products)
+
+    def append_turn(self, session: Session, question: str, answer: str, find_products):
+        """Guarda um turno; o que sai da janela vira apenas a lista de produtos citados."""
+        with session.lock:
+            session.turns.append((question, _trim(answer, SESSION_MAX_ANSWER_CHARS)))
+            while len(session.turns) > self.window_turns:
+                old_question, old_answer = session.turns.pop(0)
+                products = find_products(f"{old_question}\n{old_answer}")
+                merged = [name for name in session.earlier_products if name not in products] + products
+                session.earlier_products = merged[-SESSION_MAX_PRODUCTS:]
+
+    async def record(self, session: Session, question: str, chunks, find_products):
+        """Repassa o streaming da resposta e guarda o turno quando ele termina por completo."""
+        answer_parts = []
+        try:
+            async for chunk in chunks:
+                answer_parts.append(chunk)
+                yield chunk
+        finally:
+            # Interrompe a geração no LLM se o streaming for encerrado antes do fim
+            await chunks.aclose()
+        self.append_turn(session, question, "".join(answer_parts), find_products)
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {**self.stats, "active": len(self._sessions)}
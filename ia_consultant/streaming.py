@@ -0,0 +1,97 @@
+import os
+import json
+import asyncio
+
+# Os pedaços da resposta são agrupados em janelas curtas de tempo e tamanho antes de
+# serem enviados, em vez de um envio (e um sleep) por token.
+STREAM_FLUSH_INTERVAL = float(os.getenv("STREAM_FLUSH_INTERVAL", "0.05"))
+STREAM_FLUSH_CHARS = int(os.getenv("STREAM_FLUSH_CHARS", "256"))
+DISCONNECT_POLL_INTERVAL = 0.25
+
+MEDIA_TYPES = {
+    "text": "text/plain; charset=utf-8",
+    "sse": "text/event-stream",
+    "ndjson": "application/x-ndjson",
+}
+
+
+def format_event(stream_format: str, event: str, data: dict) -> str:
+    """Formata um evento como Server-Sent Event, linha NDJSON ou texto puro."""
+    if stream_format == "sse":
+        return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+    if stream_format == "ndjson":
+        return json.dumps({"type": event, **data}, ensure_ascii=False, default=str) + "\n"
+    # Texto puro: apenas o conteúdo da resposta é enviado
+    return data.get("text", "") if event == "chunk" else ""
+
+
+async def stream_events(request, chunks, stream_format: str = "text", stats: dict | None = None,
+                        flush_interval: float = STREAM_FLUSH_INTERVAL, flush_chars: int = STREAM_FLUSH_CHARS):
+    """
+    Transmite o gerador `chunks` do agente em janelas agrupadas, com eventos finais de
+    conclusão ('done', incluindo `stats`) ou de erro ('error').
+    Se o cliente se desconectar, a geração no LLM é cancelada imediatamente.
+    """
+    queue = asyncio.Queue()
+    loop = asyncio.get_running_loop()
+
+    async def produce():
+        try:
+            async for chunk in chunks:
+                queue.put_nowait(("chunk", chunk))
+            queue.put_nowait(("done", None))
+        except asyncio.CancelledError:
+            queue.put_nowait(("cancelled", None))
+            raise
+        except Exception as e:
+            print(f"Erro durante a geração da resposta: {e}")
+            queue.put_nowait(("error", str(e)))
+        finally:
+            await chunks.aclose()
+
+    producer = asyncio.create_task(produce())
+
+    async def watch_disconnect():
+        while not producer.done():
+            if await request.is_disconnected():
+                print("Cliente desconectado; cancelando a geração da resposta.")
+                producer.cancel()
+                return
+            await asyncio.sleep(DISCONNECT_POLL_INTERVAL)
+
+    watcher = asyncio.create_task(watch_disconnect())
+
+    buffer, buffered_chars, deadline = [], 0, None
+    try:
+        while True:
+            timeout = None if deadline is None else max(0.0, deadline - loop.time())
+            try:
+                kind, payload = await asyncio.wait_for(queue.get(), timeout)
+            except asyncio.TimeoutError:
+                kind, payload = "flush", None
+
+            if kind == "chunk":
+                buffer.append(payload)
+                buffered_chars += len(payload)
+                if deadline is None:
+                    deadline = loop.time() + flush_interval
+                if buffered_chars < flush_chars:
+                    continue
+
+            if buffer:
+                yield format_event(stream_format, "chunk", {"text": "".join(buffer)})
+                buffer, buffered_chars, deadline = [], 0, None
+
+            if kind == "done":
+                if stream_format != "text":
+                    yield format_event(stream_format, "done", {"stats": stats or {}})
+                return
+            if kind == "error":
+                if stream_format != "text":
+                    yield format_event(stream_format, "error", {"detail": payload})
+                return
+            if kind == "cancelled":
+                return
+    finally:
+        producer.cancel()
+        watcher.cancel()
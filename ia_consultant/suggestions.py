@@ -0,0 +1,147 @@
+import os
+import json
+import random
+import threading
+
+from filelock import FileLock, Timeout
+from langchain.chains.combine_documents import create_stuff_documents_chain
+from langchain_core.documents import Document
+from langchain_core.prompts import ChatPromptTemplate
+
+# Banco de perguntas sugeridas, gerado em lote quando o índice é criado ou atualizado
+# e salvo junto com ele. O endpoint /suggest-questions apenas sorteia perguntas do banco.
+SUGGESTIONS_FILE = "suggestions.json"
+SUGGESTION_POOL_SIZE = int(os.getenv("SUGGESTION_POOL_SIZE", "30"))
+SUGGESTION_CONCURRENCY = int(os.getenv("SUGGESTION_CONCURRENCY", "8"))
+SUGGESTIONS_REFRESH_SECONDS = float(os.getenv("SUGGESTIONS_REFRESH_SECONDS", str(6 * 3600)))
+
+# Template do prompt para gerar perguntas
+SUGGESTION_TEMPLATE = """
+Com base no trecho de documento abaixo, gere UMA única pergunta curta e direta que um cliente poderia fazer sobre o assunto.
+Retorne apenas a pergunta, sem saudações ou texto adicional.
+
+Documento:
+{context}
+
+Pergunta Sugerida:
+"""
+
+
+class SuggestionPool:
+    """Banco persistido de perguntas sugeridas, com atualização em segundo plano."""
+
+    def __init__(self, llm, index_path: str):
+        os.makedirs(index_path, exist_ok=True)
+        self.path = os.path.join(index_path, SUGGESTIONS_FILE)
+        self.lock_path = os.path.join(index_path, "suggestions.lock")
+        self.suggestion_chain = create_stuff_documents_chain(llm, ChatPromptTemplate.from_template(SUGGESTION_TEMPLATE))
+        self._suggestions = []
+        self._loaded_mtime = None
+        self._refresh_thread = None
+        self._schedule_thread = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._reload_if_changed()
+
+    def _reload_if_changed(self):
+        """Recarrega o banco do disco se outro processo o atualizou."""
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            return
+        if mtime == self._loaded_mtime:
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                suggestions = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Erro ao ler o banco de perguntas sugeridas: {e}")
+            return
+        with self._lock:
+            self._suggestions = suggestions
+            self._loaded_mtime = mtime
+
+    def __len__(self):
+        return len(self._suggestions)
+
+    def sample(self, count: int = 3) -> list[str]:
+        """Sorteia perguntas do banco, sem nenhuma chamada ao LLM."""
+        self._reload_if_changed()
+        with self._lock:
+            return random.sample(self._suggestions, min(count, len(self._suggestions)))
+
+    def generate(self, documents: list[Document]) -> list[str]:
+        """Gera uma pergunta por documento, com várias chamadas ao LLM em paralelo."""
+        responses = self.suggestion_chain.batch(
+            [{"context": [doc]} for doc in documents],  # Passa um único doc por vez
+            config={"max_concurrency": SUGGESTION_CONCURRENCY},
+            return_exceptions=True,
+        )
+        suggestions = []
+        for response in responses:
+            if isinstance(response, Exception):
+                print(f"Erro ao gerar pergunta sugerida: {response}")
+            elif response and response.strip():
+                suggestions.append(response.strip())
+        return suggestions
+
+    def refresh(self, vector_store) -> bool:
+        """
+        Gera um novo banco a partir de fichas sorteadas do índice e o salva em disco.
+        Apenas um processo gera por vez; os demais recarregam o arquivo salvo.
+        """
+        if vector_store is None:
+            return False
+        try:
+            with FileLock(self.lock_path, timeout=0):
+                doc_ids = list(vector_store.index_to_docstore_id.values())
+                sampled_ids = random.sample(doc_ids, min(SUGGESTION_POOL_SIZE, len(doc_ids)))
+                documents = [vector_store.docstore.search(doc_id) for doc_id in sampled_ids]
+                suggestions = self.generate([doc for doc in documents if isinstance(doc, Document)])
+                if not suggestions:
+                    return False
+
+                tmp_path = self.path + ".tmp"
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(suggestions, f, indent=2, ensure_ascii=False)
+                os.replace(tmp_path, self.path)
+        except Timeout:
+            # Outro processo já está gerando o banco
+            return False
+        except Exception as e:
+            print(f"Erro ao atualizar o banco de perguntas sugeridas: {e}")
+            return False
+
+        self._reload_if_changed()
+        print(f"Banco de perguntas sugeridas atualizado com {len(suggestions)} perguntas.")
+        return True
+
+    def refresh_in_background(self, vector_store):
+        """Dispara a atualização do banco em uma thread, se nenhuma estiver em andamento."""
+        with self._lock:
+            if self._refresh_thread and self._refresh_thread.is_alive():
+                return
+            self._refresh_thread = threading.Thread(target=self.refresh, args=(vector_store,), daemon=True)
+            self._refresh_thread.start()
+
+    def wait(self, timeout: float | None = None):
+        """Aguarda a atualização em segundo plano em andamento, se houver."""
+        thread = self._refresh_thread
+        if thread is not None:
+            thread.join(timeout)
+
+    def start_schedule(self, get_vector_store, interval: float = SUGGESTIONS_REFRESH_SECONDS):
+        """Atualiza o banco periodicamente em segundo plano (interval <= 0 desativa)."""
+        if interval <= 0 or self._schedule_thread is not None:
+            return
+
+        def loop():
+            while not self._stop.wait(interval):
+                self.refresh(get_vector_store())
+
+        self._schedule_thread = threading.Thread(target=loop, daemon=True)
+        self._schedule_thread.start()
+
+    def close(self):
+        """Interrompe a atualização periódica."""
+        self._stop.set()
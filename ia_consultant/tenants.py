@@ -0,0 +1,158 @@
+import os
+import json
+import time
+import hmac
+import threading
+from collections import OrderedDict
+
+from agent import Agent, VECTOR_STORE_PATH, DATA_PATH, create_llm, create_embeddings
+
+# Registro de agentes por cliente (tenant). Cada cliente tem seu próprio índice, pasta
+# de dados, provedor e prompt; os agentes são criados no primeiro acesso e os índices
+# dos clientes ociosos são descartados quando o orçamento de memória é ultrapassado.
+TENANTS_CONFIG_PATH = os.getenv("TENANTS_CONFIG", "tenants.json")
+TENANT_MEMORY_BUDGET_MB = float(os.getenv("TENANT_MEMORY_BUDGET_MB", "2048"))
+DEFAULT_TENANT = "default"
+
+
+def load_tenant_configs(path: str = TENANTS_CONFIG_PATH) -> dict:
+    """
+    Lê a configuração dos clientes, no formato:
+    {"cliente": {"index_path": ..., "data_path": ..., "provider": ..., "prompt_file": ..., "index_type": ...,
+                 "api_keys": [...], "hosts": [...]}}
+    `api_keys` e `hosts` identificam o cliente nas requisições (veja AgentRegistry.resolve_tenant).
+    Sem arquivo de configuração, existe apenas o cliente 'default' com os caminhos padrão.
+    """
+    configs = {}
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            configs = json.load(f)
+    configs.setdefault(DEFAULT_TENANT, {"index_path": VECTOR_STORE_PATH, "data_path": DATA_PATH})
+    return configs
+
+
+class UnknownTenantError(KeyError):
+    pass
+
+
+class TenantAuthError(Exception):
+    """Requisição sem credencial válida para nenhum cliente."""
+
+
+class AgentRegistry:
+    """Cria, compartilha e descarta instâncias de Agent por cliente."""
+
+    def __init__(self, configs: dict, memory_budget_bytes: float = TENANT_MEMORY_BUDGET_MB * 1024 * 1024):
+        self.configs = configs
+        self.memory_budget_bytes = memory_budget_bytes
+        self._agents = OrderedDict()   # tenant -> Agent, do menos para o mais recente
+        self._memory = {}              # tenant -> bytes estimados
+        self._tenant_locks = {}
+        self._lock = threading.Lock()
+        self._llms = {}
+        self._embeddings = {}
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "cold_loads": 0, "cold_load_seconds": 0.0}
+
+    def resolve_tenant(self, api_key: str | None, host: str | None) -> str:
+        """
+        Cliente da requisição, definido pelo servidor: pela chave de API (`api_keys` da
+        configuração) ou, sem chave, pelo domínio da requisição (`hosts`). Sem nenhum dos
+        dois, só a instalação de cliente único ('default' sem chaves nem domínios configurados)
+        é atendida. Levanta TenantAuthError se a chave for desconhecida ou faltar.
+        """
+        if api_key:
+            for tenant, config in self.configs.items():
+                if any(hmac.compare_digest(api_key.encode('utf-8'), str(key).encode('utf-8'))
+                       for key in config.get("api_keys", [])):
+                    return tenant
+            raise TenantAuthError("Chave de API inválida.")
+        host = (host or "").split(":")[0].lower()
+        for tenant, config in self.configs.items():
+            if host and host in (name.lower() for name in config.get("hosts", [])):
+                return tenant
+        if set(self.configs) == {DEFAULT_TENANT} and not self.configs[DEFAULT_TENANT].get("api_keys"):
+            return DEFAULT_TENANT
+        raise TenantAuthError("Credencial ausente.")
+
+    def _shared_clients(self, provider: str):
+        """Clientes de LLM e embeddings são compartilhados por todos os clientes do mesmo provedor."""
+        with self._lock:
+            if provider not in self._llms:
+                self._llms[provider] = create_llm(provider)
+                self._embeddings[provider] = create_embeddings(provider)
+            return self._llms[provider], self._embeddings[provider]
+
+    def _build_agent(self, tenant: str) -> Agent:
+        config = self.configs[tenant]
+        provider = config.get("provider") or os.getenv("LLM_PROVIDER", "openai").lower()
+        llm, embeddings = self._shared_clients(provider)
+        prompt = config.get("prompt")
+        if not prompt and config.get("prompt_file"):
+            with open(config["prompt_file"], 'r', encoding='utf-8') as f:
+                prompt = f.read()
+        return Agent(
+            vector_store_path=config.get("index_path", os.path.join("indexes", tenant)),
+            data_path=config["data_path"],
+            provider=provider,
+            llm=llm,
+            embeddings=embeddings,
+            qa_system_prompt=prompt,
+            index_type=config.get("index_type"),
+        )
+
+    def get(self, tenant: str) -> Agent:
+        """Retorna o agente do cliente, criando-o (carga a frio) no primeiro acesso."""
+        if tenant not in self.configs:
+            raise UnknownTenantError(tenant)
+
+        with self._lock:
+            agent = self._agents.get(tenant)
+            if agent is not None:
+                self._agents.move_to_end(tenant)
+                self.stats["hits"] += 1
+                return agent
+            self.stats["misses"] += 1
+            tenant_lock = self._tenant_locks.setdefault(tenant, threading.Lock())
+
+        # Requisições simultâneas para o mesmo cliente esperam uma única carga
+        with tenant_lock:
+            with self._lock:
+                agent = self._agents.get(tenant)
+            if agent is not None:
+                return agent
+
+            print(f"Carregando o agente do cliente '{tenant}'...")
+            start = time.perf_counter()
+            agent = self._build_agent(tenant)
+            elapsed = time.perf_counter() - start
+            memory = agent.memory_usage()
+
+            with self._lock:
+                self._agents[tenant] = agent
+                self._memory[tenant] = memory
+                self.stats["cold_loads"] += 1
+                self.stats["cold_load_seconds"] += elapsed
+                self._evict(keep=tenant)
+            print(f"Agente do cliente '{tenant}' carregado em {elapsed:.1f}s (~{memory / 1024 / 1024:.1f} MB).")
+            return agent
+
+    def _evict(self, keep: str):
+        """Descarta os agentes menos usados recentemente até caber no orçamento de memória."""
+        while sum(self._memory.values()) > self.memory_budget_bytes and len(self._agents) > 1:
+            tenant = next(t for t in self._agents if t != keep)
+            # Requisições em andamento mantêm a referência ao agente até terminarem
+            self._agents.pop(tenant).close()
+            self._memory.pop(tenant, None)
+            self.stats["evictions"] += 1
+            print(f"Índice do cliente '{tenant}' descartado da memória.")
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {
+                **self.stats,
+                "loaded": {tenant: round(self._memory.get(tenant, 0) / 1024 / 1024, 2) for tenant in self._agents},
+                "index_versions": {tenant: agent.index_version for tenant, agent in self._agents.items()},
+                "memory_mb": round(sum(self._memory.values()) / 1024 / 1024, 2),
+                "memory_budget_mb": round(self.memory_budget_bytes / 1024 / 1024, 2),
+                "tenants": len(self.configs),
+            }
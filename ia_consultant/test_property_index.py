@@ -0,0 +1,54 @@
+import pytest
+
+from property_index import PropertyIndex, parse_number, parse_value
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("1.250", 1250.0),
+    ("2.000.000", 2000000.0),
+    ("1.150,5", 1150.5),
+    ("1,15", 1.15),
+    ("1.15", 1.15),
+    ("0.125", 0.125),
+    ("12.5", 12.5),
+])
+def test_parse_number(text, expected):
+    assert parse_number(text) == pytest.approx(expected)
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("1.250 kg/m³", (1.25, "g/cm3")),
+    ("1.150,5 kg/m³", (1.1505, "g/cm3")),
+    ("1,15 g/cm³", (1.15, "g/cm3")),
+    ("1.15 g/cm³", (1.15, "g/cm3")),
+    ("≥ 2.000 MPa", (2000.0, "mpa")),
+])
+def test_parse_value(value, expected):
+    number, unit = parse_value(value)
+    assert (number, unit) == (pytest.approx(expected[0]), expected[1])
+
+
+def _index() -> PropertyIndex:
+    rows = [
+        {"doc_id": "a", "product_name": "A", "properties": {"Densidade": "1,15 g/cm³", "Tração": "800 MPa"}},
+        {"doc_id": "b", "product_name": "B", "properties": {"Densidade": "1.250 kg/m³", "Tração": "1.250 MPa"}},
+        {"doc_id": "c", "product_name": "C", "properties": {"Densidade": "0,95 g/cm³", "Tração": "1.150,5 MPa"}},
+    ]
+    return PropertyIndex.build(rows)
+
+
+@pytest.mark.parametrize("question, expected", [
+    ("tração acima de 1.250", [{"column": "tracao", "min": 1250.0}]),
+    ("tração acima de 1.150,5", [{"column": "tracao", "min": 1150.5}]),
+    ("densidade acima de 1,15", [{"column": "densidade", "min": 1.15}]),
+    ("densidade acima de 1.15", [{"column": "densidade", "min": 1.15}]),
+    ("densidade entre 1,1 e 1.3", [{"column": "densidade", "min": 1.1, "max": 1.3}]),
+])
+def test_parse_filters(question, expected):
+    assert _index().parse_filters(question) == expected
+
+
+def test_query_with_thousands_separator():
+    index = _index()
+    assert index.query(index.parse_filters("tração acima de 1.000")) == ["b", "c"]
+    assert index.query(index.parse_filters("densidade acima de 1,2")) == ["b"]
@@ -0,0 +1,79 @@
+import asyncio
+from collections import Counter
+
+import aiohttp
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+import scrape
+
+
+def _site(hits: Counter, pages: int) -> web.Application:
+    """Site local em que cada página aponta para a raiz, para as vizinhas e para uma página quebrada."""
+
+    async def page(request):
+        path = request.path
+        hits[path] += 1
+        number = int(request.match_info.get("n", 0))
+        links = ['<a href="/">Início</a>', '<a href="/broken">Quebrada</a>', '<a href="/missing">Sumiu</a>']
+        links += [f'<a href="/p/{i}#secao">Página {i}</a>' for i in (number + 1, number + 2) if i < pages]
+        return web.Response(text=f"<html><body><p>Conteúdo {path}</p>{''.join(links)}</body></html>",
+                            content_type="text/html")
+
+    async def broken(request):
+        hits[request.path] += 1
+        return web.Response(text="<html><body><p>Quebrada</p></body></html>", content_type="text/html")
+
+    async def missing(request):
+        hits[request.path] += 1
+        raise web.HTTPNotFound()
+
+    app = web.Application()
+    app.router.add_get("/", page)
+    app.router.add_get("/p/{n}", page)
+    app.router.add_get("/broken", broken)
+    app.router.add_get("/missing", missing)
+    return app
+
+
+def _crawl(monkeypatch, pages: int, max_pages: int):
+    hits = Counter()
+    parse_page = scrape.parse_page
+
+    def failing_parse(html, url, domain):
+        if url.endswith("/broken"):
+            raise UnicodeDecodeError("utf-8", b"\xff", 0, 1, "byte inválido")
+        return parse_page(html, url, domain)
+
+    monkeypatch.setattr(scrape, "parse_page", failing_parse)
+
+    async def run():
+        async with TestServer(_site(hits, pages)) as server:
+            async with aiohttp.ClientSession() as session:
+                root = str(server.make_url("/"))
+                documents = await asyncio.wait_for(
+                    scrape.crawl_website(root, max_pages=max_pages, concurrency=3, min_interval=0,
+                                         session=session, use_sitemap=False),
+                    timeout=30,
+                )
+        return documents, hits
+
+    return asyncio.run(run())
+
+
+def test_crawl_fetches_each_page_once_and_survives_broken_pages(monkeypatch):
+    documents, hits = _crawl(monkeypatch, pages=8, max_pages=100)
+
+    assert all(count == 1 for count in hits.values()), hits
+    assert hits["/broken"] == 1 and hits["/missing"] == 1
+    sources = [doc.metadata["source"] for doc in documents]
+    assert len(sources) == len(set(sources)) == 8  # raiz + /p/1 a /p/7; a quebrada e a 404 ficam de fora
+    assert not any(source.endswith(("/broken", "/missing")) for source in sources)
+    assert all("#" not in source for source in sources)
+
+
+def test_crawl_respects_max_pages(monkeypatch):
+    documents, hits = _crawl(monkeypatch, pages=50, max_pages=5)
+
+    assert sum(hits.values()) <= 5
+    assert 0 < len(documents) <= 5
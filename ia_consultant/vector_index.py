@@ -0,0 +1,343 @@
+import os
+import json
+import time
+import hashlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import faiss
+
+from langchain_community.vectorstores import FAISS
+
+from data_loader import PARSER_VERSION, iter_load_files, list_source_files
+from property_index import PROPERTY_ROWS_FILE, update_property_rows
+from bm25_index import BM25_FILE, build_bm25_from_vector_store
+from product_names import build_product_name_index
+from compact_store import FAISS_INDEX_FILE, index_exists, load_vector_store, save_vector_store
+from ann_index import INDEX_TYPE, check_index_type, write_serving_index
+from metrics import (
+    INGEST_EMBEDDING_BATCH_DOCUMENTS, INGEST_EMBEDDING_BATCH_SECONDS, INGEST_FILES, INGEST_STAGE_SECONDS, span,
+)
+
+# Manifesto salvo ao lado do índice FAISS. Para cada arquivo de origem, guarda o hash
+# do conteúdo e os IDs dos documentos que ele gerou no docstore, permitindo que apenas
+# as fichas alteradas sejam re-processadas e re-embedadas.
+MANIFEST_FILE = "manifest.json"
+MANIFEST_VERSION = 1
+# Pipeline de construção: fichas por chamada de embeddings, lotes em paralelo e intervalo
+# entre os salvamentos do progresso (0 salva apenas ao final ou em caso de erro).
+# Cada salvamento regrava o índice FAISS e o docstore inteiros, então custa proporcionalmente
+# ao tamanho do catálogo: o intervalo cresce para que os salvamentos não passem de
+# INGEST_CHECKPOINT_MAX_SHARE do tempo da construção. Intervalos maiores salvam menos vezes,
+# mas uma construção interrompida perde mais trabalho (os embeddings refeitos saem do cache).
+INGEST_EMBEDDING_BATCH_SIZE = int(os.getenv("INGEST_EMBEDDING_BATCH_SIZE", "64"))
+INGEST_EMBEDDING_CONCURRENCY = int(os.getenv("INGEST_EMBEDDING_CONCURRENCY", "4"))
+INGEST_CHECKPOINT_SECONDS = float(os.getenv("INGEST_CHECKPOINT_SECONDS", "300"))
+INGEST_CHECKPOINT_MAX_SHARE = float(os.getenv("INGEST_CHECKPOINT_MAX_SHARE", "0.1"))
+
+
+def file_hash(file_path: str) -> str:
+    """Calcula o hash SHA-256 do conteúdo de um arquivo, lendo em blocos."""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _relative_key(file_path: str, data_path: str) -> str:
+    """Chave estável do arquivo no manifesto, relativa à pasta de dados."""
+    return os.path.relpath(file_path, data_path).replace(os.sep, '/')
+
+
+def load_manifest(index_path: str) -> dict:
+    """Lê o manifesto do índice. Retorna um manifesto vazio se ele não existir ou for inválido."""
+    manifest_path = os.path.join(index_path, MANIFEST_FILE)
+    if os.path.exists(manifest_path):
+        try:
+            with open(manifest_path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+            if manifest.get("version") == MANIFEST_VERSION:
+                return manifest
+        except (OSError, ValueError) as e:
+            print(f"Manifesto inválido em '{manifest_path}', ignorando: {e}")
+    return {"version": MANIFEST_VERSION, "files": {}}
+
+
+def save_manifest(index_path: str, manifest: dict):
+    """Grava o manifesto de forma atômica (arquivo temporário + rename)."""
+    os.makedirs(index_path, exist_ok=True)
+    manifest_path = os.path.join(index_path, MANIFEST_FILE)
+    tmp_path = manifest_path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, manifest_path)
+
+
+def diff_manifest(manifest: dict, current_hashes: dict) -> tuple[list[str], list[str]]:
+    """
+    Compara o manifesto salvo com os hashes atuais.
+    Retorna (arquivos novos ou alterados, arquivos removidos), ambos como chaves relativas.
+    """
+    known = manifest["files"]
+    changed = [key for key, digest in current_hashes.items() if known.get(key, {}).get("hash") != digest]
+    removed = [key for key in known if key not in current_hashes]
+    return changed, removed
+
+
+def _embed_batch(embeddings, texts: list[str]) -> tuple[list[list[float]], float]:
+    start = time.perf_counter()
+    vectors = embeddings.embed_documents(texts)
+    return vectors, time.perf_counter() - start
+
+
+def _drop_orphans(vector_store: FAISS, manifest: dict):
+    """
+    Remove do índice os documentos que não constam do manifesto. Acontece quando uma
+    construção é interrompida entre a gravação do índice e a do manifesto.
+    """
+    known = {doc_id for entry in manifest["files"].values() for doc_id in entry.get("ids", [])}
+    orphans = [doc_id for doc_id in vector_store.index_to_docstore_id.values() if doc_id not in known]
+    if orphans:
+        print(f"Removendo {len(orphans)} documentos de uma construção interrompida.")
+        vector_store.delete(orphans)
+
+
+def sync_vector_store(index_path: str, data_path: str, embeddings, full: bool = False,
+                      index_type: str = INDEX_TYPE) -> dict:
+    """
+    Sincroniza o índice FAISS com a pasta de dados.
+    Apenas os arquivos novos ou alterados são re-processados e re-embedados; os removidos
+    têm seus documentos apagados do índice. Com `full=True`, o índice é reconstruído do zero.
+    O índice só é carregado (por completo, para escrita) quando há mudanças. O progresso é salvo
+    periodicamente e em caso de erro; chamar de novo com o mesmo `index_path` retoma de onde parou.
+    O índice de busca do tipo `index_type` (veja ann_index.py) é gerado a cada mudança.
+    Retorna um resumo das mudanças.
+    """
+    index_type = check_index_type(index_type)
+    manifest = load_manifest(index_path)
+    has_index = not full and index_exists(index_path)
+
+    if has_index and not manifest["files"]:
+        # Índice criado antes da existência do manifesto: não há como saber de qual
+        # arquivo veio cada documento com segurança, então ele é reconstruído uma única vez.
+        print("Índice sem manifesto encontrado. Ele será reconstruído uma única vez.")
+        has_index = False
+
+    if not has_index:
+        manifest = {"version": MANIFEST_VERSION, "parser_version": PARSER_VERSION, "files": {}}
+        rows_path = os.path.join(index_path, PROPERTY_ROWS_FILE)
+        if os.path.exists(rows_path):
+            os.remove(rows_path)
+    elif (not os.path.exists(os.path.join(index_path, PROPERTY_ROWS_FILE))
+          or manifest.get("parser_version", 1) != PARSER_VERSION):
+        # Índice anterior ao índice de propriedades, ou fichas traduzidas por outra versão do
+        # leitor: todas são re-processadas (os embeddings inalterados saem do cache de embeddings).
+        print("Todas as fichas serão re-processadas uma única vez (leitor atualizado ou índice de propriedades ausente).")
+        for entry in manifest["files"].values():
+            entry["hash"] = None
+        manifest["parser_version"] = PARSER_VERSION
+
+    current_hashes = {
+        _relative_key(file_path, data_path): file_hash(file_path)
+        for file_path in list_source_files(data_path)
+    }
+    changed, removed = diff_manifest(manifest, current_hashes)
+    summary = {"added": 0, "updated": 0, "removed": len(removed), "unchanged": len(current_hashes) - len(changed), "errors": []}
+
+    if not changed and not removed:
+        print(f"Base de conhecimento atualizada ({len(current_hashes)} arquivos sem alterações).")
+        if has_index and not os.path.exists(os.path.join(index_path, BM25_FILE)):
+            build_bm25_from_vector_store(load_vector_store(index_path, embeddings), index_path)
+        if has_index and manifest.get("index_type", "flat") != index_type:
+            # Só o tipo do índice de busca mudou: ele é refeito a partir dos vetores já salvos
+            print(f"Gerando o índice de busca '{index_type}' (antes: '{manifest.get('index_type', 'flat')}')...")
+            with span("serving_index", INGEST_STAGE_SECONDS):
+                write_serving_index(faiss.read_index(os.path.join(index_path, FAISS_INDEX_FILE)), index_path, index_type)
+            manifest["index_type"] = index_type
+            save_manifest(index_path, manifest)
+            summary["index_type_changed"] = True
+        return summary
+
+    vector_store = load_vector_store(index_path, embeddings, writable=True) if has_index else None
+    if vector_store is not None:
+        _drop_orphans(vector_store, manifest)
+
+    # Apaga do índice os documentos dos arquivos removidos ou alterados
+    stale_ids = []
+    for key in removed + changed:
+        stale_ids.extend(manifest["files"].get(key, {}).get("ids", []))
+        if key in manifest["files"]:
+            # Mantido no manifesto, sem documentos e sem hash, para ser re-processado (e contado
+            # como alterado) se a construção for retomada
+            manifest["files"][key].update(hash=None, ids=[])
+    if vector_store is not None:
+        # Ao retomar uma construção, parte deles já pode ter sido apagada
+        existing = set(vector_store.index_to_docstore_id.values())
+        stale_ids = [doc_id for doc_id in stale_ids if doc_id in existing]
+        if stale_ids:
+            vector_store.delete(stale_ids)
+    for key in removed:
+        manifest["files"].pop(key, None)
+
+    # Pipeline: tradução sob demanda -> lotes de embeddings em paralelo -> inclusão no índice,
+    # na ordem dos arquivos. Um arquivo só entra no manifesto quando todas as suas fichas
+    # estão no índice, e o progresso é salvo a cada INGEST_CHECKPOINT_SECONDS.
+    build_start = time.perf_counter()
+    timings = {"parse": 0.0, "embedding": 0.0, "batches": 0}
+    failed = set()
+    property_rows, waiting_rows, waiting_ids, remaining = {}, {}, {}, {}
+    removed_rows = removed + list(changed)
+    last_checkpoint = time.perf_counter()
+    checkpoint_interval = INGEST_CHECKPOINT_SECONDS
+
+    def complete(key):
+        if key in manifest["files"]:
+            summary["updated"] += 1
+        else:
+            summary["added"] += 1
+        property_rows[key] = waiting_rows.pop(key)
+        manifest["files"][key] = {"hash": current_hashes[key], "ids": waiting_ids.pop(key)}
+
+    def parsed_files():
+        files = iter_load_files([os.path.join(data_path, key) for key in changed])
+        while True:
+            parse_start = time.perf_counter()
+            item = next(files, None)
+            timings["parse"] += time.perf_counter() - parse_start
+            if item is None:
+                return
+            yield item
+
+    def batches():
+        batch = []
+        for file_path, documents, error in parsed_files():
+            key = _relative_key(file_path, data_path)
+            if error:
+                # Fora do manifesto, o arquivo com erro é tentado de novo na próxima sincronização.
+                print(f"Erro ao processar o arquivo {os.path.basename(file_path)}: {error}")
+                summary["errors"].append((file_path, error))
+                failed.add(key)
+                manifest["files"].pop(key, None)
+                INGEST_FILES.inc(result="error")
+                continue
+            INGEST_FILES.inc(result="ok")
+
+            ids = [f"{key}#{i}" for i in range(len(documents))]
+            # As propriedades vão para a tabela colunar, não para o docstore do FAISS
+            waiting_rows[key] = [
+                {"doc_id": doc_id, "product_name": doc.metadata["product_name"], "properties": doc.metadata.pop("properties", {})}
+                for doc_id, doc in zip(ids, documents)
+            ]
+            waiting_ids[key] = ids
+            if not documents:
+                complete(key)
+                continue
+            remaining[key] = len(documents)
+            for doc_id, doc in zip(ids, documents):
+                batch.append((key, doc_id, doc))
+                if len(batch) >= INGEST_EMBEDDING_BATCH_SIZE:
+                    yield batch
+                    batch = []
+        if batch:
+            yield batch
+
+    def add_to_index(batch, vectors):
+        nonlocal vector_store
+        texts = [doc.page_content for _, _, doc in batch]
+        metadatas = [doc.metadata for _, _, doc in batch]
+        ids = [doc_id for _, doc_id, _ in batch]
+        if vector_store is None:
+            vector_store = FAISS.from_embeddings(list(zip(texts, vectors)), embeddings, metadatas=metadatas, ids=ids)
+        else:
+            vector_store.add_embeddings(list(zip(texts, vectors)), metadatas=metadatas, ids=ids)
+        for key, _, _ in batch:
+            remaining[key] -= 1
+            if not remaining[key]:
+                del remaining[key]
+                complete(key)
+
+    def checkpoint():
+        nonlocal last_checkpoint, checkpoint_interval
+        start = time.perf_counter()
+        with span("checkpoint", INGEST_STAGE_SECONDS):
+            if vector_store is not None:
+                save_vector_store(vector_store, index_path)
+            # Só as linhas; a tabela colunar de propriedades é montada uma vez, ao final
+            update_property_rows(index_path, property_rows, removed_rows + sorted(failed), rebuild=False)
+            property_rows.clear()
+            removed_rows.clear()
+            # O manifesto é gravado por último: documentos no índice que ainda não estão
+            # no manifesto são descartados ao retomar (veja _drop_orphans)
+            save_manifest(index_path, manifest)
+        last_checkpoint = time.perf_counter()
+        if INGEST_CHECKPOINT_MAX_SHARE > 0:
+            checkpoint_interval = max(checkpoint_interval, (last_checkpoint - start) / INGEST_CHECKPOINT_MAX_SHARE)
+
+    in_flight = deque()
+    with ThreadPoolExecutor(max_workers=INGEST_EMBEDDING_CONCURRENCY) as executor:
+        def add_oldest():
+            batch, future = in_flight.popleft()
+            vectors, batch_seconds = future.result()
+            INGEST_EMBEDDING_BATCH_SECONDS.observe(batch_seconds)
+            INGEST_EMBEDDING_BATCH_DOCUMENTS.observe(len(batch))
+            timings["embedding"] += batch_seconds
+            timings["batches"] += 1
+            add_to_index(batch, vectors)
+
+        try:
+            for batch in batches():
+                texts = [doc.page_content for _, _, doc in batch]
+                in_flight.append((batch, executor.submit(_embed_batch, embeddings, texts)))
+                if len(in_flight) >= INGEST_EMBEDDING_CONCURRENCY:
+                    add_oldest()
+                if INGEST_CHECKPOINT_SECONDS > 0 and time.perf_counter() - last_checkpoint >= checkpoint_interval:
+                    checkpoint()
+            while in_flight:
+                add_oldest()
+        except BaseException:
+            for _, future in in_flight:
+                future.cancel()
+            if summary["added"] or summary["updated"]:
+                print("Construção interrompida; salvando o progresso para retomá-la depois...")
+                checkpoint()
+            raise
+
+    build_seconds = time.perf_counter() - build_start
+    parse_seconds = timings["parse"]
+    embedding_seconds, embedding_batches = timings["embedding"], timings["batches"]
+
+    print(
+        f"Sincronização concluída: {summary['added']} novos, {summary['updated']} alterados, "
+        f"{summary['removed']} removidos, {summary['unchanged']} sem alterações."
+    )
+    INGEST_STAGE_SECONDS.observe(parse_seconds, stage="parse")
+    INGEST_STAGE_SECONDS.observe(embedding_seconds, stage="embedding")
+    summary["timings"] = {
+        "build_seconds": round(build_seconds, 3),
+        # Tempo em que o pipeline esperou pela tradução (o restante dela ocorre em paralelo aos embeddings)
+        "parse_seconds": round(parse_seconds, 3),
+        "files_per_second": round(len(changed) / build_seconds, 1) if build_seconds else None,
+        "embedding_seconds": round(embedding_seconds, 3),
+        "embedding_batches": embedding_batches,
+    }
+    print(
+        f"Pipeline: {len(changed)} arquivos em {build_seconds:.2f}s (espera pela tradução: {parse_seconds:.2f}s); "
+        f"embeddings: {embedding_batches} lotes, {embedding_seconds:.2f}s somados."
+    )
+
+    if vector_store is not None:
+        print(f"Salvando base de conhecimento em '{index_path}'...")
+        with span("save", INGEST_STAGE_SECONDS):
+            save_vector_store(vector_store, index_path)
+            # O índice lexical é refeito a partir do docstore, sem novas chamadas de embedding
+            build_bm25_from_vector_store(vector_store, index_path)
+        with span("serving_index", INGEST_STAGE_SECONDS):
+            write_serving_index(vector_store.index, index_path, index_type)
+    # O tipo pedido fica no manifesto, mesmo quando há vetores de menos para ele e o exato é usado
+    manifest["index_type"] = index_type
+    property_index = update_property_rows(index_path, property_rows, removed_rows + sorted(failed))
+    # O índice de nomes de produtos sai das mesmas linhas, sem re-processar as fichas
+    build_product_name_index(property_index, index_path)
+    save_manifest(index_path, manifest)
+    return summary